@@ -0,0 +1,397 @@
+"""
+ace_backends.py
+
+LLM backends for AcePipeline.
+
+A backend turns (model, system prompt, user prompt, temperature) into an
+LLMResponse. AcePipeline owns everything around the call (response cache,
+rate limiting, retries), so backends only talk to the model:
+
+    GeminiBackend  google.generativeai, through the shared ace_models pool
+    StubBackend    offline and deterministic: replays responses recorded in
+                   existing *_history files, or synthesizes JSON that follows
+                   the prompt's "JSON FORMAT:" example, with configurable
+                   latency. Used to measure the pipeline's own overhead and
+                   to run it without network.
+
+`generate_stream` yields the response as a sequence of LLMResponse chunks
+(usage, when known, on the last one); backends without streaming yield the
+whole response as a single chunk.
+
+Backends with `supports_context_cache` can upload a system prompt plus a
+stable user prompt prefix once (`create_context_cache`) and then answer
+calls that send only the rest (`generate_cached`); see ace_context_cache.
+"""
+
+import asyncio
+import datetime
+import functools
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+
+class LLMResponse:
+
+    def __init__(self, text: str, prompt_tokens: Optional[int] = None,
+                 output_tokens: Optional[int] = None, total_tokens: Optional[int] = None,
+                 cached_tokens: Optional[int] = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.total_tokens = total_tokens
+        # Part of the prompt served from a cached context
+        self.cached_tokens = cached_tokens
+
+
+class LLMBackend:
+    """Interface every backend implements."""
+
+    name = "base"
+    # Whether calls should go through the per-model rate limiter
+    rate_limited = True
+    # Whether calls cost money (priced with ace_metrics.PRICING)
+    billed = True
+    # Whether the context cache methods below are implemented
+    supports_context_cache = False
+
+    def generate(self, model_name: str, system_prompt: str, user_prompt: str,
+                 temperature: float) -> LLMResponse:
+        raise NotImplementedError
+
+    async def agenerate(self, model_name: str, system_prompt: str, user_prompt: str,
+                        temperature: float) -> LLMResponse:
+        # Backends without a native async call run the sync one off-loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.generate, model_name, system_prompt, user_prompt, temperature)
+        )
+
+    def generate_stream(self, model_name: str, system_prompt: str, user_prompt: str,
+                        temperature: float) -> Iterator[LLMResponse]:
+        yield self.generate(model_name, system_prompt, user_prompt, temperature)
+
+    async def agenerate_stream(self, model_name: str, system_prompt: str, user_prompt: str,
+                               temperature: float) -> AsyncIterator[LLMResponse]:
+        yield await self.agenerate(model_name, system_prompt, user_prompt, temperature)
+
+    def create_context_cache(self, model_name: str, system_prompt: str, prefix: str, ttl: float):
+        """Uploads system prompt + user prompt prefix; returns a handle for generate_cached."""
+        raise NotImplementedError
+
+    def update_context_cache_ttl(self, handle, ttl: float):
+        raise NotImplementedError
+
+    def delete_context_cache(self, handle):
+        pass
+
+    def generate_cached(self, model_name: str, handle, user_suffix: str, temperature: float) -> LLMResponse:
+        raise NotImplementedError
+
+    async def agenerate_cached(self, model_name: str, handle, user_suffix: str,
+                               temperature: float) -> LLMResponse:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.generate_cached, model_name, handle, user_suffix, temperature)
+        )
+
+    def print_stats(self):
+        pass
+
+
+class GeminiBackend(LLMBackend):
+
+    name = "gemini"
+    supports_context_cache = True
+
+    def __init__(self, api_key: Optional[str], model_pool=None):
+        # Imported here so the stub backend works without the SDK installed
+        import google.generativeai as genai
+        import ace_models
+
+        self._genai = genai
+        try:
+            ace_models.configure(api_key)
+        except Exception as e:
+            print(f"Error configuring Google AI: {e}")
+            raise
+        self.model_pool = model_pool or ace_models.DEFAULT_POOL
+
+    def _config(self, temperature: float):
+        # A fresh config per call: a shared one must not be mutated while
+        # other workers or coroutines are using it.
+        return self._genai.GenerationConfig(
+            response_mime_type="application/json",
+            temperature=temperature,
+        )
+
+    @staticmethod
+    def _to_response(response, text: Optional[str] = None) -> LLMResponse:
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            response.text if text is None else text,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+            total_tokens=getattr(usage, "total_token_count", None),
+            cached_tokens=getattr(usage, "cached_content_token_count", None),
+        )
+
+    def generate(self, model_name, system_prompt, user_prompt, temperature):
+        model = self.model_pool.get(model_name, system_prompt)
+        response = model.generate_content(user_prompt, generation_config=self._config(temperature))
+        return self._to_response(response)
+
+    async def agenerate(self, model_name, system_prompt, user_prompt, temperature):
+        model = self.model_pool.get(model_name, system_prompt)
+        response = await model.generate_content_async(user_prompt, generation_config=self._config(temperature))
+        return self._to_response(response)
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        # The closing chunk of a stream may carry usage but no text parts
+        try:
+            return chunk.text
+        except ValueError:
+            return ""
+
+    def generate_stream(self, model_name, system_prompt, user_prompt, temperature):
+        model = self.model_pool.get(model_name, system_prompt)
+        for chunk in model.generate_content(user_prompt, generation_config=self._config(temperature), stream=True):
+            yield self._to_response(chunk, self._chunk_text(chunk))
+
+    async def agenerate_stream(self, model_name, system_prompt, user_prompt, temperature):
+        model = self.model_pool.get(model_name, system_prompt)
+        response = await model.generate_content_async(
+            user_prompt, generation_config=self._config(temperature), stream=True
+        )
+        async for chunk in response:
+            yield self._to_response(chunk, self._chunk_text(chunk))
+
+    def create_context_cache(self, model_name, system_prompt, prefix, ttl):
+        return self._genai.caching.CachedContent.create(
+            model=f"models/{model_name}",
+            system_instruction=system_prompt,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+
+    def update_context_cache_ttl(self, handle, ttl):
+        handle.update(ttl=datetime.timedelta(seconds=ttl))
+
+    def delete_context_cache(self, handle):
+        self.model_pool.discard_cached(handle)
+        handle.delete()
+
+    def generate_cached(self, model_name, handle, user_suffix, temperature):
+        model = self.model_pool.get_cached(handle)
+        response = model.generate_content(user_suffix, generation_config=self._config(temperature))
+        return self._to_response(response)
+
+    async def agenerate_cached(self, model_name, handle, user_suffix, temperature):
+        model = self.model_pool.get_cached(handle)
+        response = await model.generate_content_async(user_suffix, generation_config=self._config(temperature))
+        return self._to_response(response)
+
+    def print_stats(self):
+        self.model_pool.print_stats()
+
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic offline backend. Responses come from, in order:
+
+    1. a recorded response for the exact (system prompt, user prompt) pair,
+    2. one of the recorded responses for the same system prompt, picked by
+       a hash of the user prompt (so the choice does not depend on call
+       order under concurrency),
+    3. JSON synthesized from the prompt's "JSON FORMAT:" example.
+
+    `latency` seconds (plus up to `jitter` seconds, seeded by the prompt)
+    are slept per call to emulate the network. Streamed calls deliver the
+    response in `chunk_size`-character chunks spread over that latency.
+
+    Context caches are kept in memory with their TTL; a cached call
+    answers exactly as the uncached call with the full prompt would.
+    """
+
+    name = "stub"
+    rate_limited = False
+    billed = False
+    supports_context_cache = True
+
+    def __init__(self, replay_files: Optional[List[str]] = None, latency: float = 0.0, jitter: float = 0.0,
+                 chunk_size: int = 64):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = max(1, chunk_size)
+        self._exact: Dict[str, str] = {}
+        self._by_system: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        # handle -> (system prompt, prefix, expiry time)
+        self._context_caches: Dict[str, Tuple[str, str, float]] = {}
+        self.calls = 0
+        self.replayed = 0
+        self.synthesized = 0
+        self.cached_calls = 0
+        for path in replay_files or []:
+            self.load_replay(path)
+
+    @staticmethod
+    def _digest(*parts: str) -> str:
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def load_replay(self, path: str):
+        # Imported here: ace_history is only needed when replaying
+        from ace_history import load_history_records
+
+        count = 0
+        for run in load_history_records(path):
+            for key, value in run.items():
+                if not key.endswith("_system_prompt"):
+                    continue
+                stage_name = key[:-len("_system_prompt")]
+                text = run.get(f"{stage_name}_json")
+                if text is None and f"{stage_name}_data" in run:
+                    text = json.dumps(run[f"{stage_name}_data"], ensure_ascii=False)
+                if text is None:
+                    continue
+                self._by_system.setdefault(self._digest(value), []).append(text)
+                count += 1
+        print(f"[STUB] Loaded {count} recorded responses from {path}")
+
+    def record(self, system_prompt: str, user_prompt: str, text: str):
+        """Registers an exact response for a prompt pair."""
+        self._exact[self._digest(system_prompt, user_prompt)] = text
+
+    def _delay(self, seed: int) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency + random.Random(seed).uniform(0, self.jitter)
+
+    def _respond(self, system_prompt: str, user_prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            text = self._exact.get(self._digest(system_prompt, user_prompt))
+            if text is None:
+                recorded = self._by_system.get(self._digest(system_prompt))
+                if recorded:
+                    text = recorded[int(self._digest(user_prompt)[:8], 16) % len(recorded)]
+            if text is not None:
+                self.replayed += 1
+                return text
+            self.synthesized += 1
+        return json.dumps(synthesize_json(user_prompt), ensure_ascii=False)
+
+    def generate(self, model_name, system_prompt, user_prompt, temperature):
+        seed = int(self._digest(system_prompt, user_prompt)[:8], 16)
+        time.sleep(self._delay(seed))
+        text = self._respond(system_prompt, user_prompt)
+        return LLMResponse(text, total_tokens=(len(system_prompt) + len(user_prompt) + len(text)) // 4)
+
+    async def agenerate(self, model_name, system_prompt, user_prompt, temperature):
+        seed = int(self._digest(system_prompt, user_prompt)[:8], 16)
+        await asyncio.sleep(self._delay(seed))
+        text = self._respond(system_prompt, user_prompt)
+        return LLMResponse(text, total_tokens=(len(system_prompt) + len(user_prompt) + len(text)) // 4)
+
+    def _chunks(self, system_prompt: str, user_prompt: str):
+        text = self._respond(system_prompt, user_prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        total_tokens = (len(system_prompt) + len(user_prompt) + len(text)) // 4
+        for i, chunk in enumerate(chunks):
+            yield LLMResponse(chunk, total_tokens=total_tokens if i == len(chunks) - 1 else None), len(chunks)
+
+    def generate_stream(self, model_name, system_prompt, user_prompt, temperature):
+        delay = self._delay(int(self._digest(system_prompt, user_prompt)[:8], 16))
+        for chunk, count in self._chunks(system_prompt, user_prompt):
+            time.sleep(delay / count)
+            yield chunk
+
+    async def agenerate_stream(self, model_name, system_prompt, user_prompt, temperature):
+        delay = self._delay(int(self._digest(system_prompt, user_prompt)[:8], 16))
+        for chunk, count in self._chunks(system_prompt, user_prompt):
+            await asyncio.sleep(delay / count)
+            yield chunk
+
+    def create_context_cache(self, model_name, system_prompt, prefix, ttl):
+        handle = f"cachedContents/stub-{self._digest(model_name, system_prompt, prefix)[:16]}"
+        with self._lock:
+            self._context_caches[handle] = (system_prompt, prefix, time.time() + ttl)
+        return handle
+
+    def _context_cache(self, handle) -> Tuple[str, str]:
+        with self._lock:
+            entry = self._context_caches.get(handle)
+            if entry is None or entry[2] <= time.time():
+                self._context_caches.pop(handle, None)
+                raise LookupError(f"{handle} not found (expired or deleted)")
+            self.cached_calls += 1
+            return entry[0], entry[1]
+
+    def update_context_cache_ttl(self, handle, ttl):
+        with self._lock:
+            if handle not in self._context_caches:
+                raise LookupError(f"{handle} not found (expired or deleted)")
+            system_prompt, prefix, _ = self._context_caches[handle]
+            self._context_caches[handle] = (system_prompt, prefix, time.time() + ttl)
+
+    def delete_context_cache(self, handle):
+        with self._lock:
+            self._context_caches.pop(handle, None)
+
+    def generate_cached(self, model_name, handle, user_suffix, temperature):
+        system_prompt, prefix = self._context_cache(handle)
+        response = self.generate(model_name, system_prompt, prefix + user_suffix, temperature)
+        response.cached_tokens = (len(system_prompt) + len(prefix)) // 4
+        return response
+
+    async def agenerate_cached(self, model_name, handle, user_suffix, temperature):
+        system_prompt, prefix = self._context_cache(handle)
+        response = await self.agenerate(model_name, system_prompt, prefix + user_suffix, temperature)
+        response.cached_tokens = (len(system_prompt) + len(prefix)) // 4
+        return response
+
+    def print_stats(self):
+        print(f"[STUB] {self.calls} calls: {self.replayed} replayed, {self.synthesized} synthesized, "
+              f"{self.cached_calls} through a context cache")
+
+
+def _example_json(user_prompt: str):
+    marker = user_prompt.rfind("JSON FORMAT:")
+    if marker < 0:
+        return None
+    example = user_prompt[marker + len("JSON FORMAT:"):].strip()
+    try:
+        return json.loads(example)
+    except json.JSONDecodeError:
+        pass
+    # Examples with unescaped quotes: keep the keys and whether they hold lists
+    keys = re.findall(r'"([\w ]+)"\s*:\s*(\[|\{|")', example)
+    if not keys:
+        return None
+    return {key: ([""] if opener == "[" else {} if opener == "{" else "") for key, opener in keys}
+
+
+def synthesize_json(user_prompt: str):
+    """
+    Builds a response shaped like the prompt's "JSON FORMAT:" example, with
+    every string replaced by text derived from the prompt hash so that
+    different prompts get different (but reproducible) answers.
+    """
+    digest = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()
+    example = _example_json(user_prompt)
+    if example is None:
+        return {"response": f"synthetic-{digest[:12]}"}
+
+    def fill(value, path):
+        if isinstance(value, dict):
+            return {key: fill(item, f"{path}.{key}") for key, item in value.items()}
+        if isinstance(value, list):
+            return [fill(item, f"{path}[{i}]") for i, item in enumerate(value)] or [fill("", f"{path}[0]")]
+        if isinstance(value, str):
+            return f"synthetic {path.lstrip('.')} {digest[:8]}"
+        return value
+
+    return fill(example, "")
@@ -0,0 +1,262 @@
+"""
+ace_batch.py
+
+Provider batch jobs for AcePipeline (`process_jobs_batch`, --batch).
+
+Instead of one interactive call per stage per job, the stage engines of a
+whole generation of jobs run in lockstep: the calls of the current stage
+wave of every job are written to one JSONL request file, submitted as a
+batch job, polled until done, and the results are fed back into each job's
+run_context before the next wave is submitted. Batch jobs take minutes to
+hours but are billed at a discount (ace_metrics.BATCH_RATE) and do not
+count against the interactive rate limits, which suits offline curricula
+of 1000+ jobs.
+
+Request and result files use the Gemini batch JSONL format, one line per
+call:
+
+    {"key": "...", "request": {"system_instruction": ..., "contents": [...],
+                               "generation_config": {...}}}
+    {"key": "...", "response": {"candidates": [...], "usageMetadata": {...}}}
+    {"key": "...", "error": {"message": "..."}}
+
+    GeminiBatchClient   the Gemini Batch API through the google-genai SDK
+                        (`pip install google-genai`, imported lazily)
+    LocalBatchServer    file-based stand-in that answers a batch with any
+                        LLMBackend (e.g. StubBackend), for tests and CI
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Optional
+
+from ace_backends import LLMBackend, LLMResponse
+
+PENDING = "JOB_STATE_PENDING"
+RUNNING = "JOB_STATE_RUNNING"
+SUCCEEDED = "JOB_STATE_SUCCEEDED"
+FAILED = "JOB_STATE_FAILED"
+CANCELLED = "JOB_STATE_CANCELLED"
+EXPIRED = "JOB_STATE_EXPIRED"
+DONE_STATES = (SUCCEEDED, FAILED, CANCELLED, EXPIRED)
+
+
+def request_line(key: str, system_prompt: str, user_prompt: str, temperature: float) -> Dict:
+    return {
+        "key": key,
+        "request": {
+            "system_instruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"role": "user", "parts": [{"text": user_prompt}]}],
+            "generation_config": {"temperature": temperature, "response_mime_type": "application/json"},
+        },
+    }
+
+
+def write_requests(path: str, calls: Dict[str, Dict]):
+    """Writes {key: {"system_prompt", "user_prompt", "temperature"}} as a JSONL request file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for key, call in calls.items():
+            line = request_line(key, call["system_prompt"], call["user_prompt"], call["temperature"])
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def parse_result(line: Dict) -> LLMResponse:
+    """Turns one result line into an LLMResponse; raises RuntimeError for an error line."""
+    if line.get("error"):
+        error = line["error"]
+        raise RuntimeError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+    response = line.get("response") or {}
+    candidates = response.get("candidates") or []
+    if not candidates:
+        raise RuntimeError("no candidates in batch response")
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    text = "".join(part.get("text", "") for part in parts)
+    usage = response.get("usageMetadata") or response.get("usage_metadata") or {}
+
+    def count(camel, snake):
+        return usage.get(camel, usage.get(snake))
+
+    return LLMResponse(
+        text,
+        prompt_tokens=count("promptTokenCount", "prompt_token_count"),
+        output_tokens=count("candidatesTokenCount", "candidates_token_count"),
+        total_tokens=count("totalTokenCount", "total_token_count"),
+        cached_tokens=count("cachedContentTokenCount", "cached_content_token_count"),
+    )
+
+
+def read_results(lines) -> Dict[str, object]:
+    """Maps each key of a JSONL result file to its LLMResponse, or to the Exception it failed with."""
+    results = {}
+    for raw in lines:
+        raw = raw.strip()
+        if not raw:
+            continue
+        line = json.loads(raw)
+        try:
+            results[line["key"]] = parse_result(line)
+        except RuntimeError as e:
+            results[line["key"]] = e
+    return results
+
+
+class BatchClient:
+    """Interface every batch client implements."""
+
+    name = "base"
+
+    def submit(self, model_name: str, request_path: str) -> str:
+        """Submits a JSONL request file; returns the batch job id."""
+        raise NotImplementedError
+
+    def state(self, job_id: str) -> str:
+        """One of the JOB_STATE_* constants."""
+        raise NotImplementedError
+
+    def results(self, job_id: str) -> Dict[str, object]:
+        """Results of a finished job, as read_results returns them."""
+        raise NotImplementedError
+
+    def cancel(self, job_id: str):
+        pass
+
+
+class GeminiBatchClient(BatchClient):
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str]):
+        # Imported here: the batch API lives in the newer google-genai SDK
+        try:
+            from google import genai
+        except ImportError as e:
+            raise ImportError("--batch with the gemini backend needs the google-genai package "
+                              "(pip install google-genai)") from e
+        self._client = genai.Client(api_key=api_key)
+
+    def submit(self, model_name, request_path):
+        uploaded = self._client.files.upload(
+            file=request_path,
+            config={"display_name": os.path.basename(request_path), "mime_type": "jsonl"},
+        )
+        job = self._client.batches.create(
+            model=model_name, src=uploaded.name,
+            config={"display_name": os.path.splitext(os.path.basename(request_path))[0]},
+        )
+        return job.name
+
+    def state(self, job_id):
+        state = self._client.batches.get(name=job_id).state
+        return getattr(state, "name", str(state))
+
+    def results(self, job_id):
+        job = self._client.batches.get(name=job_id)
+        content = self._client.files.download(file=job.dest.file_name)
+        return read_results(content.decode("utf-8").splitlines())
+
+    def cancel(self, job_id):
+        self._client.batches.cancel(name=job_id)
+
+
+class LocalBatchServer(BatchClient):
+    """
+    Answers batch jobs from files in `directory` with `backend`, `delay`
+    seconds after submission (on the first poll after that), so batch mode
+    can be exercised offline.
+    """
+
+    name = "local"
+
+    def __init__(self, backend: LLMBackend, directory: str, delay: float = 0.0):
+        self.backend = backend
+        self.directory = directory
+        self.delay = delay
+
+    def _job_path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.directory, job_id, name)
+
+    def _read_status(self, job_id: str) -> Dict:
+        with open(self._job_path(job_id, "status.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_status(self, job_id: str, status: Dict):
+        path = self._job_path(job_id, "status.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(status, f)
+        os.replace(path + ".tmp", path)
+
+    def submit(self, model_name, request_path):
+        job_id = f"batch-{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.directory, job_id))
+        shutil.copyfile(request_path, self._job_path(job_id, "requests.jsonl"))
+        self._write_status(job_id, {"state": PENDING, "model": model_name, "submitted": time.time()})
+        return job_id
+
+    def state(self, job_id):
+        status = self._read_status(job_id)
+        if status["state"] == PENDING and time.time() - status["submitted"] >= self.delay:
+            self._run(job_id, status)
+        return self._read_status(job_id)["state"]
+
+    def _run(self, job_id: str, status: Dict):
+        self._write_status(job_id, dict(status, state=RUNNING))
+        with open(self._job_path(job_id, "requests.jsonl"), encoding="utf-8") as f, \
+                open(self._job_path(job_id, "results.jsonl"), "w", encoding="utf-8") as out:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                line = json.loads(raw)
+                request = line["request"]
+                try:
+                    response = self.backend.generate(
+                        status["model"],
+                        request["system_instruction"]["parts"][0]["text"],
+                        request["contents"][0]["parts"][0]["text"],
+                        request["generation_config"]["temperature"],
+                    )
+                    result = {"key": line["key"], "response": {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": response.text}]}}],
+                        "usageMetadata": {
+                            "promptTokenCount": response.prompt_tokens,
+                            "candidatesTokenCount": response.output_tokens,
+                            "totalTokenCount": response.total_tokens,
+                        },
+                    }}
+                except Exception as e:
+                    result = {"key": line["key"], "error": {"message": str(e)}}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._write_status(job_id, dict(status, state=SUCCEEDED, finished=time.time()))
+
+    def results(self, job_id):
+        with open(self._job_path(job_id, "results.jsonl"), encoding="utf-8") as f:
+            return read_results(f)
+
+    def cancel(self, job_id):
+        status = self._read_status(job_id)
+        if status["state"] not in DONE_STATES:
+            self._write_status(job_id, dict(status, state=CANCELLED))
+
+
+def wait_for(client: BatchClient, job_id: str, poll_interval: float = 30.0,
+             timeout: Optional[float] = None) -> str:
+    """Polls a batch job until it reaches a final state; returns that state."""
+    start = time.time()
+    last_state = None
+    while True:
+        state = client.state(job_id)
+        if state != last_state:
+            print(f"  ... [BATCH] {job_id}: {state} ({time.time() - start:.0f}s)")
+            last_state = state
+        if state in DONE_STATES:
+            return state
+        if timeout is not None and time.time() - start > timeout:
+            client.cancel(job_id)
+            print(f"  ⚠ [BATCH] {job_id} still not done after {timeout:.0f}s; cancelled.")
+            return CANCELLED
+        time.sleep(poll_interval)
@@ -0,0 +1,152 @@
+"""
+ace_cache.py
+
+Content-addressed on-disk cache of LLM responses for AcePipeline.
+
+A response is keyed by a hash of everything that determines it: backend,
+model name, system prompt, rendered user prompt and temperature. Re-running a pipeline
+after editing one stage therefore only pays for the calls whose prompts
+actually changed. Entries live in a single SQLite file; once the cache grows
+past `max_bytes` the least recently used entries are evicted.
+
+Keys of the default gemini backend keep the form they had before the
+backend was part of the key, so existing caches stay valid; any other
+backend (e.g. the stub's synthetic answers) gets keys of its own and can
+never be served to a real model.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+class ResponseCache:
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        refresh_stages: Optional[Iterable[str]] = None
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        # Stages whose cached responses are ignored (but overwritten) this run
+        self.refresh_stages = set(refresh_stages or [])
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   stage TEXT,
+                   response TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._conn.commit()
+        # Running size of all responses, so put() does not have to sum the table
+        self._bytes = self._total_bytes()
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, system_prompt: str, user_prompt: str, temperature: float,
+                 backend: str = "gemini") -> str:
+        parts = [model_name, system_prompt, user_prompt, temperature]
+        if backend != "gemini":
+            parts.insert(0, backend)
+        payload = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, stage_name: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            if stage_name in self.refresh_stages:
+                self.refreshed += 1
+                return None
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model_name: str = None, stage_name: Optional[str] = None):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            replaced = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, stage, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, stage_name, response, size, now, now)
+            )
+            self.writes += 1
+            self._bytes += size - (replaced[0] if replaced else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        # Re-sum once over the limit: another process may share the file
+        total = self._total_bytes()
+        self._bytes = total
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshed": self.refreshed,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"[RESPONSE CACHE] {stats['hits']} hits / {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['refreshed']} refreshed, "
+              f"{stats['writes']} writes, {stats['evictions']} evictions")
+        print(f"  {stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB in {self.path}")
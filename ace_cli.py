@@ -0,0 +1,75 @@
+"""
+ace_cli.py
+
+Command-line options shared by the ACE entry points (ace_run_pipeline.py,
+ace_infer.py and ace_server.py): the backend, model, rate limit, retry and
+response cache options, and the AcePipeline they configure. Keeping them in
+one place means the three CLIs accept the same flags with the same
+defaults.
+"""
+
+import argparse
+import os
+import sys
+from typing import Iterable
+
+from ace_backends import StubBackend
+from ace_cache import ResponseCache
+from ace_ratelimit import RetryPolicy, configure_rate_limit
+from ace_util import AcePipeline
+
+
+def add_pipeline_args(parser: argparse.ArgumentParser):
+    """Adds the backend, model, rate limit, retry and response cache options."""
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk LLM response cache")
+    parser.add_argument(
+        "--cache-file", default="ace_response_cache.sqlite",
+        help="Path of the response cache (default: ace_response_cache.sqlite)"
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=int, default=256,
+        help="Evict least recently used responses beyond this size (default: 256)"
+    )
+    parser.add_argument("--model", default="gemini-2.5-flash", help="Model name (default: gemini-2.5-flash)")
+    parser.add_argument("--rpm", type=float, help="Requests per minute allowed for the model (overrides ace_ratelimit.RATE_LIMITS)")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute allowed for the model (overrides ace_ratelimit.RATE_LIMITS)")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per LLM call on 429/5xx errors (default: 5)")
+    parser.add_argument(
+        "--backend", choices=["gemini", "stub"], default="gemini",
+        help="LLM backend (default: gemini). 'stub' is offline and deterministic, for benchmarks and CI."
+    )
+    parser.add_argument(
+        "--stub-replay", action="append", default=[], metavar="HISTORY",
+        help="History file whose recorded responses the stub backend replays. May be repeated."
+    )
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds the stub backend waits per call")
+
+
+def build_pipeline(args: argparse.Namespace, refresh_stages: Iterable[str] = ()) -> AcePipeline:
+    """
+    Returns the AcePipeline configured by the add_pipeline_args options.
+    Exits when the gemini backend has no GOOGLE_API_KEY.
+    """
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key and args.backend == "gemini":
+        print("Error: GOOGLE_API_KEY environment variable not set.")
+        sys.exit(1)
+    if args.rpm or args.tpm:
+        configure_rate_limit(args.model, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    response_cache = None
+    if not args.no_cache:
+        response_cache = ResponseCache(
+            args.cache_file,
+            max_bytes=args.cache_max_mb * 1024 * 1024,
+            refresh_stages=refresh_stages
+        )
+    backend = None
+    if args.backend == "stub":
+        backend = StubBackend(replay_files=args.stub_replay, latency=args.stub_latency)
+    return AcePipeline(
+        api_key=api_key,
+        model_name=args.model,
+        response_cache=response_cache,
+        retry_policy=RetryPolicy(max_attempts=args.max_attempts),
+        backend=backend
+    )
@@ -0,0 +1,241 @@
+"""
+ace_context_cache.py
+
+Provider-side caching of stable prompt prefixes for AcePipeline.
+
+Every job resends each stage's system prompt and, depending on the
+template, the formatted playbook and long inputs such as the ground truth.
+ContextCacheManager finds the stable part of each stage's prompt (the
+longest common prefix of consecutive user prompts, cut at a line break),
+uploads system prompt + prefix once through the backend's cached-content
+API, and lets later calls send only the remaining suffix.
+
+Cached contents have a TTL; entries close to expiry are extended when used
+and expired ones are recreated. Prefixes that contain the formatted
+playbook are deleted when the curator changes the playbook
+(`invalidate_playbook`), and `close` deletes everything at the end of a run
+so no storage is paid for after it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+from ace_ratelimit import estimate_tokens
+
+# Smallest prefix (system prompt + user prefix, in tokens) worth caching.
+# Providers reject smaller cached contents; models not listed use the default.
+MIN_CACHE_TOKENS: Dict[str, int] = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+MAX_ERRORS = 3
+
+
+class CachedPrefix:
+
+    def __init__(self, handle, stage_name: Optional[str], system_prompt: str, prefix: str,
+                 expires: float, playbook_dependent: bool):
+        self.handle = handle
+        self.stage_name = stage_name
+        self.system_prompt = system_prompt
+        self.prefix = prefix
+        self.expires = expires
+        self.playbook_dependent = playbook_dependent
+        self.uses = 0
+
+
+class ContextCacheManager:
+
+    def __init__(self, backend, model_name: str, ttl: float = 600.0,
+                 min_tokens: Optional[int] = None, max_entries: int = 64):
+        self.backend = backend
+        self.model_name = model_name
+        self.ttl = ttl
+        self.min_tokens = min_tokens or MIN_CACHE_TOKENS.get(model_name, DEFAULT_MIN_CACHE_TOKENS)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedPrefix]" = OrderedDict()
+        self._last_prompt: Dict[Optional[str], str] = {}
+        # Prefixes being uploaded: key -> Future of their CachedPrefix
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.hits = 0
+        self.refreshed = 0
+        self.deleted = 0
+        self.errors = 0
+        # Turned off after MAX_ERRORS failures (e.g. a model without caching)
+        self.enabled = True
+
+    @staticmethod
+    def _key(model_name: str, system_prompt: str, prefix: str) -> str:
+        return hashlib.sha256("\x1f".join([model_name, system_prompt, prefix]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _stable_prefix(previous: Optional[str], user_prompt: str) -> str:
+        if previous is None:
+            return ""
+        common = os.path.commonprefix([previous, user_prompt])
+        # Cut at a line break so the cached part ends on a whole line,
+        # and always leave a non-empty suffix to send
+        cut = common.rfind("\n", 0, len(user_prompt) - 1) + 1
+        return common[:cut]
+
+    def _delete(self, entries):
+        """Deletes entries already removed from the table (called without the lock held)."""
+        for entry in entries:
+            try:
+                self.backend.delete_context_cache(entry.handle)
+            except Exception as e:
+                print(f"  ⚠ [CONTEXT CACHE] Could not delete cached content: {e}")
+            with self._lock:
+                self.deleted += 1
+
+    def _failed(self, key: Optional[str], error: Exception):
+        # The call still works without the cache: send the full prompt
+        print(f"  ⚠ [CONTEXT CACHE] {error}. Sending the full prompt.")
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            self.errors += 1
+            if self.errors >= MAX_ERRORS and self.enabled:
+                self.enabled = False
+                print(f"  ⚠ [CONTEXT CACHE] Disabled after {self.errors} errors.")
+
+    def split(self, stage_name: Optional[str], system_prompt: str, user_prompt: str,
+              playbook_text: Optional[str] = None) -> Tuple[Optional[object], str]:
+        """
+        Returns (cached content handle, user prompt suffix) for a call, or
+        (None, user_prompt) when no cached prefix applies.
+
+        Uploads and TTL extensions run outside the lock, so workers needing
+        other prefixes are not held up by them; workers needing a prefix
+        that is being uploaded wait for that upload instead of repeating it.
+        """
+        if not self.enabled:
+            return None, user_prompt
+        now = time.time()
+        refresh = False
+        with self._lock:
+            previous = self._last_prompt.get(stage_name)
+            self._last_prompt[stage_name] = user_prompt
+
+            # Longest live entry this prompt extends
+            best_key = None
+            for key, entry in self._entries.items():
+                if (entry.system_prompt == system_prompt and len(entry.prefix) < len(user_prompt)
+                        and user_prompt.startswith(entry.prefix)
+                        and (best_key is None or len(entry.prefix) > len(self._entries[best_key].prefix))):
+                    best_key = key
+
+            entry = None
+            if best_key is None:
+                prefix = self._stable_prefix(previous, user_prompt)
+                if not prefix or estimate_tokens(system_prompt, prefix) < self.min_tokens:
+                    return None, user_prompt
+                best_key = self._key(self.model_name, system_prompt, prefix)
+                entry_stage = stage_name
+            else:
+                entry = self._entries[best_key]
+                prefix, entry_stage = entry.prefix, entry.stage_name
+                if entry.expires <= now:
+                    # Expired on the provider side: upload it again
+                    self._entries.pop(best_key)
+                    entry = None
+
+            if entry is None:
+                pending = self._pending.get(best_key)
+                owner = pending is None
+                if owner:
+                    pending = self._pending[best_key] = Future()
+            else:
+                refresh = entry.expires - now < self.ttl * 0.25
+                if refresh:
+                    # Claimed here so concurrent callers do not extend it too
+                    entry.expires = now + self.ttl
+                self._entries.move_to_end(best_key)
+                entry.uses += 1
+                self.hits += 1
+
+        if entry is not None:
+            if refresh:
+                try:
+                    self.backend.update_context_cache_ttl(entry.handle, self.ttl)
+                except Exception as e:
+                    self._failed(best_key, e)
+                    return None, user_prompt
+                with self._lock:
+                    self.refreshed += 1
+            return entry.handle, user_prompt[len(entry.prefix):]
+
+        if not owner:
+            try:
+                entry = pending.result()
+            except Exception:
+                # The uploading caller reports the error
+                return None, user_prompt
+            with self._lock:
+                entry.uses += 1
+                self.hits += 1
+            return entry.handle, user_prompt[len(entry.prefix):]
+
+        try:
+            entry = self._create(best_key, entry_stage, system_prompt, prefix, playbook_text, now)
+        except Exception as e:
+            with self._lock:
+                del self._pending[best_key]
+            pending.set_exception(e)
+            self._failed(None, e)
+            return None, user_prompt
+        pending.set_result(entry)
+        return entry.handle, user_prompt[len(entry.prefix):]
+
+    def _create(self, key: str, stage_name: Optional[str], system_prompt: str, prefix: str,
+                playbook_text: Optional[str], now: float) -> CachedPrefix:
+        handle = self.backend.create_context_cache(self.model_name, system_prompt, prefix, self.ttl)
+        entry = CachedPrefix(
+            handle, stage_name, system_prompt, prefix, now + self.ttl,
+            playbook_dependent=bool(playbook_text) and playbook_text in prefix
+        )
+        entry.uses = 1
+        evicted = []
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = entry
+            self.created += 1
+            self.hits += 1
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.pop(next(iter(self._entries))))
+        print(f"  ... [CONTEXT CACHE] Cached {estimate_tokens(system_prompt, prefix)} token prefix "
+              f"for {stage_name or 'call'} (TTL {self.ttl:.0f}s)")
+        self._delete(evicted)
+        return entry
+
+    def discard(self, handle):
+        """Drops an entry the provider no longer knows about."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.handle is handle:
+                    self._entries.pop(key)
+
+    def invalidate_playbook(self):
+        """Deletes every cached prefix that embeds the (now outdated) playbook."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.playbook_dependent]
+            entries = [self._entries.pop(key) for key in stale]
+        self._delete(entries)
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._delete(entries)
+
+    def print_stats(self):
+        print(f"[CONTEXT CACHE] {self.hits} calls used a cached prefix, {self.created} created, "
+              f"{self.refreshed} TTL extensions, {self.deleted} deleted")
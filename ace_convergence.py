@@ -0,0 +1,74 @@
+"""
+ace_convergence.py
+
+Early stop for the playbook learning loop.
+
+Late in a long run the curator rarely accepts anything new and the
+critiques stop improving, yet every job still pays for its critique and
+reflect calls. ConvergenceMonitor watches the last `window` completed
+jobs for
+
+    playbook churn   strategies the curator added or reworded per job
+                     (run_context["playbook_churn"])
+    critique score   ace_curator.critique_score: a numeric "score" in a
+                     stage output, else strengths minus weaknesses
+
+and declares the playbook converged once churn is at most `max_churn`
+and the newer half of the window scores no better than the older half
+(within `score_tolerance`). From then on `process_jobs` runs the
+remaining jobs through the first stage only, against the final playbook.
+"""
+
+from typing import Dict, List, Optional
+
+from ace_curator import critique_score
+
+
+class ConvergenceMonitor:
+
+    def __init__(self, window: int = 8, max_churn: float = 0.2, score_tolerance: float = 0.05):
+        self.window = max(2, window)
+        self.max_churn = max_churn
+        self.score_tolerance = score_tolerance
+        self.churns: List[int] = []
+        self.scores: List[float] = []
+        self.observed = 0
+        self.converged_after: Optional[int] = None
+        self.skipped = 0
+
+    @property
+    def converged(self) -> bool:
+        return self.converged_after is not None
+
+    def observe(self, run_context: Dict):
+        """Feeds back one curated job (jobs that failed or were not curated are ignored)."""
+        if self.converged or "playbook_churn" not in run_context:
+            return
+        self.observed += 1
+        self.churns = (self.churns + [run_context["playbook_churn"]])[-self.window:]
+        score = critique_score(run_context)
+        if score is not None:
+            self.scores = (self.scores + [score])[-self.window:]
+        if self._stable():
+            self.converged_after = self.observed
+            print(f"\n[CONVERGED] Playbook stable after {self.observed} jobs "
+                  f"(churn {sum(self.churns) / len(self.churns):.2f}/job over the last {self.window}); "
+                  f"remaining jobs run the first stage only.")
+
+    def _stable(self) -> bool:
+        if len(self.churns) < self.window or sum(self.churns) / len(self.churns) > self.max_churn:
+            return False
+        if len(self.scores) < self.window:
+            # No critique scores to judge by: churn alone decides
+            return not self.scores
+        half = self.window // 2
+        older = sum(self.scores[:half]) / half
+        newer = sum(self.scores[half:]) / (self.window - half)
+        return newer - older <= self.score_tolerance * max(1.0, abs(older))
+
+    def print_stats(self):
+        if self.converged:
+            print(f"[CONVERGENCE] Converged after {self.converged_after} jobs; "
+                  f"{self.skipped} jobs ran the first stage only.")
+        else:
+            print(f"[CONVERGENCE] Not converged after {self.observed} jobs.")
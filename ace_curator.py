@@ -0,0 +1,250 @@
+"""
+ace_curator.py
+
+Curator engine for AcePipeline playbooks.
+
+Instead of exact-string dedup and keeping the last 10 strategies, every
+learned pattern is compared with the strategies already in its section
+through a local TF-IDF index (word unigrams and bigrams, cosine
+similarity, no network):
+
+    similarity >= reject_threshold   rejected as a duplicate; the existing
+                                     strategy gains support
+    similarity >= merge_threshold    merged: the two become one strategy,
+                                     worded as the more specific (longer) one
+    otherwise                        added
+
+When a section grows past `max_strategies`, the strategy with the lowest
+utility is evicted rather than the oldest. Utility is credit earned from
+critique improvements: after every run, each strategy in the playbook that
+run used is credited with (critique score - running baseline), so
+strategies that precede better critiques rise and the rest sink.
+
+Per-strategy statistics live in the engine (`CuratorEngine.state`), not
+in the playbook: AcePipeline saves them with every history run under
+"curator_state" and restores them with the playbook. Histories written
+before that kept them inside the playbook under the same key.
+
+The playbook has one strategy list per section: a stage's
+"playbook_section" (e.g. "critique") maps to "critique_strategies" through
+`section_key`, and "process_strategies" holds the general patterns meant
+for the first (execute) stage. `route_patterns` sorts a reflection's
+learned_patterns into those sections.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# History field of the curator statistics (and, in older histories, the
+# playbook key they were kept under)
+STATE_KEY = "curator_state"
+GENERAL_SECTION = "process_strategies"
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or
+such that the their them then these this those to was were when which while
+will with without
+""".split())
+
+# Weight of each extra (rejected or merged) occurrence of a strategy, and
+# of the prior pulling rarely used strategies towards zero utility
+SUPPORT_WEIGHT = 0.1
+PRIOR_WEIGHT = 2.0
+
+
+def strategy_sections(playbook: Dict) -> Dict[str, List[str]]:
+    """The strategy lists of a playbook (its `*_strategies` keys)."""
+    return {key: value for key, value in playbook.items() if key.endswith("_strategies")}
+
+
+def section_key(section: Optional[str]) -> str:
+    """Playbook key of a section: "creative writing" -> "creative_writing_strategies"."""
+    name = re.sub(r"[^a-z0-9]+", "_", (section or "").lower()).strip("_")
+    if name.endswith("_strategies"):
+        name = name[:-len("_strategies")]
+    if name in ("", "all", "process", "general"):
+        return GENERAL_SECTION
+    return f"{name}_strategies"
+
+
+def section_title(key: str) -> str:
+    return key[:-len("_strategies")].replace("_", " ").upper() + " STRATEGIES"
+
+
+def route_patterns(reflection: Dict) -> Dict[str, List[str]]:
+    """
+    Groups a reflection's learned_patterns by playbook section key. Patterns
+    may be plain strings (sent to the reflection's "target_section", else
+    the general section), {"section": ..., "pattern": ...} objects, or the
+    whole learned_patterns may be a {section: [patterns]} mapping.
+    """
+    patterns = reflection.get("learned_patterns", [])
+    default = section_key(reflection.get("target_section"))
+    if isinstance(patterns, dict):
+        items = [(section, pattern) for section, values in patterns.items()
+                 for pattern in (values if isinstance(values, list) else [values])]
+    else:
+        items = []
+        for pattern in patterns if isinstance(patterns, list) else [patterns]:
+            if isinstance(pattern, dict):
+                items.append((pattern.get("section"), pattern.get("pattern") or pattern.get("strategy")))
+            else:
+                items.append((None, pattern))
+
+    routed: Dict[str, List[str]] = {}
+    for section, pattern in items:
+        if isinstance(pattern, str) and pattern.strip():
+            key = default if section is None else section_key(section)
+            routed.setdefault(key, []).append(pattern)
+    return routed
+
+
+def tokenize(text: str) -> List[str]:
+    words = [w for w in re.findall(r"[a-z0-9']+", text.lower()) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class StrategyIndex:
+    """TF-IDF vectors of a set of strategies, for cosine similarity lookups."""
+
+    def __init__(self, texts: List[str]):
+        self.texts = list(texts)
+        self._counts = [Counter(tokenize(text)) for text in self.texts]
+
+    def _vector(self, counts: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+        vector = {term: (1 + math.log(n)) * idf.get(term, 1.0) for term, n in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    def most_similar(self, text: str) -> Tuple[Optional[int], float]:
+        """Returns (index, cosine similarity) of the closest strategy, or (None, 0.0)."""
+        if not self.texts:
+            return None, 0.0
+        query = Counter(tokenize(text))
+        documents = self._counts + [query]
+        df = Counter(term for counts in documents for term in counts)
+        idf = {term: math.log((1 + len(documents)) / (1 + n)) + 1 for term, n in df.items()}
+        query_vector = self._vector(query, idf)
+        best, best_score = None, 0.0
+        for i, counts in enumerate(self._counts):
+            vector = self._vector(counts, idf)
+            score = sum(weight * vector.get(term, 0.0) for term, weight in query_vector.items())
+            if score > best_score:
+                best, best_score = i, score
+        return best, best_score
+
+
+def critique_score(run_context: Dict) -> Optional[float]:
+    """
+    A number that grows with critique quality, taken from the first stage
+    output holding a numeric "score", else from the balance of "strengths"
+    and "weaknesses" (in [-1, 1]). None when the run has no critique.
+    """
+    for key in sorted(run_context):
+        data = run_context[key]
+        if not key.endswith("_data") or not isinstance(data, dict):
+            continue
+        score = data.get("score")
+        if isinstance(score, (int, float)) and not isinstance(score, bool):
+            return float(score)
+        strengths, weaknesses = data.get("strengths"), data.get("weaknesses")
+        if isinstance(strengths, list) and isinstance(weaknesses, list) and (strengths or weaknesses):
+            return (len(strengths) - len(weaknesses)) / (len(strengths) + len(weaknesses))
+    return None
+
+
+class CuratorEngine:
+
+    def __init__(self, max_strategies: int = 10, merge_threshold: float = 0.45,
+                 reject_threshold: float = 0.8, baseline_decay: float = 0.3):
+        self.max_strategies = max_strategies
+        self.merge_threshold = merge_threshold
+        self.reject_threshold = reject_threshold
+        self.baseline_decay = baseline_decay
+        self.state: Dict = self.empty_state()
+
+    @staticmethod
+    def empty_state() -> Dict:
+        return {"baseline": None, "added": 0, "strategies": {}}
+
+    @staticmethod
+    def utility(stats: Dict) -> float:
+        return (stats["credit"] + SUPPORT_WEIGHT * (stats["support"] - 1)) / (stats["uses"] + PRIOR_WEIGHT)
+
+    def _stats(self, state: Dict, text: str) -> Dict:
+        stats = state["strategies"].get(text)
+        if stats is None:
+            state["added"] += 1
+            stats = state["strategies"][text] = {"uses": 0, "credit": 0.0, "support": 1, "added": state["added"]}
+        return stats
+
+    def credit(self, playbook: Dict, used_playbook: Dict, run_context: Dict) -> Optional[float]:
+        """
+        Credits every strategy of `used_playbook` (the playbook the run was
+        given) with the run's critique improvement over the baseline.
+        Returns the improvement, or None when the run has no critique score.
+        """
+        score = critique_score(run_context)
+        if score is None:
+            return None
+        state = self.state
+        baseline = state["baseline"]
+        improvement = 0.0 if baseline is None else score - baseline
+        current = {text for strategies in strategy_sections(playbook).values() for text in strategies}
+        for strategies in strategy_sections(used_playbook).values():
+            for text in strategies:
+                if text in current:
+                    stats = self._stats(state, text)
+                    stats["uses"] += 1
+                    stats["credit"] = round(stats["credit"] + improvement, 6)
+        state["baseline"] = score if baseline is None else round(
+            baseline + self.baseline_decay * (score - baseline), 6
+        )
+        return improvement
+
+    def curate(self, playbook: Dict, reflection: Dict, section: str = GENERAL_SECTION) -> Dict:
+        """Merges the reflection's learned_patterns into `section` of the playbook (in place)."""
+        state = self.state
+        strategies = playbook.setdefault(section, [])
+        added = set()
+
+        for pattern in reflection.get("learned_patterns", []):
+            if not isinstance(pattern, str) or not pattern.strip():
+                continue
+            pattern = pattern.strip()
+            index, similarity = StrategyIndex(strategies).most_similar(pattern)
+            if index is not None and similarity >= self.reject_threshold:
+                self._stats(state, strategies[index])["support"] += 1
+                print(f"  = Rejected near-duplicate ({similarity:.2f}) of: {strategies[index][:60]}...")
+            elif index is not None and similarity >= self.merge_threshold:
+                existing = strategies[index]
+                stats = self._stats(state, existing)
+                del state["strategies"][existing]
+                stats["support"] += 1
+                merged = pattern if len(pattern) > len(existing) else existing
+                strategies[index] = merged
+                state["strategies"][merged] = stats
+                print(f"  ~ Merged similar strategy ({similarity:.2f}): {merged[:80]}...")
+            else:
+                strategies.append(pattern)
+                self._stats(state, pattern)
+                added.add(pattern)
+                print(f"  ✓ Added prompt strategy: {pattern[:80]}...")
+
+        excess = len(strategies) - self.max_strategies
+        if excess > 0:
+            # Strategies added just now get a chance to earn credit first
+            ranked = sorted(strategies, key=lambda s: (s in added, self.utility(self._stats(state, s)),
+                                                       state["strategies"][s]["added"]))
+            victims = set(ranked[:excess])
+            for victim in ranked[:excess]:
+                print(f"  - Evicted (utility {self.utility(state['strategies'][victim]):+.3f}): {victim[:60]}...")
+            strategies[:] = [s for s in strategies if s not in victims]
+
+        # Forget statistics of strategies no longer in the playbook
+        live = {text for texts in strategy_sections(playbook).values() for text in texts}
+        for text in [text for text in state["strategies"] if text not in live]:
+            del state["strategies"][text]
+        return playbook
@@ -0,0 +1,664 @@
+#!/usr/bin/env python3
+"""
+ace_history.py
+
+Append-only JSONL history store for AcePipeline.
+
+The original history file is a single JSON list that is rewritten in full
+after every job, so checkpointing gets slower as runs accumulate. A JSONL
+history holds one run per line and each save only appends the runs added
+since the previous save. Files ending in .gz are gzip-compressed and files
+ending in .zst are zstd-compressed (needs the optional `zstandard` package);
+every append is written as its own compressed member/frame.
+
+Alongside the history the store keeps two small sidecar files:
+
+    <history>.snapshot.json   run count, history size and the latest playbook
+                              (with its version and the curator statistics)
+    <history>.idx             byte offset of every run (uncompressed JSONL only)
+
+so AcePipeline can restore its playbook without reading the history, and
+LazyHistory can fetch individual runs on demand.
+
+A store opened with compact=True writes runs in a compact form: the values
+that repeat from run to run (system prompts, ground truth, playbooks) are
+stored once in a content-addressed table, <history>.blobs.jsonl, and
+referenced by hash, and the raw `{stage}_json` text is dropped whenever it
+can be re-serialized byte for byte from the parsed `{stage}_data`. Unlike the
+other sidecars the blob table is part of the history. load_history_records
+and LazyHistory rehydrate compact runs to the exact full record; LazyHistory
+reads blobs on demand rather than loading the whole table.
+
+Convert an existing *_history.json file:
+
+    python3 ace_history.py saki6_history.json saki6_history.jsonl [--compact]
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSONL_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+# Values under these keys can repeat across runs; a compact history interns
+# one once it is seen a second time. Everything else (stories, inputs, stage
+# output) stays inline.
+INTERN_KEYS = ("playbook", "playbook_snapshot", "ground_truth_json", "current_ace_prompt")
+INTERN_SUFFIXES = ("_system_prompt",)
+
+# Indents tried when checking whether a raw `{stage}_json` text can be
+# rebuilt from its parsed data
+DERIVED_INDENTS = (2, 4, None)
+
+# Blob values LazyHistory keeps in memory
+BLOB_CACHE_SIZE = 64
+
+# Fields of the last run (with a playbook) that AcePipeline restores its
+# state from; the snapshot sidecar keeps a copy of each
+RESTORE_KEYS = ("playbook_snapshot", "playbook_snapshot_version", "curator_state")
+
+
+def is_jsonl_path(path: str) -> bool:
+    return path.endswith(JSONL_SUFFIXES)
+
+
+def _require_zstandard(path: str):
+    if zstandard is None:
+        raise IOError(f"{path} is zstd-compressed; run `pip install zstandard` to use it.")
+
+
+def _iter_lines(path: str) -> Iterator[str]:
+    if path.endswith(".gz"):
+        handle = gzip.open(path, "rt", encoding="utf-8")
+    elif path.endswith(".zst"):
+        _require_zstandard(path)
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        handle = io.TextIOWrapper(reader, encoding="utf-8")
+    else:
+        handle = open(path, "r", encoding="utf-8")
+
+    with handle:
+        try:
+            for line in handle:
+                yield line
+        except EOFError:
+            # A compressed member cut short by a crash; keep what was complete
+            print(f"  ⚠ {path} ends with a truncated compressed block; ignoring it.")
+
+
+def _iter_records(path: str) -> Iterator[Dict]:
+    for line_number, line in enumerate(_iter_lines(path), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Only the last line can be partial (interrupted append)
+            print(f"  ⚠ Skipping unreadable history line {line_number} in {path}.")
+
+
+def read_jsonl(path: str) -> List[Dict]:
+    return list(_iter_records(path))
+
+
+def load_history_records(path: str) -> List[Dict]:
+    """Loads a history file in the JSON-list or (compact) JSONL format."""
+    if not is_jsonl_path(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    records = read_jsonl(path)
+    if any(record.get("_compact") for record in records):
+        blobs = read_blobs(path)
+        records = [expand_run(record, blobs) for record in records]
+    return records
+
+
+def snapshot_path(path: str) -> str:
+    return path + ".snapshot.json"
+
+
+def blobs_path(path: str) -> str:
+    return path + ".blobs.jsonl"
+
+
+def blob_hash(value: Any) -> str:
+    canonical = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def read_blobs(path: str) -> Dict[str, Any]:
+    blobs = {}
+    if os.path.exists(blobs_path(path)):
+        for blob in read_jsonl(blobs_path(path)):
+            blobs[blob["hash"]] = blob["value"]
+    return blobs
+
+
+def _blob_line_hash(line: bytes) -> Optional[str]:
+    # Blob lines are written as {"hash": "<digest>", "value": ...}
+    prefix = b'{"hash": "'
+    if line.startswith(prefix):
+        end = line.find(b'"', len(prefix))
+        if end > 0:
+            return line[len(prefix):end].decode("ascii")
+    try:
+        return json.loads(line)["hash"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def read_blob_offsets(path: str) -> Dict[str, int]:
+    """Returns the byte offset of every complete blob line, by hash."""
+    offsets = {}
+    if not os.path.exists(blobs_path(path)):
+        return offsets
+    position = 0
+    with open(blobs_path(path), "rb") as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                digest = _blob_line_hash(line)
+                if digest is not None:
+                    offsets.setdefault(digest, position)
+            position += len(line)
+    return offsets
+
+
+class BlobTable:
+    """
+    Mapping view of a compact history's blob table that keeps only the byte
+    offset of each blob in memory and reads values on demand, caching the
+    `cache_size` most recently used ones.
+    """
+
+    def __init__(self, path: str, cache_size: int = BLOB_CACHE_SIZE):
+        self.path = blobs_path(path)
+        self.cache_size = cache_size
+        self._offsets = read_blob_offsets(path)
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._offsets
+
+    def __getitem__(self, digest: str) -> Any:
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[digest])
+            value = json.loads(f.readline().decode("utf-8"))["value"]
+        self._cache[digest] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+
+def _should_intern(key: str) -> bool:
+    return key in INTERN_KEYS or key.endswith(INTERN_SUFFIXES)
+
+
+def _derived_indent(raw: Any, data: Any) -> Optional[Tuple[Optional[int]]]:
+    """
+    Returns (indent,) when json.dumps(data, indent=indent) reproduces `raw`
+    exactly, so the raw text can be dropped and rebuilt on load; None
+    otherwise.
+    """
+    if not isinstance(raw, str):
+        return None
+    # Only the indent the raw text itself uses can reproduce it
+    newline = raw.find("\n")
+    if newline < 0:
+        indent = None
+    else:
+        indent = len(raw) - newline - 1 - len(raw[newline + 1:].lstrip(" "))
+    if indent not in DERIVED_INDENTS:
+        return None
+    if json.dumps(data, indent=indent, ensure_ascii=False) == raw:
+        return (indent,)
+    return None
+
+
+def compact_run(record: Dict, known: Set[str], seen: Optional[Set[str]] = None) -> Tuple[Dict, List[Dict]]:
+    """
+    Returns the compact form of a run and the blobs it references that are
+    not in `known` yet (`known` is updated). A value that is neither in
+    `known` nor in `seen` is written inline and its hash added to `seen`,
+    so values used only once never reach the blob table.
+    """
+    if seen is None:
+        seen = set()
+    compact = {"_compact": 1}
+    derived = {}
+    new_blobs = []
+    for key, value in record.items():
+        data_key = key[:-len("_json")] + "_data"
+        if key.endswith("_json") and data_key in record and key != "ground_truth_json":
+            match = _derived_indent(value, record[data_key])
+            if match is not None:
+                # The raw response is re-serialized from the parsed data on load
+                derived[key] = match[0]
+                continue
+        if not _should_intern(key):
+            compact[key] = value
+            continue
+        digest = blob_hash(value)
+        if digest in known:
+            compact[key] = {"_ref": digest}
+        elif digest in seen:
+            known.add(digest)
+            new_blobs.append({"hash": digest, "value": value})
+            compact[key] = {"_ref": digest}
+        else:
+            seen.add(digest)
+            compact[key] = value
+    if derived:
+        compact["_derived"] = derived
+    return compact, new_blobs
+
+
+def expand_run(record: Dict, blobs) -> Dict:
+    """
+    Rehydrates a compact run to the full record (non-compact runs pass
+    through). `blobs` maps hashes to values: a dict or a BlobTable.
+    """
+    if not record.get("_compact"):
+        return record
+    full = {}
+    for key, value in record.items():
+        if key in ("_compact", "_derived"):
+            continue
+        if isinstance(value, dict) and set(value) == {"_ref"}:
+            value = blobs[value["_ref"]]
+        full[key] = value
+    derived = record.get("_derived", {})
+    if isinstance(derived, list):
+        # Written before the indent was recorded
+        derived = dict.fromkeys(derived, 2)
+    for key, indent in derived.items():
+        data = full.get(key[:-len("_json")] + "_data")
+        full[key] = json.dumps(data, indent=indent, ensure_ascii=False)
+    return full
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+def _is_compressed(path: str) -> bool:
+    return path.endswith((".gz", ".zst"))
+
+
+def _write_json_atomic(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Optional[Dict]:
+    """
+    Returns the sidecar snapshot of a JSONL history, or None when it is
+    missing or stale (the history changed size since it was written).
+    """
+    try:
+        with open(snapshot_path(path), "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("history_bytes") != os.path.getsize(path):
+            return None
+        return snapshot
+    except (IOError, OSError, json.JSONDecodeError):
+        return None
+
+
+def _is_complete_line(line: bytes) -> bool:
+    """False for a line cut short by an interrupted append (no newline, or not JSON)."""
+    if not line.endswith(b"\n"):
+        return False
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
+def _scan_offsets(path: str) -> List[int]:
+    offsets = []
+    position = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip() and _is_complete_line(line):
+                offsets.append(position)
+            position += len(line)
+    return offsets
+
+
+def _drop_partial_tail(path: str) -> int:
+    """
+    Truncates an uncompressed history after its last newline, so the next
+    append does not glue its first run onto a line an interrupted append
+    left behind. Returns the new size.
+    """
+    size = os.path.getsize(path)
+    end = size
+    with open(path, "rb+") as f:
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            print(f"  ⚠ Dropping {size - end} bytes of an interrupted append from the end of {path}.")
+            f.truncate(end)
+    return end
+
+
+def read_index(path: str, rebuild: bool = False) -> Optional[List[int]]:
+    """
+    Returns the byte offset of every run in an uncompressed JSONL history,
+    scanning the history if the .idx sidecar is missing or out of date.
+    With `rebuild` (the append path) the rescanned offsets are written back
+    to the sidecar; readers never create or change files.
+    """
+    if _is_compressed(path) or not os.path.exists(path):
+        return None
+    offsets = None
+    try:
+        with open(index_path(path), "r", encoding="utf-8") as f:
+            offsets = [int(line) for line in f if line.strip()]
+    except (IOError, OSError, ValueError):
+        pass
+
+    size = os.path.getsize(path)
+    if offsets is not None and offsets and offsets[-1] < size:
+        with open(path, "rb") as f:
+            f.seek(offsets[-1])
+            last_line = f.readline()
+            if offsets[-1] + len(last_line) == size and last_line.endswith(b"\n"):
+                return offsets
+    elif offsets == [] and size == 0:
+        return offsets
+
+    offsets = _scan_offsets(path)
+    if rebuild:
+        try:
+            with open(index_path(path), "w", encoding="utf-8") as f:
+                f.writelines(f"{offset}\n" for offset in offsets)
+        except OSError as e:
+            print(f"  ⚠ Could not write {index_path(path)}: {e}")
+    return offsets
+
+
+class LazyHistory:
+    """
+    List-like view of a JSONL history that only reads runs from disk when
+    they are accessed. Runs appended in this process are kept in memory.
+    """
+
+    def __init__(self, path: str, stored_runs: Optional[int] = None):
+        self.path = path
+        self._offsets = read_index(path)
+        if self._offsets is not None:
+            self._stored = len(self._offsets)
+        elif stored_runs is not None:
+            self._stored = stored_runs
+        else:
+            self._stored = sum(1 for _ in _iter_records(path))
+        self._new: List[Dict] = []
+        self._blobs: Optional[BlobTable] = None
+
+    def _expand(self, record: Dict) -> Dict:
+        if not record.get("_compact"):
+            return record
+        if self._blobs is None:
+            self._blobs = BlobTable(self.path)
+        return expand_run(record, self._blobs)
+
+    def __len__(self) -> int:
+        return self._stored + len(self._new)
+
+    def append(self, record: Dict):
+        self._new.append(record)
+
+    def _read_stored(self, i: int) -> Dict:
+        if self._offsets is not None:
+            with open(self.path, "rb") as f:
+                f.seek(self._offsets[i])
+                return self._expand(json.loads(f.readline().decode("utf-8")))
+        for position, record in enumerate(self._iter_stored()):
+            if position == i:
+                return record
+        raise IndexError(i)
+
+    def _iter_stored(self) -> Iterator[Dict]:
+        if self._offsets is not None:
+            # Only the indexed lines: a partial last line is not a run
+            with open(self.path, "rb") as f:
+                for offset in self._offsets:
+                    f.seek(offset)
+                    yield self._expand(json.loads(f.readline().decode("utf-8")))
+            return
+        count = 0
+        for record in _iter_records(self.path):
+            if count >= self._stored:
+                break
+            count += 1
+            yield self._expand(record)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("history index out of range")
+        if i >= self._stored:
+            return self._new[i - self._stored]
+        return self._read_stored(i)
+
+    def __iter__(self) -> Iterator[Dict]:
+        yield from self._iter_stored()
+        yield from self._new
+
+
+def read_restore_state(path: str, rebuild_index: bool = False) -> Tuple[int, Dict]:
+    """
+    Returns the run count of a JSONL history and the RESTORE_KEYS fields of
+    its latest run, from the sidecar when it is current and from the runs
+    otherwise. `rebuild_index` also rewrites a missing or stale .idx (the
+    store does this before extending it).
+    """
+    if not os.path.exists(path):
+        return 0, {}
+    if rebuild_index:
+        read_index(path, rebuild=True)
+    snapshot = read_snapshot(path)
+    if snapshot is not None:
+        state = {key: snapshot.get(key) for key in RESTORE_KEYS}
+        state["playbook_snapshot"] = snapshot.get("playbook")
+        return snapshot.get("runs", 0), state
+
+    history = LazyHistory(path)
+    if not len(history):
+        return 0, {}
+    last_run = history[-1]
+    return len(history), {key: last_run.get(key) for key in RESTORE_KEYS}
+
+
+def read_latest_state(path: str, rebuild_index: bool = False) -> Tuple[int, Optional[Dict]]:
+    """Returns (run count, latest playbook snapshot) of a JSONL history."""
+    runs, state = read_restore_state(path, rebuild_index)
+    return runs, state.get("playbook_snapshot")
+
+
+class JsonlHistoryStore:
+    """
+    Appends history records to a JSONL file. Each append is flushed to the
+    OS immediately; fsync is batched to once every `fsync_every` records
+    (and on close) to keep checkpointing cheap.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 10, compact: bool = False):
+        if not is_jsonl_path(path):
+            raise ValueError(f"Not a JSONL history path: {path}")
+        if path.endswith(".zst"):
+            _require_zstandard(path)
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._unsynced = 0
+        # File size, run count and restore state as of our last append
+        self._known_size = -1
+        self._runs = 0
+        self._state: Dict = {}
+        self.compact = compact
+        self._known_blobs: Optional[Set[str]] = None
+        # Hashes of values this store has written inline once
+        self._seen_values: Set[str] = set()
+
+    def load(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        return load_history_records(self.path)
+
+    def _compact(self, records: List[Dict]) -> List[Dict]:
+        if self._known_blobs is None:
+            if os.path.exists(blobs_path(self.path)):
+                # A crash while writing blobs must not corrupt the next blob
+                _drop_partial_tail(blobs_path(self.path))
+            self._known_blobs = set(read_blob_offsets(self.path))
+        compact_records = []
+        new_blobs = []
+        for record in records:
+            compact, blobs = compact_run(record, self._known_blobs, self._seen_values)
+            compact_records.append(compact)
+            new_blobs.extend(blobs)
+        if new_blobs:
+            # Blobs go first so a crash can never leave a run with dangling refs
+            with open(blobs_path(self.path), "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(blob, ensure_ascii=False) + "\n" for blob in new_blobs)
+                f.flush()
+                os.fsync(f.fileno())
+        return compact_records
+
+    def append(self, records: List[Dict]):
+        if not records:
+            return
+        stored = self._compact(records) if self.compact else records
+        lines = [json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in stored]
+        payload = b"".join(lines)
+
+        if self.path.endswith(".gz"):
+            payload = gzip.compress(payload)
+        elif self.path.endswith(".zst"):
+            payload = zstandard.ZstdCompressor().compress(payload)
+
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size != self._known_size:
+            # First append, or someone else wrote the file since our last
+            # one: re-validate the sidecars before extending them.
+            if size and not _is_compressed(self.path):
+                _drop_partial_tail(self.path)
+            self._runs, self._state = read_restore_state(self.path, rebuild_index=True)
+
+        with open(self.path, "ab") as f:
+            start = f.tell()
+            f.write(payload)
+            f.flush()
+            self._unsynced += len(records)
+            if self._unsynced >= self.fsync_every:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+            self._known_size = f.tell()
+
+        if not _is_compressed(self.path):
+            with open(index_path(self.path), "a" if start else "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(f"{start}\n")
+                    start += len(line)
+
+        self._runs += len(records)
+        for record in reversed(records):
+            if record.get("playbook_snapshot"):
+                self._state = {key: record.get(key) for key in RESTORE_KEYS}
+                break
+        snapshot = {
+            "runs": self._runs,
+            "history_bytes": self._known_size,
+            "last_pipeline_id": records[-1].get("pipeline_id"),
+            "playbook": self._state.get("playbook_snapshot"),
+        }
+        snapshot.update((key, value) for key, value in self._state.items() if key != "playbook_snapshot")
+        _write_json_atomic(snapshot_path(self.path), snapshot)
+
+    def sync(self):
+        if self._unsynced and os.path.exists(self.path):
+            with open(self.path, "ab") as f:
+                os.fsync(f.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+
+
+def convert_history(src: str, dst: str, compact: bool = False) -> int:
+    """Converts a history file (JSON list or JSONL) to `dst`. Returns the run count."""
+    records = load_history_records(src)
+    # Same suffix as dst so the store picks the same compression
+    tmp_path = os.path.join(os.path.dirname(dst), ".tmp-" + os.path.basename(dst))
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    for make_path in (blobs_path, snapshot_path, index_path):
+        if os.path.exists(make_path(tmp_path)):
+            os.remove(make_path(tmp_path))
+    store = JsonlHistoryStore(tmp_path, fsync_every=len(records) or 1, compact=compact)
+    store.append(records)
+    store.close()
+    for make_path in (blobs_path, snapshot_path, index_path):
+        if os.path.exists(make_path(dst)) and not os.path.exists(make_path(tmp_path)):
+            os.remove(make_path(dst))
+    os.replace(tmp_path, dst)
+    for make_path in (blobs_path, snapshot_path, index_path):
+        if os.path.exists(make_path(tmp_path)):
+            os.replace(make_path(tmp_path), make_path(dst))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert an ACE history file to the append-only JSONL format."
+    )
+    parser.add_argument("src", help="Existing history file (e.g. saki6_history.json)")
+    parser.add_argument("dst", help="Output path ending in .jsonl, .jsonl.gz or .jsonl.zst")
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="Write the compact form (shared blobs stored once, raw stage JSON dropped when it can be rebuilt exactly)"
+    )
+    args = parser.parse_args()
+
+    if not is_jsonl_path(args.dst):
+        parser.error(f"dst must end in one of: {', '.join(JSONL_SUFFIXES)}")
+
+    try:
+        count = convert_history(args.src, args.dst, compact=args.compact)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Error converting {args.src}: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✓ Converted {count} runs from {args.src} to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
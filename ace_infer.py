@@ -0,0 +1,176 @@
+"""
+ace_infer.py
+
+Inference-only serving of a learned playbook.
+
+Once a pipeline's history holds a good playbook, new inputs only need the
+first (execute) stage: no critique, no reflection, no ground truth and no
+history entry per item. This loads the latest playbook snapshot once
+(from the JSONL sidecar, without reading the runs), renders only the
+first stage of each job against that frozen playbook, runs the jobs
+concurrently through the response cache, and appends one JSON line per
+job to the output as soon as it finishes:
+
+    {"id": "...", "status": "ok", "output": {...first stage JSON...}, "metrics": {...}}
+
+Jobs already written with status "ok" are skipped, so an interrupted run
+picks up where it stopped (--force runs everything again).
+
+Jobs come from the config's JOBS or from --jobs: a JSON list or a JSONL
+file of {"id": ..., "inputs": {...}} objects. An object without "inputs"
+is used as the inputs itself.
+
+example:
+    python3 ace_infer.py tang_poet.json --jobs new_poems.jsonl --out translations.jsonl --workers 16
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+from ace_cli import add_pipeline_args, build_pipeline
+from ace_context_cache import ContextCacheManager
+from ace_history import is_jsonl_path, load_history_records, read_restore_state
+from ace_playbook import Playbook, as_playbook
+
+
+def load_playbook(history_file: str) -> Tuple[int, Optional[Dict]]:
+    """
+    Returns (run count, latest playbook snapshot) of a history file. The
+    snapshot keeps the version the learning run gave it, so inference
+    outputs and cache keys carry the same version number.
+    """
+    if is_jsonl_path(history_file):
+        runs, state = read_restore_state(history_file)
+    else:
+        history = load_history_records(history_file)
+        runs, state = len(history), (history[-1] if history else {})
+    playbook = state.get("playbook_snapshot")
+    if playbook and state.get("playbook_snapshot_version") is not None:
+        playbook = as_playbook(dict(playbook), version=state["playbook_snapshot_version"])
+    return runs, playbook
+
+
+def default_history(config_file: str) -> str:
+    base = config_file.replace(".json", "") + "_history"
+    for suffix in (".jsonl", ".jsonl.gz", ".jsonl.zst", ".json"):
+        if os.path.exists(base + suffix):
+            return base + suffix
+    return base + ".jsonl"
+
+
+def load_jobs(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            items = data.get("JOBS", []) if isinstance(data, dict) else data
+    jobs = []
+    for n, item in enumerate(items, 1):
+        job_id = str(item.get("id", f"job{n}"))
+        if "inputs" in item:
+            jobs.append({"id": job_id, "inputs": item["inputs"]})
+        else:
+            jobs.append({"id": job_id, "inputs": {k: v for k, v in item.items() if k != "id"}})
+    return jobs
+
+
+def finished_ids(path: str) -> Set[str]:
+    """Ids already written to the output with status "ok"."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+
+def result_record(job: Dict, run_context: Dict, completed: bool, first_stage_name: str) -> Dict:
+    record = {"id": job["id"], "status": "ok" if completed else "failed"}
+    if completed:
+        record["output"] = run_context.get(f"{first_stage_name}_data")
+    record["metrics"] = run_context.get("job_metrics")
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run only the first stage of a pipeline with its learned playbook.")
+    parser.add_argument("config", help="Path to the pipeline config JSON (STAGES, and JOBS unless --jobs is given)")
+    parser.add_argument("--history", help="History holding the playbook (default: <config>_history.jsonl)")
+    parser.add_argument("--jobs", help="JSON or JSONL file of jobs to run instead of the config's JOBS")
+    parser.add_argument("--out", help="JSONL file results are appended to (default: <config>_results.jsonl)")
+    parser.add_argument("--workers", type=int, default=8, help="Jobs run concurrently (default: 8)")
+    parser.add_argument("--force", action="store_true", help="Also run jobs already in --out")
+    parser.add_argument(
+        "--context-cache", action="store_true",
+        help="Upload the stable prompt prefix (system prompt and the frozen playbook) once as cached content"
+    )
+    add_pipeline_args(parser)
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        stages = config["STAGES"]
+        jobs = load_jobs(args.jobs) if args.jobs else load_jobs(args.config)
+    except (IOError, ValueError, KeyError) as e:
+        print(f"Error: could not load the stages and jobs: {e}")
+        sys.exit(1)
+    first_stage_name = sorted(stages)[0]
+
+    history_file = args.history or default_history(args.config)
+    runs, playbook = load_playbook(history_file)
+    if not playbook:
+        print(f"Error: no playbook snapshot found in {history_file}")
+        sys.exit(1)
+    version = f" v{playbook.version}" if isinstance(playbook, Playbook) else ""
+    print(f"Loaded the playbook{version} learned over {runs} runs from {history_file}")
+
+    out_file = args.out or args.config.replace(".json", "") + "_results.jsonl"
+    done = set() if args.force else finished_ids(out_file)
+    todo = [job for job in jobs if job["id"] not in done]
+    print(f"{len(todo)} jobs to run ({len(jobs) - len(todo)} already in {out_file}), "
+          f"stage '{first_stage_name}' only, {args.workers} workers")
+
+    ace = build_pipeline(args)
+    response_cache = ace.response_cache
+    ace.playbook = playbook
+    if args.context_cache and ace.backend.supports_context_cache:
+        ace.context_cache = ContextCacheManager(ace.backend, args.model)
+
+    completed_jobs = failed_jobs = 0
+    try:
+        with open(out_file, "a", encoding="utf-8") as out:
+            for job, run_context, completed in ace.infer_jobs(todo, stages, workers=args.workers):
+                out.write(json.dumps(result_record(job, run_context, completed, first_stage_name),
+                                     ensure_ascii=False) + "\n")
+                out.flush()
+                completed_jobs += completed
+                failed_jobs += not completed
+    except ValueError as e:
+        # Stage templates that do not fit the jobs (raised before any call)
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if ace.context_cache:
+            ace.context_cache.close()
+            ace.context_cache.print_stats()
+        if response_cache:
+            response_cache.print_stats()
+            response_cache.close()
+
+    print(f"\n{completed_jobs} jobs done, {failed_jobs} failed; results in {out_file}")
+    ace.backend.print_stats()
+    ace.metrics.print_summary()
@@ -0,0 +1,239 @@
+"""
+ace_metrics.py
+
+Per-stage latency, token and cost metrics for AcePipeline.
+
+Every LLM call made by a stage produces a small stats dict (latency, rate
+limiter wait, retries, cache hit, tokens, prompt size) and the stage engine
+adds the JSON parse time. Those per-stage numbers are stored in each
+run_context under "stage_metrics", summed per job under "job_metrics", and
+aggregated for the whole pipeline by PipelineMetrics, which can print a
+summary and export Prometheus text or OpenMetrics files.
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# USD per million tokens (input, output). Adjust to your billing tier.
+# Models without an entry, and backends that are not billed (the stub),
+# are reported at $0.
+PRICING: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemma-3-27b-it": (0.0, 0.0),
+}
+
+# Price of input tokens served from a context cache, relative to PRICING
+CACHED_INPUT_RATE = 0.25
+# Price of batch job calls (see ace_batch), relative to PRICING
+BATCH_RATE = 0.5
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+def estimate_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0,
+                  batch: bool = False) -> float:
+    price_in, price_out = PRICING.get(model_name, (0.0, 0.0))
+    cached_tokens = min(cached_tokens, input_tokens)
+    cost = ((input_tokens - cached_tokens) * price_in + cached_tokens * price_in * CACHED_INPUT_RATE
+            + output_tokens * price_out) / 1_000_000
+    return cost * BATCH_RATE if batch else cost
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty or beyond the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= rank:
+                return bound
+        return None
+
+
+# Counters kept per (stage, model): metric name -> (stats key, help text)
+COUNTERS = {
+    "ace_stage_calls": ("calls", "Stage LLM calls (including cache hits)."),
+    "ace_stage_errors": ("errors", "Stage LLM calls that failed."),
+    "ace_stage_cache_hits": ("cache_hits", "Stage calls answered from the response cache."),
+    "ace_stage_retries": ("retries", "Retries after retryable LLM errors."),
+    "ace_stage_input_tokens": ("input_tokens", "Input tokens sent."),
+    "ace_stage_output_tokens": ("output_tokens", "Output tokens received."),
+    "ace_stage_cached_tokens": ("cached_tokens", "Input tokens served from a context cache."),
+    "ace_stage_prompt_chars": ("prompt_chars", "Characters of system plus user prompt sent."),
+    "ace_stage_cost_usd": ("cost_usd", "Estimated spend in USD (see ace_metrics.PRICING)."),
+}
+
+HISTOGRAMS = {
+    "ace_stage_llm_latency_seconds": ("latency_s", LATENCY_BUCKETS, "LLM call latency."),
+    "ace_stage_queue_wait_seconds": ("queue_wait_s", LATENCY_BUCKETS, "Time spent waiting on the rate limiter."),
+    "ace_stage_parse_seconds": ("parse_s", FAST_BUCKETS, "JSON parse time of the stage response."),
+    "ace_stage_ttft_seconds": ("ttft_s", LATENCY_BUCKETS, "Time to first token of streamed calls."),
+}
+
+
+class PipelineMetrics:
+    """Thread-safe aggregate of stage and job metrics for one pipeline."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._histograms: Dict[Tuple[str, str], Dict[str, Histogram]] = {}
+        self.job_duration = Histogram()
+        self.jobs = 0
+        self.failed_jobs = 0
+
+    def observe_stage(self, stage_name: str, model_name: str, stats: Dict):
+        key = (stage_name, model_name)
+        with self._lock:
+            counters = self._counters.setdefault(key, {name: 0 for name in COUNTERS})
+            counters["ace_stage_calls"] += 1
+            counters["ace_stage_errors"] += 1 if stats.get("error") else 0
+            counters["ace_stage_cache_hits"] += 1 if stats.get("cache_hit") else 0
+            for name in ("ace_stage_retries", "ace_stage_input_tokens", "ace_stage_output_tokens",
+                         "ace_stage_cached_tokens", "ace_stage_prompt_chars", "ace_stage_cost_usd"):
+                counters[name] += stats.get(COUNTERS[name][0], 0) or 0
+
+            histograms = self._histograms.setdefault(
+                key, {name: Histogram(buckets) for name, (_, buckets, _) in HISTOGRAMS.items()}
+            )
+            for name, (stats_key, _, _) in HISTOGRAMS.items():
+                if stats.get(stats_key) is not None:
+                    histograms[name].observe(stats[stats_key])
+
+    def observe_job(self, wall_s: float, completed: bool):
+        with self._lock:
+            self.jobs += 1
+            self.failed_jobs += 0 if completed else 1
+            self.job_duration.observe(wall_s)
+
+    def stage_summary(self) -> List[Dict]:
+        with self._lock:
+            rows = []
+            for (stage_name, model_name), counters in sorted(self._counters.items()):
+                latency = self._histograms[(stage_name, model_name)]["ace_stage_llm_latency_seconds"]
+                rows.append({
+                    "stage": stage_name,
+                    "model": model_name,
+                    "calls": int(counters["ace_stage_calls"]),
+                    "latency_s": latency.total,
+                    "p50_s": latency.quantile(0.5),
+                    "p95_s": latency.quantile(0.95),
+                    "input_tokens": int(counters["ace_stage_input_tokens"]),
+                    "output_tokens": int(counters["ace_stage_output_tokens"]),
+                    "cost_usd": counters["ace_stage_cost_usd"],
+                })
+            return rows
+
+    def print_summary(self):
+        rows = self.stage_summary()
+        print(f"\n{'='*60}\nSTAGE METRICS ({self.jobs} jobs, {self.failed_jobs} failed)\n{'='*60}")
+        if not rows:
+            print("No stage calls recorded.")
+            return
+        total_latency = sum(row["latency_s"] for row in rows) or 1.0
+        total_cost = sum(row["cost_usd"] for row in rows)
+        for row in rows:
+            p95 = f"{row['p95_s']:.2f}s" if row["p95_s"] is not None else "n/a"
+            print(f"  {row['stage']:<24} {row['calls']:>5} calls  {row['latency_s']:8.2f}s "
+                  f"({row['latency_s'] / total_latency:4.0%})  p95<={p95:<8} "
+                  f"in {row['input_tokens']:>8} / out {row['output_tokens']:>7} tok  ${row['cost_usd']:.4f}")
+        print(f"  Total estimated cost: ${total_cost:.4f}")
+
+    def render(self, fmt: str = "prometheus") -> str:
+        """Renders all metrics as Prometheus text (`prometheus`) or OpenMetrics (`openmetrics`)."""
+        openmetrics = fmt == "openmetrics"
+        lines = []
+
+        def labels(stage_name, model_name, extra=""):
+            text = f'stage="{_escape(stage_name)}",model="{_escape(model_name)}"'
+            return "{" + text + (("," + extra) if extra else "") + "}"
+
+        with self._lock:
+            for name, (_, help_text) in COUNTERS.items():
+                family = name if openmetrics else name + "_total"
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} counter")
+                for (stage_name, model_name), counters in sorted(self._counters.items()):
+                    lines.append(f"{name}_total{labels(stage_name, model_name)} {_number(counters[name])}")
+
+            for name, (_, _, help_text) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (stage_name, model_name), histograms in sorted(self._histograms.items()):
+                    lines.extend(_histogram_lines(name, histograms[name], labels(stage_name, model_name)[:-1]))
+
+            lines.append("# HELP ace_job_duration_seconds Wall time per job.")
+            lines.append("# TYPE ace_job_duration_seconds histogram")
+            lines.extend(_histogram_lines("ace_job_duration_seconds", self.job_duration, "{"))
+
+            jobs_family = "ace_jobs" if openmetrics else "ace_jobs_total"
+            lines.append(f"# HELP {jobs_family} Jobs processed.")
+            lines.append(f"# TYPE {jobs_family} counter")
+            lines.append(f'ace_jobs_total{{status="completed"}} {self.jobs - self.failed_jobs}')
+            lines.append(f'ace_jobs_total{{status="failed"}} {self.failed_jobs}')
+
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "prometheus"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render(fmt))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name: str, histogram: Histogram, open_labels: str) -> List[str]:
+    # open_labels is the label set without its closing brace, e.g. '{stage="x"'
+    sep = "," if open_labels != "{" else ""
+    lines = []
+    for bound, cumulative in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{open_labels}{sep}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{open_labels}{sep}le="+Inf"}} {histogram.count}')
+    suffix = "}" if open_labels != "{" else ""
+    if suffix:
+        lines.append(f"{name}_sum{open_labels}}} {_number(histogram.total)}")
+        lines.append(f"{name}_count{open_labels}}} {histogram.count}")
+    else:
+        lines.append(f"{name}_sum {_number(histogram.total)}")
+        lines.append(f"{name}_count {histogram.count}")
+    return lines
+
+
+def summarize_job(stage_metrics: Dict[str, Dict], wall_s: float) -> Dict:
+    """Sums a job's per-stage metrics into its job_metrics entry."""
+    return {
+        "wall_s": wall_s,
+        "llm_calls": len(stage_metrics),
+        "llm_latency_s": round(sum(m.get("latency_s") or 0 for m in stage_metrics.values()), 4),
+        "queue_wait_s": round(sum(m.get("queue_wait_s") or 0 for m in stage_metrics.values()), 4),
+        "input_tokens": sum(m.get("input_tokens") or 0 for m in stage_metrics.values()),
+        "output_tokens": sum(m.get("output_tokens") or 0 for m in stage_metrics.values()),
+        "cached_tokens": sum(m.get("cached_tokens") or 0 for m in stage_metrics.values()),
+        "cost_usd": round(sum(m.get("cost_usd") or 0 for m in stage_metrics.values()), 8),
+        "slowest_stage": max(stage_metrics, key=lambda s: stage_metrics[s].get("latency_s") or 0)
+        if stage_metrics else None,
+    }
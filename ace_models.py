@@ -0,0 +1,108 @@
+"""
+ace_models.py
+
+Shared pool of google.generativeai GenerativeModel instances.
+
+Building a GenerativeModel (and its client) for every call throws away the
+client setup and connection reuse. The pool keeps recently used models,
+keyed by (model_name, system_prompt) or by cached content, and evicts the
+least recently used one once it is full. AcePipeline and the demo scripts share DEFAULT_POOL.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import google.generativeai as genai
+
+_configure_lock = threading.Lock()
+_configured_key = None
+
+
+def configure(api_key: Optional[str]):
+    """Configures the SDK once per API key instead of once per request."""
+    global _configured_key
+    with _configure_lock:
+        if _configured_key is not None and _configured_key == api_key:
+            return
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+
+
+class ModelPool:
+    """LRU pool of GenerativeModel instances with hit/miss counters."""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max(1, max_size)
+        self._models: "OrderedDict[Tuple[str, Optional[str]], genai.GenerativeModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_name: str, system_prompt: Optional[str] = None):
+        return self._get(
+            (model_name, system_prompt),
+            lambda: genai.GenerativeModel(model_name, system_instruction=system_prompt)
+        )
+
+    @staticmethod
+    def _cached_key(cached_content) -> Tuple[str, object]:
+        return ("cached_content", getattr(cached_content, "name", None) or id(cached_content))
+
+    def get_cached(self, cached_content):
+        """Model bound to a cached content (see ace_context_cache), pooled by the content's name."""
+        return self._get(
+            self._cached_key(cached_content),
+            lambda: genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        )
+
+    def discard_cached(self, cached_content):
+        """Drops the model of a deleted cached content."""
+        with self._lock:
+            self._models.pop(self._cached_key(cached_content), None)
+
+    def _get(self, key: Tuple, create: Callable[[], object]):
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            model = create()
+            self._models[key] = model
+            if len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+                self.evictions += 1
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._models),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"[MODEL POOL] {stats['hits']} hits / {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['evictions']} evictions, "
+              f"{stats['size']}/{stats['max_size']} models cached")
+
+
+DEFAULT_POOL = ModelPool()
+
+
+def get_model(model_name: str, system_prompt: Optional[str] = None):
+    return DEFAULT_POOL.get(model_name, system_prompt)
@@ -0,0 +1,75 @@
+"""
+ace_playbook.py
+
+The versioned playbook of an AcePipeline.
+
+Playbook is a plain dict of strategy sections (so it still deep-copies,
+serializes to JSON and restores from history snapshots like before) with
+a `version` that the pipeline bumps after the curator changes it. The
+formatted text of each section is cached for the current version: every
+stage of every job reuses it, so a long run formats the playbook once per
+curator update instead of once per stage call.
+
+Change the strategies through the curator (or call `bump()` afterwards);
+an in-place edit without a bump would keep serving the old text.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from ace_curator import GENERAL_SECTION, section_key, section_title, strategy_sections
+
+NO_STRATEGIES = "No strategies learned yet. This is your first attempt."
+NO_SECTION_STRATEGIES = "No strategies learned yet for this section."
+
+
+def format_playbook(playbook: Dict, section: str = "all", include_general: bool = False) -> str:
+    """
+    Formats one playbook section ("all" for every section). With
+    `include_general` the general process strategies come first.
+    """
+    sections = strategy_sections(playbook)
+    if not any(sections.values()):
+        return NO_STRATEGIES
+
+    if section == "all":
+        keys = list(sections)
+    else:
+        keys = [section_key(section)]
+        if include_general and keys[0] != GENERAL_SECTION:
+            keys.insert(0, GENERAL_SECTION)
+
+    blocks = []
+    for key in keys:
+        if sections.get(key):
+            lines = [f"{section_title(key)} (learned from previous critiques):"]
+            lines.extend(f"{i}. {s}" for i, s in enumerate(sections[key], 1))
+            blocks.append("\n".join(lines) + "\n")
+    return "\n".join(blocks) if blocks else NO_SECTION_STRATEGIES
+
+
+class Playbook(dict):
+
+    def __init__(self, *args, version: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = version
+        self._formatted: Dict[Tuple[int, str, bool], str] = {}
+
+    def bump(self) -> int:
+        """Marks the strategies as changed: drops the formatted text of older versions."""
+        self.version += 1
+        self._formatted = {}
+        return self.version
+
+    def format(self, section: str = "all", include_general: bool = False) -> str:
+        key = (self.version, section, include_general)
+        text = self._formatted.get(key)
+        if text is None:
+            text = self._formatted[key] = format_playbook(self, section, include_general)
+        return text
+
+
+def as_playbook(playbook: Optional[Dict], version: int = 0) -> Playbook:
+    """Wraps a plain dict (e.g. a restored snapshot) as a Playbook."""
+    if isinstance(playbook, Playbook):
+        return playbook
+    return Playbook(playbook or {}, version=version)
@@ -7,25 +7,43 @@ Run ace_print‑style prompts against Tang poems using the latest Google Gemma m
 Usage:
     python ace_poem_demo.py -p [--out-dir /path/to/out]
     python ace_poem_demo.py -s [--out-dir /path/to/out]
+    python ace_poem_demo.py -p --batch-size 8    # 8 poems per request
+    python ace_poem_demo.py -p --jobs 8          # 8 requests in flight, resumable
+
+Outputs are recorded in <out-dir>/manifest.jsonl with the hashes of the
+poem and prompt and the model used; poems whose output is current are
+skipped, so an interrupted or failed run resumes where it left off.
 """
 
 import argparse
+import hashlib
+import importlib.util
+import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 # --------------------------------------------------------------
 # Google Generative AI SDK
 # --------------------------------------------------------------
+# ace_models imports the SDK; check for it first to fail with a clear message
 try:
-    import google.generativeai as genai
-except ImportError:
+    sdk_spec = importlib.util.find_spec("google.generativeai")
+except ModuleNotFoundError:
+    sdk_spec = None
+if sdk_spec is None:
     print(
         "Error: google-generativeai SDK not installed. Run `pip install google-generativeai`.",
         file=sys.stderr,
     )
     sys.exit(1)
 
+import ace_models
+
 # --------------------------------------------------------------
 # Configuration
 # --------------------------------------------------------------
@@ -85,8 +103,8 @@ def write_text(path: Path, content: str):
 # Model interaction
 # --------------------------------------------------------------
 def translate(prompt: str, poem: str) -> str:
-    genai.configure(api_key=os.getenv("GAI_API_KEY"))
-    model = genai.GenerativeModel(GEMMA_MODEL)
+    ace_models.configure(os.getenv("GAI_API_KEY"))
+    model = ace_models.get_model(GEMMA_MODEL)
     try:
         response = model.generate_content([prompt, poem])
         return response.text.strip()
@@ -94,9 +112,178 @@ def translate(prompt: str, poem: str) -> str:
         print(f"Model call failed: {e}", file=sys.stderr)
         return ""
 
+def batch_request(poems: List[Tuple[str, str]]) -> str:
+    """Packs (poem_id, poem) pairs into one input asking for a JSON array back."""
+    lines = [
+        f"Translate each of the {len(poems)} poems below independently, following the instructions above.",
+        "Respond with only a JSON array holding one object per poem, in the same order:",
+        '[{"id": "<poem id>", "translation": "<the translation as a single string>"}]',
+        "",
+    ]
+    for poem_id, poem in poems:
+        lines += [f"=== POEM {poem_id} ===", poem.strip(), ""]
+    return "\n".join(lines)
+
+def parse_batch(text: str, poem_ids: List[str]) -> Dict[str, str]:
+    """
+    Returns {poem_id: translation} for every array item that validates
+    (known id, non-empty string translation). Anything else is dropped so
+    the caller can fall back to a single-poem call for it.
+    """
+    # Tolerate ```json fences or prose around the array
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        poem_id, translation = item.get("id"), item.get("translation")
+        if poem_id in poem_ids and poem_id not in results and isinstance(translation, str) and translation.strip():
+            results[poem_id] = translation.strip()
+    return results
+
+def translate_batch(prompt: str, poems: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Translates several poems with one model call (the prompt is sent once)."""
+    ace_models.configure(os.getenv("GAI_API_KEY"))
+    model = ace_models.get_model(GEMMA_MODEL)
+    try:
+        response = model.generate_content([prompt, batch_request(poems)])
+        return parse_batch(response.text, [poem_id for poem_id, _ in poems])
+    except Exception as e:
+        print(f"Batch model call failed: {e}", file=sys.stderr)
+        return {}
+
+def output_path(out_dir: Path, poem_path: Path, mode: str) -> Path:
+    # Build output file name according to the requested convention
+    if mode == "simple":
+        return out_dir / f"{poem_path.stem}._simple.txt"
+    return out_dir / f"{poem_path.stem}_ace.txt"  # complex prompt
+
+# --------------------------------------------------------------
+# Manifest
+# --------------------------------------------------------------
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class Manifest:
+    """
+    Append-only record of what each output file was produced from
+    (<out-dir>/manifest.jsonl, the last line for an output wins).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        lines = 0
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["output"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        # A line cut short by an interrupted run
+                        continue
+        if lines > 2 * len(self.entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, out_file: Path, input_hash: str, prompt_hash: str, model: str) -> bool:
+        entry = self.entries.get(out_file.name)
+        return (
+            entry is not None
+            and entry.get("status") == "done"
+            and entry.get("input_sha256") == input_hash
+            and entry.get("prompt_sha256") == prompt_hash
+            and entry.get("model") == model
+            and out_file.exists()
+        )
+
+    def record(self, out_file: Path, input_hash: str, prompt_hash: str, model: str, status: str):
+        entry = {
+            "output": out_file.name,
+            "input_sha256": input_hash,
+            "prompt_sha256": prompt_hash,
+            "model": model,
+            "status": status,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            self.entries[out_file.name] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
 # --------------------------------------------------------------
 # Main processing
 # --------------------------------------------------------------
+def run_batch(prompt: str, batch: List[Tuple[Path, str]], out_dir: Path, mode: str,
+              manifest: Manifest, prompt_hash: str) -> Tuple[int, int, List[Tuple[Path, str]]]:
+    """
+    Translates one batch (a single poem when the batch size is 1) and
+    records every output in the manifest.
+    Returns (requests made, single-poem fallbacks, poems that failed).
+    """
+    requests = fallbacks = 0
+    failed = []
+    results = {}
+    if len(batch) > 1:
+        requests += 1
+        results = translate_batch(prompt, [(path.stem, poem) for path, poem in batch])
+        print(f"📦 batch of {len(batch)}: {len(results)} translations validated")
+
+    for poem_path, poem in batch:
+        out_file = output_path(out_dir, poem_path, mode)
+        translation = results.get(poem_path.stem)
+        if translation is None:
+            if len(batch) > 1:
+                fallbacks += 1
+                print(f"↩️  {poem_path.name}: not in batch response, translating on its own")
+            requests += 1
+            translation = translate(prompt, poem)
+        if not translation:
+            manifest.record(out_file, sha256_text(poem), prompt_hash, GEMMA_MODEL, "failed")
+            failed.append((poem_path, poem))
+            continue
+
+        write_text(out_file, translation)
+        manifest.record(out_file, sha256_text(poem), prompt_hash, GEMMA_MODEL, "done")
+        print(f"✔️  {mode} translation written to {out_file}")
+    return requests, fallbacks, failed
+
+def run_corpus(prompt: str, poems: List[Tuple[Path, str]], out_dir: Path, mode: str, manifest: Manifest,
+               batch_size: int, jobs: int) -> Tuple[int, int, List[Tuple[Path, str]]]:
+    """Runs the poems' batches with up to `jobs` requests in flight."""
+    prompt_hash = sha256_text(prompt)
+    batches = [poems[i:i + batch_size] for i in range(0, len(poems), batch_size)]
+    requests = fallbacks = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(run_batch, prompt, batch, out_dir, mode, manifest, prompt_hash)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            batch_requests, batch_fallbacks, batch_failed = future.result()
+            requests += batch_requests
+            fallbacks += batch_fallbacks
+            failed.extend(batch_failed)
+    return requests, fallbacks, sorted(failed)
+
 def main():
     parser = argparse.ArgumentParser(
         description="Translate Tang poems with the latest Gemma model."
@@ -109,7 +296,37 @@ def main():
         default="./output",
         help="Directory where translation files will be written (default: ./output)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        metavar="K",
+        help="Translate K poems per request (default: 1). Poems missing or invalid in a "
+             "batch response are retried with a single-poem call.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of requests in flight at once (default: 1)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Extra passes over poems that failed in this run (default: 1)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Translate every poem, even those whose output in the manifest is current",
+    )
     args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Choose prompt
     prompt = complex_prompt() if args.p else simple_prompt()
@@ -130,23 +347,39 @@ def main():
     out_dir = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # Process each file
+    # Skip poems whose output is current for this poem, prompt and model
+    manifest = Manifest(out_dir / "manifest.jsonl")
+    prompt_hash = sha256_text(prompt)
+    pending = []
     for poem_path in poem_files:
         poem = read_text(poem_path)
         if not poem:
             continue
-        translation = translate(prompt, poem)
-        if not translation:
+        out_file = output_path(out_dir, poem_path, mode)
+        if not args.force and manifest.is_current(out_file, sha256_text(poem), prompt_hash, GEMMA_MODEL):
             continue
+        pending.append((poem_path, poem))
+    print(f"{len(poem_files) - len(pending)} of {len(poem_files)} poems up to date, {len(pending)} to translate")
 
-        # Build output file name according to the requested convention
-        if mode == "simple":
-            out_file = out_dir / f"{poem_path.stem}._simple.txt"
-        else:  # complex prompt
-            out_file = out_dir / f"{poem_path.stem}_ace.txt"
+    # Translate args.batch_size poems per request, args.jobs requests at a time
+    requests = fallbacks = 0
+    failed = pending
+    for attempt in range(args.retries + 1):
+        if not failed:
+            break
+        if attempt:
+            print(f"Retrying {len(failed)} failed poems (pass {attempt + 1})")
+        pass_requests, pass_fallbacks, failed = run_corpus(
+            prompt, failed, out_dir, mode, manifest, args.batch_size, args.jobs
+        )
+        requests += pass_requests
+        fallbacks += pass_fallbacks
 
-        write_text(out_file, translation)
-        print(f"✔️  {mode} translation written to {out_file}")
+    print(f"Requests: {requests} for {len(pending)} poems ({fallbacks} single-poem fallbacks)")
+    if failed:
+        print(f"⚠️  {len(failed)} poems failed; run again to retry them: "
+              f"{', '.join(path.name for path, _ in failed)}")
+    ace_models.DEFAULT_POOL.print_stats()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+"""
+ace_ratelimit.py
+
+Rate limiting and retry policy for LLM calls.
+
+Every model gets one shared RateLimiter (two token buckets: requests per
+minute and tokens per minute), so all concurrent jobs and stages in a
+process draw from the same quota. Calls that fail with a retryable error
+(429 / 5xx / timeouts) are retried with jittered exponential backoff.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+# Per-model limits; models not listed use DEFAULT_RATE_LIMIT.
+# Adjust to your quota tier, or call configure_rate_limit().
+RATE_LIMITS: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-flash": {"requests_per_minute": 1000, "tokens_per_minute": 1_000_000},
+    "gemini-2.5-pro": {"requests_per_minute": 150, "tokens_per_minute": 2_000_000},
+    "gemma-3-27b-it": {"requests_per_minute": 30, "tokens_per_minute": 15_000},
+}
+DEFAULT_RATE_LIMIT = {"requests_per_minute": 60, "tokens_per_minute": 250_000}
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "BadGateway",
+}
+
+
+class LLMCallError(Exception):
+    """Raised when an LLM call fails for good (non-retryable or out of retries)."""
+
+
+def estimate_tokens(*texts: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return max(1, sum(len(text) for text in texts if text) // 4)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    try:
+        return int(code) in RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+class RetryPolicy:
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        return attempt + 1 < self.max_attempts and is_retryable(error)
+
+
+class TokenBucket:
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` from the bucket (the level may go negative) and
+        returns how long the caller must wait before using it.
+        """
+        # Requests larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+    def adjust(self, amount: float):
+        """Corrects an earlier reservation (positive gives tokens back)."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.waited = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        self.waited += wait
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        """Waits for quota; returns the seconds waited."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int) -> float:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def reconcile(self, estimated: int, actual: Optional[int]):
+        """Settles the token estimate against the usage the provider reported."""
+        if actual:
+            self.tokens.adjust(estimated - actual)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(model_name: str, requests_per_minute: float = None, tokens_per_minute: float = None):
+    limits = dict(RATE_LIMITS.get(model_name, DEFAULT_RATE_LIMIT))
+    if requests_per_minute:
+        limits["requests_per_minute"] = requests_per_minute
+    if tokens_per_minute:
+        limits["tokens_per_minute"] = tokens_per_minute
+    RATE_LIMITS[model_name] = limits
+    with _limiters_lock:
+        _limiters.pop(model_name, None)
+
+
+def get_rate_limiter(model_name: str) -> RateLimiter:
+    """Returns the process-wide limiter for `model_name`."""
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            limits = RATE_LIMITS.get(model_name, DEFAULT_RATE_LIMIT)
+            limiter = _limiters[model_name] = RateLimiter(
+                limits["requests_per_minute"], limits["tokens_per_minute"]
+            )
+        return limiter
@@ -1,11 +1,20 @@
+import argparse
 import os
 import sys
 import json
-from ace_util import AcePipeline # 
+from ace_cli import add_pipeline_args, build_pipeline
+from ace_history import convert_history
+from ace_batch import GeminiBatchClient, LocalBatchServer
+from ace_context_cache import ContextCacheManager
+from ace_scheduler import GenerationScheduler
+from ace_convergence import ConvergenceMonitor
+from ace_templates import validate_stages
 
 def load_config_from_json(file_path):
     """
     Loads STAGES and JOBS from a specified JSON config file.
+    Every stage template is compiled and checked against the jobs' inputs
+    and the other stages' outputs, so a bad key fails here, before any call.
     """
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -21,6 +30,13 @@ def load_config_from_json(file_path):
         if not jobs:
             print(f"Error: 'JOBS' key not found in {file_path}")
             return None, None
+
+        errors = validate_stages(stages, jobs)
+        if errors:
+            print(f"Error: {len(errors)} problem(s) in the stage templates of {file_path}:")
+            for error in errors:
+                print(f"  ✗ {error}")
+            return None, None
             
         print(f"Successfully loaded {len(stages)} stages and {len(jobs)} jobs from {file_path}")
         return stages, jobs
@@ -40,34 +56,142 @@ def load_config_from_json(file_path):
 if __name__ == "__main__":
     
     # --- 1. Get Config File from Command Line ---
-    if len(sys.argv) != 2:
-        print("Usage: python run_pipeline.py <path_to_config.json>")
-        sys.exit(1)
-        
-    CONFIG_FILE = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Run an ACE pipeline defined in a JSON config file.")
+    parser.add_argument("config", help="Path to the pipeline config JSON (STAGES and JOBS)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of jobs to run concurrently per generation (default: 1, fully serial). "
+             "Jobs in a generation share a frozen playbook; learned patterns are merged after each generation."
+    )
+    parser.add_argument(
+        "--adaptive", action="store_true",
+        help="Size each generation (up to --workers jobs) from how much the curator is still changing "
+             "the playbook: small while it learns fast, larger once new patterns become rare"
+    )
+    parser.add_argument(
+        "--early-stop", action="store_true",
+        help="Once the playbook has converged (the curator accepts almost nothing new and critique scores "
+             "stop improving), run the remaining jobs through the first stage only"
+    )
+    parser.add_argument(
+        "--converge-window", type=int, default=8, metavar="N",
+        help="Jobs over which --early-stop judges convergence (default: 8)"
+    )
+    parser.add_argument(
+        "--refresh-stage", action="append", default=[], metavar="STAGE",
+        help="Ignore cached responses for STAGE (they are re-fetched and overwritten). May be repeated."
+    )
+    parser.add_argument(
+        "--history-format", choices=["jsonl", "jsonl.gz", "jsonl.zst", "json"], default="jsonl",
+        help="History file format (default: jsonl, append-only). 'json' rewrites a single JSON list after every job."
+    )
+    parser.add_argument(
+        "--full-history", action="store_true",
+        help="Write every JSONL run in full instead of the compact form (shared prompts, ground truth "
+             "and playbooks stored once in <history>.blobs.jsonl; runs are rebuilt exactly on load)"
+    )
+    add_pipeline_args(parser)
+    parser.add_argument(
+        "--stream-stage", action="append", default=[], metavar="STAGE",
+        help="Stream STAGE's response (as stages with \"stream\": true in the config do). May be repeated."
+    )
+    parser.add_argument(
+        "--stream-dir",
+        help="Directory for the outputs of streamed stages, written as they arrive (default: <config>_stream)"
+    )
+    parser.add_argument(
+        "--context-cache", action="store_true",
+        help="Upload stable prompt prefixes (system prompt, playbook, shared ground truth) once as "
+             "cached content and send only the rest of each prompt"
+    )
+    parser.add_argument(
+        "--context-cache-ttl", type=float, default=600,
+        help="Seconds a cached prefix lives without being used (default: 600)"
+    )
+    parser.add_argument(
+        "--context-cache-min-tokens", type=int,
+        help="Smallest prefix worth caching (default: the provider minimum, see ace_context_cache.MIN_CACHE_TOKENS)"
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Send each stage wave of all jobs as one provider batch job (higher latency, lower cost). "
+             "With --backend stub a local file-based batch server answers them."
+    )
+    parser.add_argument(
+        "--batch-dir",
+        help="Directory for batch request files and the local batch server (default: <config>_batches)"
+    )
+    parser.add_argument(
+        "--batch-generation", type=int, metavar="N",
+        help="Jobs per batch generation (default: all jobs, i.e. one playbook update at the end)"
+    )
+    parser.add_argument("--batch-poll", type=float, default=30.0, help="Seconds between batch status polls (default: 30)")
+    parser.add_argument("--batch-timeout", type=float, help="Cancel a batch job still unfinished after this many seconds")
+    parser.add_argument(
+        "--metrics-file", metavar="PATH",
+        help="Write per-stage latency, token and cost metrics here after the run (Prometheus text format)"
+    )
+    parser.add_argument(
+        "--metrics-format", choices=["prometheus", "openmetrics"], default="prometheus",
+        help="Format of --metrics-file (default: prometheus)"
+    )
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.batch_generation is not None and args.batch_generation < 1:
+        parser.error("--batch-generation must be at least 1")
+    if args.batch and (args.adaptive or args.early_stop):
+        parser.error("--adaptive and --early-stop do not apply to --batch (use --batch-generation)")
+
+    CONFIG_FILE = args.config
     
     # --- 2. Load Stages and Jobs from Config ---
     PIPELINE_STAGES, PIPELINE_JOBS = load_config_from_json(CONFIG_FILE)
     
     if not PIPELINE_STAGES or not PIPELINE_JOBS:
         sys.exit(1)
+
+    for stage_name in args.refresh_stage:
+        if stage_name not in PIPELINE_STAGES:
+            print(f"Warning: --refresh-stage '{stage_name}' does not match any stage in {CONFIG_FILE}")
+    for stage_name in args.stream_stage:
+        if stage_name not in PIPELINE_STAGES:
+            print(f"Warning: --stream-stage '{stage_name}' does not match any stage in {CONFIG_FILE}")
         
     # --- 3. Define Constants ---
     # Create a history file name based on the config file name
-    HISTORY_FILE = CONFIG_FILE.replace(".json", "") + "_history.json"
-    
-    API_KEY = os.environ.get("GOOGLE_API_KEY")
-    if not API_KEY:
-        print("Error: GOOGLE_API_KEY environment variable not set.")
-        sys.exit(1)
+    LEGACY_HISTORY_FILE = CONFIG_FILE.replace(".json", "") + "_history.json"
+    HISTORY_FILE = CONFIG_FILE.replace(".json", "") + "_history." + args.history_format
 
+    # Carry an existing JSON-list history over to the append-only format
+    if HISTORY_FILE != LEGACY_HISTORY_FILE and not os.path.exists(HISTORY_FILE) \
+            and os.path.exists(LEGACY_HISTORY_FILE):
+        try:
+            count = convert_history(LEGACY_HISTORY_FILE, HISTORY_FILE, compact=not args.full_history)
+            print(f"Converted {count} runs from {LEGACY_HISTORY_FILE} to {HISTORY_FILE}")
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: could not convert {LEGACY_HISTORY_FILE}: {e}")
+    
     # --- 4. Initialize and Run Pipeline ---
     
     # 1. Initialize the pipeline
-    ace = AcePipeline(api_key=API_KEY)
+    ace = build_pipeline(args, refresh_stages=args.refresh_stage)
+    response_cache = ace.response_cache
+    ace.compact_history = not args.full_history
+    ace.stream_stages = set(args.stream_stage)
+    if args.context_cache:
+        if ace.backend.supports_context_cache:
+            ace.context_cache = ContextCacheManager(
+                ace.backend, args.model, ttl=args.context_cache_ttl, min_tokens=args.context_cache_min_tokens
+            )
+        else:
+            print(f"Warning: the {ace.backend.name} backend does not support context caching")
+    ace.stream_dir = args.stream_dir or CONFIG_FILE.replace(".json", "") + "_stream"
     
     # 2. Load any past history and restore the playbook
-    ace.load_history(HISTORY_FILE)
+    #    (JSONL histories are indexed lazily: past runs stay on disk)
+    ace.load_history(HISTORY_FILE, lazy=args.history_format != "json")
 
     # 3. Dynamically find the name of the *first* stage (e.g., "1_translate" or "1_create_story")
     # This assumes stages are named in order, e.g., "1_...", "2_..."
@@ -79,25 +203,54 @@ if __name__ == "__main__":
         print("Error: 'STAGES' dictionary is empty. Cannot determine first stage.")
         sys.exit(1)
 
-    # 4. Loop through each job and process it
-    all_final_results = []
-    
-    for job in PIPELINE_JOBS:
-        print(f"\n--- Processing Job: {job['id']} ---")
-        run_results = ace.process(
-            pipeline_id=job["id"],
+    # 4. Process the jobs, saving progress after each generation
+    #    (a generation is a single job when --workers is 1)
+    def checkpoint(generation_results):
+        for run_results in generation_results:
+            print(f"--- Completed Job: {run_results['pipeline_id']} ---")
+        ace.save_history(HISTORY_FILE)
+
+    if args.batch:
+        if args.stream_stage or args.context_cache or args.workers > 1:
+            print("Warning: --stream-stage, --context-cache and --workers do not apply to --batch")
+        batch_dir = args.batch_dir or CONFIG_FILE.replace(".json", "") + "_batches"
+        if args.backend == "stub":
+            batch_client = LocalBatchServer(ace.backend, batch_dir)
+        else:
+            try:
+                batch_client = GeminiBatchClient(os.environ.get("GOOGLE_API_KEY"))
+            except ImportError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        all_runs = ace.process_jobs_batch(
+            PIPELINE_JOBS,
             stages=PIPELINE_STAGES,
-            inputs=job.get("inputs", {}),
-            ground_truth=job.get("ground_truth", {})
+            client=batch_client,
+            batch_dir=batch_dir,
+            generation_size=args.batch_generation,
+            poll_interval=args.batch_poll,
+            timeout=args.batch_timeout,
+            on_generation=checkpoint
         )
-        
-        # Save the "final" data (output from the first stage)
-        final_data = run_results.get(first_stage_data_key, {})
-        all_final_results.append(final_data)
-        
-        # Save progress after each job
-        ace.save_history(HISTORY_FILE)
-        print(f"--- Completed Job: {job['id']} ---")
+    else:
+        scheduler = GenerationScheduler(max_size=args.workers) if args.adaptive else None
+        monitor = ConvergenceMonitor(window=args.converge_window) if args.early_stop else None
+        all_runs = ace.process_jobs(
+            PIPELINE_JOBS,
+            stages=PIPELINE_STAGES,
+            workers=args.workers,
+            on_generation=checkpoint,
+            scheduler=scheduler,
+            monitor=monitor
+        )
+        if scheduler:
+            scheduler.print_stats()
+        if monitor:
+            monitor.print_stats()
+    ace.close_history()
+
+    # Save the "final" data (output from the first stage)
+    all_final_results = [run_results.get(first_stage_data_key, {}) for run_results in all_runs]
 
 
     # --- 5. SHOW RESULTS ---
@@ -113,3 +266,14 @@ if __name__ == "__main__":
         
     # Show how the playbook grew
     ace.show_playbook_evolution()
+    ace.backend.print_stats()
+    if ace.context_cache:
+        ace.context_cache.close()
+        ace.context_cache.print_stats()
+    ace.metrics.print_summary()
+    if args.metrics_file:
+        ace.metrics.write(args.metrics_file, args.metrics_format)
+        print(f"Metrics written to {args.metrics_file} ({args.metrics_format})")
+    if response_cache:
+        response_cache.print_stats()
+        response_cache.close()
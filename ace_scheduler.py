@@ -0,0 +1,63 @@
+"""
+ace_scheduler.py
+
+Adaptive generation sizes for AcePipeline.process_jobs.
+
+Jobs of a generation run in parallel against one frozen playbook, so a
+large generation is fast but its later jobs miss what the earlier ones
+taught the curator. How much they miss depends on how much the playbook
+is still changing. GenerationScheduler measures that churn (strategies the
+curator added or reworded per completed job, smoothed) and sizes the
+next generation from it:
+
+    churn <= low_churn    the playbook has settled: grow the generation by half
+    churn >= high_churn   it is still being rewritten: halve the generation
+    otherwise             keep the size
+
+so a run starts almost serial while the playbook learns fast and widens
+to `max_size` once new patterns become rare.
+"""
+
+from typing import Dict, List, Optional
+
+from ace_curator import strategy_sections
+
+
+def playbook_churn(before: Dict, after: Dict) -> int:
+    """Strategies in `after` that were not in `before` (added or reworded by a merge)."""
+    old = {text for strategies in strategy_sections(before).values() for text in strategies}
+    return sum(1 for strategies in strategy_sections(after).values() for text in strategies if text not in old)
+
+
+class GenerationScheduler:
+
+    def __init__(self, max_size: int, min_size: int = 1, initial_size: Optional[int] = None,
+                 low_churn: float = 0.25, high_churn: float = 1.0, smoothing: float = 0.5):
+        self.max_size = max(1, max_size)
+        self.min_size = max(1, min(min_size, self.max_size))
+        self.size = min(self.max_size, max(self.min_size, initial_size or self.min_size))
+        self.low_churn = low_churn
+        self.high_churn = high_churn
+        self.smoothing = smoothing
+        self.churn: Optional[float] = None
+        self.sizes: List[int] = []
+
+    def next_size(self) -> int:
+        self.sizes.append(self.size)
+        return self.size
+
+    def observe(self, churns: List[int]):
+        """Feeds back the churn of each completed job of the last generation."""
+        if not churns:
+            return
+        churn = sum(churns) / len(churns)
+        self.churn = churn if self.churn is None else self.churn + self.smoothing * (churn - self.churn)
+        if self.churn <= self.low_churn:
+            self.size = min(self.max_size, self.size + max(1, self.size // 2))
+        elif self.churn >= self.high_churn:
+            self.size = max(self.min_size, self.size // 2)
+
+    def print_stats(self):
+        if self.sizes:
+            print(f"[SCHEDULER] {len(self.sizes)} generations, sizes {self.sizes[0]} -> {self.sizes[-1]} "
+                  f"(max {max(self.sizes)}), churn {self.churn or 0.0:.2f} strategies/job")
@@ -0,0 +1,385 @@
+"""
+ace_server.py
+
+A long-running local HTTP service for one pipeline config.
+
+Every run of ace_run_pipeline.py or ace_poem_demo.py pays for Python
+startup, the SDK import, config parsing and loading the history before
+its first call. This daemon pays for them once: it keeps an AcePipeline
+with its playbook in memory and accepts work over HTTP (TCP, or a Unix
+socket with --unix-socket).
+
+    GET  /health     status, playbook version and request counters
+    GET  /playbook   the current playbook
+    GET  /metrics    stage metrics in the Prometheus text format
+    POST /infer      {"id": ..., "inputs": {...}}: the first stage only,
+                     against the current playbook (see ace_infer.py)
+    POST /jobs       {"jobs": [{"id", "inputs", "ground_truth"}, ...]}: the
+                     full pipeline with learning; runs one submission at a
+                     time and appends to the history
+
+Identical requests in flight at the same time (same inputs, same
+playbook version) are coalesced: they all wait for one execution. /infer
+requests arriving within --batch-window seconds of each other are run as
+one batch through AcePipeline.infer_jobs, --workers at a time.
+
+example:
+    python3 ace_server.py tang_poet.json --port 8765 --workers 16 &
+    curl -s localhost:8765/infer -d '{"id": "p1", "inputs": {"title_cn": "...", "original_chinese": "..."}}'
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ace_cli import add_pipeline_args, build_pipeline
+from ace_curator import strategy_sections
+from ace_templates import validate_stages
+from ace_util import AcePipeline, inference_stages
+
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# Pending connections the listening socket queues (socketserver's default is 5)
+LISTEN_BACKLOG = 128
+
+
+class Coalescer:
+    """Runs one execution per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self.coalesced = 0
+
+    def run(self, key: str, execute: Callable[[], object]):
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if owner:
+            try:
+                future.set_result(execute())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+        return future.result()
+
+
+class InferBatcher:
+    """
+    Collects /infer jobs for up to `window` seconds (or `max_batch` jobs)
+    and runs each batch through AcePipeline.infer_jobs.
+    """
+
+    def __init__(self, ace: AcePipeline, stages: Dict[str, Dict], workers: int,
+                 window: float = 0.01, max_batch: int = 64):
+        self.ace = ace
+        # The playbook batches run against (AceService publishes it)
+        self.playbook = copy.deepcopy(ace.playbook)
+        self.stages = stages
+        self.workers = workers
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Tuple[Dict, Future]]" = queue.Queue()
+        # Batches run on their own threads so collection goes on meanwhile
+        self._runner = ThreadPoolExecutor(max_workers=4)
+        self.batches = 0
+        self.batched_jobs = 0
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def submit(self, job: Dict) -> Dict:
+        future: Future = Future()
+        self._queue.put((job, future))
+        return future.result()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.batched_jobs += len(batch)
+            self._runner.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[Dict, Future]]):
+        futures = {id(job): future for job, future in batch}
+        try:
+            for job, run_context, completed in self.ace.infer_jobs(
+                    [job for job, _ in batch], self.stages, workers=self.workers, playbook=self.playbook):
+                futures.pop(id(job)).set_result(job_result(job, run_context, completed, self.stages))
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+
+
+def job_result(job: Dict, run_context: Dict, completed: bool, stages: Dict[str, Dict]) -> Dict:
+    first_stage_name = sorted(stages)[0]
+    result = {
+        "id": job["id"],
+        "status": "ok" if completed else "failed",
+        "playbook_version": run_context.get("playbook_version"),
+    }
+    if completed:
+        result["output"] = run_context.get(f"{first_stage_name}_data")
+    result["metrics"] = run_context.get("job_metrics")
+    return result
+
+
+def request_key(kind: str, payload, playbook_version: int) -> str:
+    text = json.dumps([kind, payload, playbook_version], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AceService:
+
+    def __init__(self, ace: AcePipeline, stages: Dict[str, Dict], history_file: Optional[str],
+                 workers: int = 8, batch_window: float = 0.01, max_batch: int = 64):
+        self.ace = ace
+        self.stages = stages
+        self.history_file = history_file
+        self.workers = workers
+        self.coalescer = Coalescer()
+        self.batcher = InferBatcher(ace, stages, workers, batch_window, max_batch)
+        # Learning runs change the playbook: one submission at a time
+        self._learn_lock = threading.Lock()
+        # Guards the request counter, bumped from every handler thread
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def published(self):
+        """The latest playbook no learning run is changing: what /infer and the GET routes see."""
+        return self.batcher.playbook
+
+    def _publish(self, generation_results=None):
+        # Called between generations, while the curator is not running
+        self.batcher.playbook = copy.deepcopy(self.ace.playbook)
+
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "playbook_version": self.published.version,
+            "strategies": sum(len(s) for s in strategy_sections(self.published).values()),
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "coalesced": self.coalescer.coalesced,
+            "infer_batches": self.batcher.batches,
+            "infer_batched_jobs": self.batcher.batched_jobs,
+        }
+
+    def playbook(self) -> Dict:
+        return {"version": self.published.version, "playbook": dict(self.published)}
+
+    def infer(self, body: Dict) -> Dict:
+        inputs = body.get("inputs")
+        if not isinstance(inputs, dict):
+            raise ValueError("'inputs' must be an object")
+        key = request_key("infer", inputs, self.published.version)
+        job = {"id": str(body.get("id", key[:12])), "inputs": inputs}
+        errors = validate_stages(inference_stages(self.stages), [job])
+        if errors:
+            raise ValueError("; ".join(errors))
+        result = self.coalescer.run(key, lambda: self.batcher.submit(job))
+        return dict(result, id=job["id"])
+
+    def jobs(self, body: Dict) -> Dict:
+        jobs = body.get("jobs")
+        if not isinstance(jobs, list) or not jobs or not all(isinstance(job, dict) and "id" in job for job in jobs):
+            raise ValueError("'jobs' must be a non-empty list of objects with an 'id'")
+        errors = validate_stages(self.stages, jobs)
+        if errors:
+            raise ValueError("; ".join(errors))
+        key = request_key("jobs", jobs, self.ace.playbook_version)
+        return self.coalescer.run(key, lambda: self._learn(jobs))
+
+    def _learn(self, jobs: List[Dict]) -> Dict:
+        with self._learn_lock:
+            runs = self.ace.process_jobs(jobs, self.stages, workers=min(self.workers, len(jobs)),
+                                         on_generation=self._publish)
+            if self.history_file:
+                self.ace.save_history(self.history_file)
+        return {
+            "results": [job_result({"id": run["pipeline_id"]}, run, "playbook_snapshot" in run, self.stages)
+                        for run in runs],
+            "playbook_version": self.ace.playbook_version,
+        }
+
+
+class AceRequestHandler(BaseHTTPRequestHandler):
+
+    server_version = "AceServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, code: int, body, content_type: str = "application/json", close: bool = False):
+        data = body.encode("utf-8") if isinstance(body, str) else \
+            json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if close:
+            # The request body was not read: it must not be parsed as the next request
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send(200, service.health())
+        elif self.path == "/playbook":
+            self._send(200, service.playbook())
+        elif self.path == "/metrics":
+            self._send(200, service.ace.metrics.render("prometheus"), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        routes = {"/infer": service.infer, "/jobs": service.jobs}
+        if self.path not in routes:
+            self._send(404, {"error": f"unknown path {self.path}"}, close=True)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self._send(400, {"error": "a valid Content-Length header is required"}, close=True)
+            return
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"error": "request body too large"}, close=True)
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("the request body must be a JSON object")
+        except ValueError as e:
+            self._send(400, {"error": f"invalid JSON: {e}"})
+            return
+        service.count_request()
+        try:
+            self._send(200, routes[self.path](body))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class TCPHTTPServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def make_server(service: AceService, host: str = "127.0.0.1", port: int = 8765,
+                unix_socket: Optional[str] = None, verbose: bool = False):
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, AceRequestHandler)
+    else:
+        server = TCPHTTPServer((host, port), AceRequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an ACE pipeline over local HTTP.")
+    parser.add_argument("config", help="Path to the pipeline config JSON (its STAGES are served)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--unix-socket", metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=8, help="Jobs run concurrently (default: 8)")
+    parser.add_argument(
+        "--batch-window", type=float, default=0.01,
+        help="Seconds /infer requests are collected into one batch (default: 0.01)"
+    )
+    parser.add_argument("--max-batch", type=int, default=64, help="Largest /infer batch (default: 64)")
+    parser.add_argument("--history", help="History to load the playbook from and append /jobs runs to "
+                                          "(default: <config>_history.jsonl)")
+    add_pipeline_args(parser)
+    parser.add_argument("--verbose", action="store_true", help="Log every HTTP request")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            stages = json.load(f)["STAGES"]
+    except (IOError, ValueError, KeyError) as e:
+        print(f"Error: could not load STAGES from {args.config}: {e}")
+        sys.exit(1)
+    errors = validate_stages(stages)
+    if errors:
+        for error in errors:
+            print(f"  ✗ {error}")
+        sys.exit(1)
+
+    ace = build_pipeline(args)
+    response_cache = ace.response_cache
+    history_file = args.history or args.config.replace(".json", "") + "_history.jsonl"
+    ace.load_history(history_file, lazy=True)
+
+    service = AceService(ace, stages, history_file, workers=args.workers,
+                         batch_window=args.batch_window, max_batch=args.max_batch)
+    server = make_server(service, args.host, args.port, args.unix_socket, args.verbose)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"\n[SERVER] Serving {args.config} on {where} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[SERVER] Shutting down...")
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+        ace.close_history()
+        if response_cache:
+            response_cache.print_stats()
+            response_cache.close()
@@ -0,0 +1,150 @@
+"""
+ace_stream.py
+
+Streaming support for long-output stages.
+
+A streamed stage call feeds every chunk the backend produces into a
+StreamSink, which:
+
+  - records the time to the first token,
+  - appends the chunk to <stream_dir>/<job>.<stage>.partial.json (flushed
+    per chunk, so a dropped connection leaves the partial output on disk;
+    the file is renamed to .json once the response is complete). A retry
+    first moves the failed attempt's file to .partial.<n>.json, so the
+    output of every dropped attempt is kept,
+  - passes the chunk and the running length to an optional callback so
+    consumers can start early,
+  - checks the JSON envelope incrementally (JsonEnvelope), so a response
+    that is not a JSON document fails as soon as that is known instead of
+    after the whole story has been generated.
+"""
+
+import os
+import re
+import time
+from typing import Callable, List, Optional
+
+from ace_backends import LLMResponse
+
+# Called as callback(stage_name, chunk_text, chars_so_far): consumers that
+# need the text so far keep their own buffer of the chunks
+StreamCallback = Callable[[Optional[str], str, int], None]
+
+
+class JsonEnvelope:
+    """Incremental structural check of a streamed JSON document."""
+
+    def __init__(self):
+        self._closers: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text: str):
+        """Raises ValueError as soon as the text cannot be a single JSON object or array."""
+        for ch in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch.isspace():
+                continue
+            if self.complete:
+                raise ValueError("data after the end of the JSON document")
+            if not self.started:
+                if ch not in "{[":
+                    raise ValueError(f"response does not start with a JSON object or array (got {ch!r})")
+                self.started = True
+            if ch == "{":
+                self._closers.append("}")
+            elif ch == "[":
+                self._closers.append("]")
+            elif ch in "}]":
+                if not self._closers or self._closers.pop() != ch:
+                    raise ValueError(f"unbalanced {ch!r} in JSON response")
+                if not self._closers:
+                    self.complete = True
+            elif ch == '"':
+                self._in_string = True
+
+
+def stream_path(stream_dir: str, stream_id: str) -> str:
+    """Final output path of a streamed call; the partial file adds `.partial`."""
+    return os.path.join(stream_dir, re.sub(r"[^\w.-]", "_", stream_id) + ".json")
+
+
+class StreamSink:
+
+    def __init__(self, stage_name: Optional[str] = None, path: Optional[str] = None,
+                 callback: Optional[StreamCallback] = None):
+        self.stage_name = stage_name
+        self.path = path
+        self.callback = callback
+        self.envelope = JsonEnvelope()
+        self.ttft: Optional[float] = None
+        self._parts: List[str] = []
+        self.chars = 0
+        self._usage: Optional[LLMResponse] = None
+        self._start = time.perf_counter()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(self._partial_path()):
+                self._keep_previous_attempt()
+            self._file = open(self._partial_path(), "w", encoding="utf-8")
+
+    def _partial_path(self, attempt: Optional[int] = None) -> str:
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.partial{ext}" if attempt is None else f"{root}.partial.{attempt}{ext}"
+
+    def _keep_previous_attempt(self):
+        attempt = 1
+        while os.path.exists(self._partial_path(attempt)):
+            attempt += 1
+        os.replace(self._partial_path(), self._partial_path(attempt))
+
+    def feed(self, chunk: LLMResponse):
+        if chunk.total_tokens or chunk.prompt_tokens:
+            self._usage = chunk
+        if not chunk.text:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._start
+        self._parts.append(chunk.text)
+        self.chars += len(chunk.text)
+        if self._file:
+            self._file.write(chunk.text)
+            self._file.flush()
+        self.envelope.feed(chunk.text)
+        if self.callback:
+            self.callback(self.stage_name, chunk.text, self.chars)
+
+    def finish(self) -> LLMResponse:
+        """
+        Returns the assembled response. A stream that ends before the JSON
+        document is complete raises ConnectionError (retryable): the
+        connection was most likely dropped.
+        """
+        if not self.envelope.complete:
+            self.abort()
+            raise ConnectionError(
+                f"stream ended after {self.chars} chars, before the JSON document was complete"
+            )
+        if self._file:
+            self._file.close()
+            self._file = None
+            os.replace(self._partial_path(), self.path)
+        usage = self._usage or LLMResponse("")
+        return LLMResponse("".join(self._parts), prompt_tokens=usage.prompt_tokens,
+                           output_tokens=usage.output_tokens, total_tokens=usage.total_tokens)
+
+    def abort(self):
+        """Closes the partial file, leaving what was received on disk."""
+        if self._file:
+            self._file.close()
+            self._file = None
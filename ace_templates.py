@@ -0,0 +1,201 @@
+"""
+ace_templates.py
+
+Precompiled stage prompt templates.
+
+A user_prompt_template is parsed once (compile_template caches it by its
+text) into its literal text and fields, which render() concatenates
+without re-parsing the template on every call; the parse also gives the
+run-context keys the template needs. Those keys give the dependencies
+between stages (stage_dependencies) and so the waves of stages that can
+run concurrently (stage_waves).
+
+validate_stages checks every template of a config against the job inputs
+and the outputs of the other stages before any LLM call is made, so a
+typo fails the run at load time instead of after the earlier stages of
+every job have been paid for.
+"""
+
+import functools
+import string
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Keys AcePipeline puts in every run context
+BUILTIN_KEYS = frozenset({"pipeline_id", "ground_truth_json", "playbook"})
+STAGE_OUTPUT_SUFFIXES = ("_json", "_data", "_system_prompt")
+
+
+class CompiledTemplate:
+
+    def __init__(self, template: str):
+        self.template = template
+        self.fields: Tuple[str, ...] = ()
+        self.error: Optional[str] = None
+        fields = []
+        # (literal text, context key, field template): plain "{key}" fields are
+        # looked up directly; attributes, indexes, conversions and format specs
+        # keep a one-field template rendered by str.format_map
+        parts: List[Tuple[str, Optional[str], Optional[str]]] = []
+        try:
+            for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+                if field_name is None:
+                    parts.append((literal, None, None))
+                    continue
+                fields.append(field_name)
+                if format_spec and "{" in format_spec:
+                    fields.extend(f for _, f, _, _ in string.Formatter().parse(format_spec) if f)
+                if format_spec or conversion or not field_name or field_name.isdigit() \
+                        or "." in field_name or "[" in field_name:
+                    field = "{" + field_name + (f"!{conversion}" if conversion else "") \
+                        + (f":{format_spec}" if format_spec else "") + "}"
+                    parts.append((literal, None, field))
+                else:
+                    parts.append((literal, field_name, None))
+        except ValueError as e:
+            self.error = str(e)
+        self.fields = tuple(fields)
+        self._parts = tuple(parts)
+        # "{2_critique_data[main_critique]}" needs "2_critique_data"
+        self.required_keys: FrozenSet[str] = frozenset(
+            field.split(".")[0].split("[")[0] for field in self.fields
+        )
+
+    def render(self, context: Dict) -> str:
+        """
+        Renders against a run context from the pre-parsed parts, with the
+        result str.format_map gives; a missing key raises KeyError as it does.
+        """
+        if self.error:
+            raise ValueError(self.error)
+        out = []
+        for literal, key, field in self._parts:
+            out.append(literal)
+            if key is not None:
+                value = context[key]
+                out.append(value if type(value) is str else format(value, ""))
+            elif field is not None:
+                out.append(field.format_map(context))
+        return "".join(out)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
+def stage_dependencies(stages: Dict[str, Dict]) -> Dict[str, List[str]]:
+    """
+    Returns the stages each stage depends on: the explicit `depends_on`
+    list from its config plus every stage whose `{stage}_json` or
+    `{stage}_data` output its user_prompt_template references.
+    """
+    outputs = {}
+    for stage_name in stages:
+        outputs[f"{stage_name}_json"] = stage_name
+        outputs[f"{stage_name}_data"] = stage_name
+
+    dependencies = {}
+    for stage_name, stage_def in stages.items():
+        depends_on = list(stage_def.get("depends_on", []))
+        for dep in depends_on:
+            if dep not in stages:
+                raise ValueError(f"Stage '{stage_name}' depends on unknown stage '{dep}'")
+        for key in sorted(compile_template(stage_def.get("user_prompt_template", "")).required_keys):
+            dep = outputs.get(key)
+            if dep and dep != stage_name and dep not in depends_on:
+                depends_on.append(dep)
+        dependencies[stage_name] = sorted(depends_on)
+    return dependencies
+
+
+_waves_cache: Dict[Tuple, List[List[str]]] = {}
+
+
+def stage_waves(stages: Dict[str, Dict]) -> List[List[str]]:
+    """
+    Groups stages into waves: every stage runs in the wave after the last
+    of its dependencies, so stages within a wave are independent and can
+    run concurrently. Stages keep their lexical order within a wave.
+    Waves are computed once per distinct set of stage definitions.
+    """
+    key = tuple(
+        (stage_name, stage_def.get("user_prompt_template", ""), tuple(stage_def.get("depends_on", [])))
+        for stage_name, stage_def in sorted(stages.items())
+    )
+    waves = _waves_cache.get(key)
+    if waves is None:
+        waves = _waves_cache[key] = _compute_waves(stages)
+    return [list(wave) for wave in waves]
+
+
+def _compute_waves(stages: Dict[str, Dict]) -> List[List[str]]:
+    dependencies = stage_dependencies(stages)
+    level = {}
+
+    def resolve(stage_name, visiting):
+        if stage_name in level:
+            return level[stage_name]
+        if stage_name in visiting:
+            raise ValueError(f"Stage dependency cycle through '{stage_name}'")
+        visiting.add(stage_name)
+        level[stage_name] = 1 + max(
+            (resolve(dep, visiting) for dep in dependencies[stage_name]), default=-1
+        )
+        visiting.discard(stage_name)
+        return level[stage_name]
+
+    for stage_name in sorted(stages):
+        resolve(stage_name, set())
+
+    waves = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for stage_name in sorted(stages):
+        waves[level[stage_name]].append(stage_name)
+    return waves
+
+
+def validate_stages(stages: Dict[str, Dict], jobs: Optional[List[Dict]] = None) -> List[str]:
+    """
+    Returns every problem found in the stage templates: malformed templates,
+    positional fields, keys that neither the job inputs, the pipeline nor
+    another stage provide, and dependency cycles. Without `jobs` the
+    inputs are not checked. An empty list means the config can run.
+    """
+    errors = []
+    stage_outputs = {f"{stage_name}{suffix}" for stage_name in stages for suffix in STAGE_OUTPUT_SUFFIXES}
+    jobs = jobs or []
+    input_keys = [set(job.get("inputs", {})) for job in jobs]
+    all_inputs = set().union(*input_keys) if input_keys else set()
+
+    for stage_name, stage_def in sorted(stages.items()):
+        template = stage_def.get("user_prompt_template")
+        if not isinstance(template, str):
+            errors.append(f"Stage '{stage_name}': no user_prompt_template")
+            continue
+        if "system_prompt" not in stage_def:
+            errors.append(f"Stage '{stage_name}': no system_prompt")
+        compiled = compile_template(template)
+        if compiled.error:
+            errors.append(f"Stage '{stage_name}': malformed template ({compiled.error}); "
+                          f"write literal braces as '{{{{' and '}}}}'")
+            continue
+        for key in sorted(compiled.required_keys):
+            if key == "" or key.isdigit():
+                errors.append(f"Stage '{stage_name}': positional field '{{{key}}}' (fields must be named)")
+            elif key in (f"{stage_name}_json", f"{stage_name}_data"):
+                errors.append(f"Stage '{stage_name}': uses its own output '{{{key}}}'")
+            elif key in BUILTIN_KEYS or key in stage_outputs or not jobs:
+                continue
+            elif key not in all_inputs:
+                hint = " (JSON in a template needs its braces doubled: '{{' and '}}')" \
+                    if '"' in key or ":" in key or "\n" in key else ""
+                errors.append(f"Stage '{stage_name}': unknown key '{{{key}}}'{hint}")
+            else:
+                missing = [str(job.get("id")) for job, keys in zip(jobs, input_keys) if key not in keys]
+                if missing:
+                    errors.append(f"Stage '{stage_name}': input '{key}' missing from job(s) {', '.join(missing)}")
+
+    try:
+        stage_waves(stages)
+    except ValueError as e:
+        errors.append(str(e))
+    return errors
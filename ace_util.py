@@ -1,8 +1,32 @@
+import asyncio
+import copy
+import itertools
 import json
-import google.generativeai as genai
-from typing import Dict, Any, List
+from ace_backends import GeminiBackend, LLMBackend, LLMResponse
+from ace_batch import SUCCEEDED, BatchClient, wait_for, write_requests
+from ace_cache import ResponseCache
+from ace_context_cache import ContextCacheManager
+from ace_convergence import ConvergenceMonitor
+from ace_curator import GENERAL_SECTION, STATE_KEY, CuratorEngine, route_patterns, section_title, strategy_sections
+from ace_playbook import Playbook, as_playbook, format_playbook
+from ace_scheduler import GenerationScheduler, playbook_churn
+from ace_metrics import PipelineMetrics, estimate_cost, summarize_job
+from ace_stream import StreamCallback, StreamSink, stream_path
+from ace_templates import compile_template, stage_waves, validate_stages
+from ace_ratelimit import LLMCallError, RetryPolicy, estimate_tokens, get_rate_limiter, is_retryable
+from ace_history import JsonlHistoryStore, LazyHistory, is_jsonl_path, load_history_records, read_restore_state
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Any, Generator, Iterator, List, Optional, Tuple
 import os
 import time
+import uuid
+
+
+def inference_stages(stages: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Only the first (execute) stage: what a job needs once the playbook is no longer learning."""
+    first_stage_name = sorted(stages)[0]
+    return {first_stage_name: stages[first_stage_name]}
+
 
 class AcePipeline:
     """
@@ -11,46 +35,277 @@ class AcePipeline:
     (Full class code from our previous conversation)
     """
     
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
+    def __init__(self, api_key: Optional[str] = None, model_name: str = "gemini-2.5-flash",
+                 model_pool=None,
+                 response_cache: Optional[ResponseCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 backend: Optional[LLMBackend] = None):
         print(f"Initializing AcePipeline with model: {model_name}")
         self.model_name = model_name
-        self._setup_client(api_key)
-        self.playbook = {
+        # Gemini unless another backend (e.g. ace_backends.StubBackend) is given
+        self.backend = backend or GeminiBackend(api_key, model_pool=model_pool)
+        print(f"  Backend: {self.backend.name}")
+        self.response_cache = response_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Shared by every pipeline, job and stage using this model
+        self.rate_limiter = get_rate_limiter(model_name)
+        self._playbook = Playbook({
             "process_strategies": [],
             "critique_strategies": [],
-        }
+        })
+        # Near-duplicate merging and utility-based eviction (see ace_curator)
+        self.curator_engine = CuratorEngine()
         self.history = []
+        # JSONL history path -> number of runs already written there
+        self._history_saved = {}
+        self._history_stores = {}
+        # Write JSONL histories in the compact, content-addressed form
+        self.compact_history = False
+        # Per-stage latency / token / cost aggregates (see ace_metrics)
+        self.metrics = PipelineMetrics()
+        # Streaming (see ace_stream): stages streamed in addition to those
+        # with "stream": true, where partial outputs are written, and a
+        # callback receiving every chunk (called from worker threads)
+        self.stream_stages = set()
+        self.stream_dir: Optional[str] = None
+        self.stream_callback: Optional[StreamCallback] = None
+        # Provider-side caching of stable prompt prefixes (see ace_context_cache)
+        self.context_cache: Optional[ContextCacheManager] = None
+
+    @property
+    def playbook(self) -> Playbook:
+        return self._playbook
 
-    def _setup_client(self, api_key: str):
+    @playbook.setter
+    def playbook(self, playbook: Dict):
+        # A replaced playbook (e.g. restored from history) is a new version
+        if playbook is not self._playbook:
+            playbook = as_playbook(playbook, version=self._playbook.version + 1)
+            # Older histories kept the curator statistics inside the playbook
+            legacy_state = playbook.pop(STATE_KEY, None)
+            if legacy_state:
+                self.curator_engine.state = legacy_state
+        self._playbook = playbook
+
+    @property
+    def playbook_version(self) -> int:
+        """Bumped whenever the curator changes the playbook."""
+        return self._playbook.version
+
+    def _cached_response(self, system_prompt: str, user_prompt: str, temperature: float,
+                         stage_name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        if self.response_cache is None:
+            return None, None
+        key = ResponseCache.make_key(self.model_name, system_prompt, user_prompt, temperature, self.backend.name)
+        cached = self.response_cache.get(key, stage_name)
+        if cached is not None:
+            print(f"  ... Cache hit for {self.model_name} (Temp: {temperature})")
+        return key, cached
+
+    def _store_response(self, key: Optional[str], response_text: str, stage_name: Optional[str]):
+        if key is None:
+            return
+        # Never cache a response the stage could not parse
         try:
-            genai.configure(api_key=api_key)
-        except Exception as e:
-            print(f"Error configuring Google AI: {e}")
-            raise
-        self.generation_config = genai.GenerationConfig(
-            response_mime_type="application/json", 
-        )
+            json.loads(response_text)
+        except (TypeError, ValueError):
+            return
+        self.response_cache.put(key, response_text, self.model_name, stage_name)
 
-    def _call_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.1) -> str:
-        start_time = time.time()
+    def _usage_stats(self, system_prompt: str, user_prompt: str, response, call_time: float,
+                     batch: bool = False) -> Dict:
+        # Backends that do not report usage get the chars/4 estimate
+        input_tokens = response.prompt_tokens or estimate_tokens(system_prompt, user_prompt)
+        output_tokens = response.output_tokens or estimate_tokens(response.text)
+        cost = 0.0
+        if self.backend.billed:
+            cost = estimate_cost(self.model_name, input_tokens, output_tokens, response.cached_tokens or 0,
+                                 batch=batch)
+        return {
+            "latency_s": round(call_time, 4),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "tokens_estimated": response.prompt_tokens is None,
+            "cached_tokens": response.cached_tokens or 0,
+            "cost_usd": round(cost, 8),
+        }
+
+    def _stream_sink(self, stage_name: Optional[str], stream_id: str) -> StreamSink:
+        path = stream_path(self.stream_dir, stream_id) if self.stream_dir else None
+        return StreamSink(stage_name, path=path, callback=self.stream_callback)
+
+    def _stream_llm(self, system_prompt: str, user_prompt: str, temperature: float,
+                    stage_name: Optional[str], stream_id: str, stats: Dict):
+        sink = self._stream_sink(stage_name, stream_id)
         try:
-            model = genai.GenerativeModel(
-                self.model_name,
-                system_instruction=system_prompt
-            )
-            config = self.generation_config
-            config.temperature = temperature
-            print(f"  ... Calling {self.model_name} (Temp: {temperature}) ...")
-            response = model.generate_content(
-                user_prompt,
-                generation_config=config
-            )
+            for chunk in self.backend.generate_stream(self.model_name, system_prompt, user_prompt, temperature):
+                sink.feed(chunk)
+            return sink.finish()
+        finally:
+            sink.abort()
+            stats["ttft_s"] = None if sink.ttft is None else round(sink.ttft, 4)
+
+    async def _astream_llm(self, system_prompt: str, user_prompt: str, temperature: float,
+                           stage_name: Optional[str], stream_id: str, stats: Dict):
+        sink = self._stream_sink(stage_name, stream_id)
+        try:
+            async for chunk in self.backend.agenerate_stream(self.model_name, system_prompt, user_prompt, temperature):
+                sink.feed(chunk)
+            return sink.finish()
+        finally:
+            sink.abort()
+            stats["ttft_s"] = None if sink.ttft is None else round(sink.ttft, 4)
+
+    def _context_split(self, system_prompt: str, user_prompt: str, stage_name: Optional[str],
+                       stream_id: Optional[str], playbook_text: Optional[str]):
+        # Streamed calls always send the full prompt
+        if self.context_cache is None or stream_id is not None:
+            return None, user_prompt
+        return self.context_cache.split(stage_name, system_prompt, user_prompt, playbook_text)
+
+    def _drop_context(self, handle, error: Exception) -> bool:
+        """Forgets a cached prefix the provider rejected; the call is then resent in full."""
+        if handle is None or is_retryable(error):
+            return False
+        print(f"  ⚠ Cached prefix unusable ({error}). Sending the full prompt.")
+        self.context_cache.discard(handle)
+        return True
+
+    def _call_engine(self, system_prompt: str, user_prompt: str, temperature: float = 0.1,
+                     stage_name: Optional[str] = None, stats: Optional[Dict] = None,
+                     stream_id: Optional[str] = None, playbook_text: Optional[str] = None,
+                     label: str = "") -> Generator[Tuple[str, Any], Any, str]:
+        """
+        The LLM call logic shared by `_call_llm` and `_acall_llm`: response
+        cache, context cache, rate limiting, retries and metrics. Like
+        `_stage_engine` it does no I/O itself; it yields what the driver
+        must do and is sent back the result:
+
+            ("acquire", tokens)       wait on the rate limiter; send the seconds waited
+            ("generate", (context, suffix))
+                                      call the backend, with a cached-content handle and
+                                      the prompt suffix (context None: the full prompt);
+                                      send the response, or throw the exception it raised
+            ("sleep", seconds)        back off before a retry
+
+        Returns the response text; raises LLMCallError when the call fails for good.
+        """
+        stats = {} if stats is None else stats
+        cache_key, cached = self._cached_response(system_prompt, user_prompt, temperature, stage_name)
+        if cached is not None:
+            stats["cache_hit"] = True
+            return cached
+        estimated_tokens = estimate_tokens(system_prompt, user_prompt)
+        context, user_suffix = self._context_split(system_prompt, user_prompt, stage_name, stream_id, playbook_text)
+        attempt = 0
+        stats["queue_wait_s"] = 0.0
+        while True:
+            if self.backend.rate_limited:
+                stats["queue_wait_s"] += yield "acquire", estimated_tokens
+            start_time = time.time()
+            try:
+                print(f"  ... Calling {self.model_name}{label} (Temp: {temperature}{', streamed' if stream_id else ''}) ...")
+                response = yield "generate", (context, user_suffix)
+                text = response.text
+            except Exception as e:
+                if self._drop_context(context, e):
+                    context = None
+                    continue
+                if self.retry_policy.should_retry(e, attempt):
+                    delay = self.retry_policy.delay(attempt)
+                    attempt += 1
+                    stats["retries"] = attempt
+                    print(f"  ⚠ LLM Call Error: {e}. Retrying in {delay:.1f}s "
+                          f"(attempt {attempt + 1}/{self.retry_policy.max_attempts}) ...")
+                    yield "sleep", delay
+                    continue
+                print(f"  ⚠ LLM Call Error: {e}")
+                stats["error"] = True
+                raise LLMCallError(str(e)) from e
             call_time = time.time() - start_time
-            print(f"  ... LLM call complete ({call_time:.2f}s)")
-            return response.text
-        except Exception as e:
-            print(f"  ⚠ LLM Call Error: {e}")
-            return "{}"
+            if stats.get("ttft_s") is not None:
+                print(f"  ... LLM call complete ({call_time:.2f}s, first token after {stats['ttft_s']:.2f}s)")
+            else:
+                print(f"  ... LLM call complete ({call_time:.2f}s)")
+            self.rate_limiter.reconcile(estimated_tokens, response.total_tokens)
+            stats.update(self._usage_stats(system_prompt, user_prompt, response, call_time))
+            self._store_response(cache_key, text, stage_name)
+            return text
+
+    def _call_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.1,
+                  stage_name: Optional[str] = None, stats: Optional[Dict] = None,
+                  stream_id: Optional[str] = None, playbook_text: Optional[str] = None) -> str:
+        """
+        Calls the model, waiting on the shared per-model rate limiter and
+        retrying retryable errors with jittered exponential backoff.
+        Raises LLMCallError when the call fails for good.
+        If `stats` is given it is filled with the call's metrics (latency,
+        rate limiter wait, retries, tokens, cost, cache hit).
+        With `stream_id` the response is streamed (see ace_stream); a
+        stream that breaks off is retried like any dropped connection.
+        With a context cache, a stable prefix of the prompt is sent once
+        and later calls send only the rest (`playbook_text` tells it which
+        prefixes go stale when the playbook changes).
+        """
+        stats = {} if stats is None else stats
+        engine = self._call_engine(system_prompt, user_prompt, temperature, stage_name, stats,
+                                   stream_id, playbook_text)
+        try:
+            op, arg = next(engine)
+            while True:
+                try:
+                    if op == "acquire":
+                        result = self.rate_limiter.acquire(arg)
+                    elif op == "sleep":
+                        result = time.sleep(arg)
+                    else:
+                        context, user_suffix = arg
+                        if context is not None:
+                            result = self.backend.generate_cached(self.model_name, context, user_suffix, temperature)
+                        elif stream_id is None:
+                            result = self.backend.generate(self.model_name, system_prompt, user_prompt, temperature)
+                        else:
+                            result = self._stream_llm(system_prompt, user_prompt, temperature, stage_name, stream_id, stats)
+                except Exception as e:
+                    op, arg = engine.throw(e)
+                    continue
+                op, arg = engine.send(result)
+        except StopIteration as done:
+            return done.value
+
+    async def _acall_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.1,
+                         stage_name: Optional[str] = None, stats: Optional[Dict] = None,
+                         stream_id: Optional[str] = None, playbook_text: Optional[str] = None) -> str:
+        """Async counterpart of `_call_llm`: the same engine, driven with awaits."""
+        stats = {} if stats is None else stats
+        engine = self._call_engine(system_prompt, user_prompt, temperature, stage_name, stats,
+                                   stream_id, playbook_text, label=" async")
+        try:
+            op, arg = next(engine)
+            while True:
+                try:
+                    if op == "acquire":
+                        result = await self.rate_limiter.aacquire(arg)
+                    elif op == "sleep":
+                        result = await asyncio.sleep(arg)
+                    else:
+                        context, user_suffix = arg
+                        if context is not None:
+                            result = await self.backend.agenerate_cached(
+                                self.model_name, context, user_suffix, temperature
+                            )
+                        elif stream_id is None:
+                            result = await self.backend.agenerate(self.model_name, system_prompt, user_prompt, temperature)
+                        else:
+                            result = await self._astream_llm(
+                                system_prompt, user_prompt, temperature, stage_name, stream_id, stats
+                            )
+                except Exception as e:
+                    op, arg = engine.throw(e)
+                    continue
+                op, arg = engine.send(result)
+        except StopIteration as done:
+            return done.value
 
     def _parse_json(self, json_string: str, stage_name: str) -> Dict:
         try:
@@ -62,95 +317,260 @@ class AcePipeline:
 
     def curator(self, reflection: Dict) -> Dict:
         print("\n[CURATOR] Updating playbook...")
-        for pattern in reflection.get("learned_patterns", []):
-            # We will just use one category for simplicity
-            if pattern not in self.playbook["process_strategies"]:
-                self.playbook["process_strategies"].append(pattern)
-                print(f"  ✓ Added prompt strategy: {pattern[:80]}...")
-        
-        # Keep playbook manageable
-        self.playbook["process_strategies"] = self.playbook["process_strategies"][-10:]
+        for section, patterns in route_patterns(reflection).items():
+            self.curator_engine.curate(self.playbook, {"learned_patterns": patterns}, section)
         print(f"\nPlaybook now contains:")
-        print(f"  - {len(self.playbook['process_strategies'])}  prompt strategies")
+        for section, strategies in strategy_sections(self.playbook).items():
+            if strategies or section == GENERAL_SECTION:
+                print(f"  - {len(strategies)}  {section_title(section).lower()}")
         return self.playbook
 
-    def _format_playbook(self, section: str = "all") -> str:
-        playbook = self.playbook
-        if not any(playbook.values()):
-            return "No strategies learned yet. This is your first attempt."
-
-        formatted = ""
-        print("section : ", section )
-        if section in ["all", section ] and playbook.get("process_strategies"):
-            formatted += "PROCESS STRATEGIES (learned from previous critiques):\n"
-            for i, s in enumerate(playbook["process_strategies"], 1):
-                formatted += f"{i}. {s}\n"
-        
-        return formatted if formatted else "No strategies learned yet for this section."
+    async def acurator(self, reflection: Dict) -> Dict:
+        """
+        Async curator hook used by `aprocess`. The default just runs the
+        synchronous curator; override it to persist or share the playbook
+        through an async store.
+        """
+        return self.curator(reflection)
 
-    def process(
-        self, 
+    def _format_playbook(self, section: str = "all", playbook: Optional[Dict] = None,
+                         include_general: bool = False) -> str:
+        """
+        Formats one playbook section ("all" for every section). With
+        `include_general` the general process strategies come first; the
+        first stage gets them, as untargeted patterns are meant for it.
+        Playbook objects cache the text per version (see ace_playbook).
+        """
+        if playbook is None:
+            playbook = self.playbook
+        if isinstance(playbook, Playbook):
+            return playbook.format(section, include_general)
+        return format_playbook(playbook, section, include_general)
+
+    def _stage_engine(
+        self,
         pipeline_id: str,
-        stages: Dict[str, Dict], 
-        inputs: Dict[str, Any], 
-        ground_truth: Dict = None
-    ) -> Dict:
+        stages: Dict[str, Dict],
+        inputs: Dict[str, Any],
+        ground_truth: Dict = None,
+        playbook: Optional[Dict] = None
+    ) -> Generator[List[Dict], List[Optional[str]], Tuple[Dict, bool]]:
+        """
+        The stage engine shared by the sync and async entry points.
+
+        Runs every stage of one job against `playbook` (the live playbook
+        by default) without touching the playbook or the history. Stages
+        are scheduled in dependency waves (see `stage_waves`). It does no
+        I/O itself: for each wave it yields the LLM requests of its stages
+        (the keyword arguments of `_call_llm`), which the driver may run
+        concurrently, and is sent back the response texts in order (None
+        for a call that failed, which fails the run).
+        Per-stage metrics are kept in run_context["stage_metrics"] and
+        summed in run_context["job_metrics"].
+        Returns the run context and whether all stages completed.
+        """
+        job_start = time.perf_counter()
+        stage_metrics = {}
         print(f"\n{'='*60}")
         print(f"PROCESSING: {pipeline_id} (using {len(stages)} stages)")
         print(f"{'='*60}")
         
         run_context = inputs.copy()
         run_context["pipeline_id"] = pipeline_id
+        # The playbook version this job ran against
+        run_context["playbook_version"] = getattr(self.playbook if playbook is None else playbook, "version", None)
         
-        for stage_name in sorted(stages.keys()):
-            stage_def = stages[stage_name]
-            print(f"\n[STAGE: {stage_name}]")
+        if ground_truth:
+            run_context["ground_truth_json"] = json.dumps(ground_truth, indent=2, ensure_ascii=False)
+        else:
+            run_context["ground_truth_json"] = "None provided."
 
-            # Store the system prompt for this stage in the run's history
-            run_context[f"{stage_name}_system_prompt"] = stage_def.get("system_prompt", "No system prompt defined")
+        first_stage_name = sorted(stages)[0]
+        for wave in stage_waves(stages):
+            requests = {}
+            for stage_name in wave:
+                stage_def = stages[stage_name]
+                print(f"\n[STAGE: {stage_name}]")
 
-            playbook_str = self._format_playbook(
-                section=stage_def.get("playbook_section", "all")
-            )
-            run_context["playbook"] = playbook_str
-            
-            if ground_truth:
-                run_context["ground_truth_json"] = json.dumps(ground_truth, indent=2, ensure_ascii=False)
-            else:
-                run_context["ground_truth_json"] = "None provided."
+                # Store the system prompt for this stage in the run's history
+                run_context[f"{stage_name}_system_prompt"] = stage_def.get("system_prompt", "No system prompt defined")
 
-            try:
-                user_prompt = stage_def["user_prompt_template"].format_map(run_context)
-            except KeyError as e:
-                print(f"  ⚠ Missing key '{e}' for prompt template. Skipping stage.")
+                playbook_str = self._format_playbook(
+                    section=stage_def.get("playbook_section", "all"),
+                    playbook=playbook,
+                    include_general=stage_name == first_stage_name
+                )
+                run_context["playbook"] = playbook_str
+
+                try:
+                    user_prompt = compile_template(stage_def["user_prompt_template"]).render(run_context)
+                except KeyError as e:
+                    print(f"  ⚠ Missing key '{e}' for prompt template. Skipping stage.")
+                    continue
+
+                requests[stage_name] = {
+                    "system_prompt": stage_def["system_prompt"],
+                    "user_prompt": user_prompt,
+                    "temperature": stage_def.get("temperature", 0.1),
+                    "stage_name": stage_name,
+                    "stats": {"prompt_chars": len(stage_def["system_prompt"]) + len(user_prompt)},
+                }
+                if stage_def.get("stream") or stage_name in self.stream_stages:
+                    requests[stage_name]["stream_id"] = f"{pipeline_id}.{stage_name}"
+                if self.context_cache is not None:
+                    requests[stage_name]["playbook_text"] = playbook_str
+
+            if not requests:
                 continue
+            if len(requests) > 1:
+                print(f"\n[WAVE] Running {len(requests)} independent stages concurrently: {', '.join(requests)}")
 
-            llm_response_str = self._call_llm(
-                system_prompt=stage_def["system_prompt"],
-                user_prompt=user_prompt,
-                temperature=stage_def.get("temperature", 0.1)
-            )
-            
-            try:
-                result_json = self._parse_json(llm_response_str, stage_name)
-                run_context[f"{stage_name}_json"] = llm_response_str
-                run_context[f"{stage_name}_data"] = result_json
-                print(f"  ✓ Stage complete.")
-            except Exception as e:
-                print(f"  ✗ Stage failed on JSON parse: {e}")
-                return run_context
+            responses = yield list(requests.values())
+
+            for stage_name, llm_response_str in zip(requests, responses):
+                stats = stage_metrics[stage_name] = requests[stage_name]["stats"]
+                if llm_response_str is None:
+                    print(f"  ✗ Stage {stage_name} failed: no response from the LLM.")
+                    return self._close_metrics(run_context, stage_metrics, job_start, False)
+                try:
+                    parse_start = time.perf_counter()
+                    result_json = self._parse_json(llm_response_str, stage_name)
+                    stats["parse_s"] = round(time.perf_counter() - parse_start, 6)
+                    run_context[f"{stage_name}_json"] = llm_response_str
+                    run_context[f"{stage_name}_data"] = result_json
+                    print(f"  ✓ Stage {stage_name} complete.")
+                except Exception as e:
+                    stats["error"] = True
+                    print(f"  ✗ Stage {stage_name} failed on JSON parse: {e}")
+                    return self._close_metrics(run_context, stage_metrics, job_start, False)
+
+        return self._close_metrics(run_context, stage_metrics, job_start, True)
+
+    def _close_metrics(self, run_context: Dict, stage_metrics: Dict[str, Dict],
+                       job_start: float, completed: bool) -> Tuple[Dict, bool]:
+        wall_s = round(time.perf_counter() - job_start, 4)
+        for stage_name, stats in stage_metrics.items():
+            self.metrics.observe_stage(stage_name, self.model_name, stats)
+        self.metrics.observe_job(wall_s, completed)
+        run_context["stage_metrics"] = stage_metrics
+        run_context["job_metrics"] = summarize_job(stage_metrics, wall_s)
+        return run_context, completed
+
+    def _call_or_none(self, request: Dict) -> Optional[str]:
+        try:
+            return self._call_llm(**request)
+        except LLMCallError:
+            return None
+
+    async def _acall_or_none(self, request: Dict) -> Optional[str]:
+        try:
+            return await self._acall_llm(**request)
+        except LLMCallError:
+            return None
+
+    def _call_wave(self, requests: List[Dict]) -> List[Optional[str]]:
+        # A failed call comes back as None; the engine fails that stage
+        if len(requests) == 1:
+            return [self._call_or_none(requests[0])]
+        with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+            return list(pool.map(self._call_or_none, requests))
+
+    async def _acall_wave(self, requests: List[Dict]) -> List[Optional[str]]:
+        return list(await asyncio.gather(*[self._acall_or_none(request) for request in requests]))
+
+    def _run_stages(self, *args, **kwargs) -> Tuple[Dict, bool]:
+        engine = self._stage_engine(*args, **kwargs)
+        try:
+            requests = next(engine)
+            while True:
+                requests = engine.send(self._call_wave(requests))
+        except StopIteration as done:
+            return done.value
+
+    async def _arun_stages(self, *args, **kwargs) -> Tuple[Dict, bool]:
+        engine = self._stage_engine(*args, **kwargs)
+        try:
+            requests = next(engine)
+            while True:
+                requests = engine.send(await self._acall_wave(requests))
+        except StopIteration as done:
+            return done.value
 
+    def _reflection_for(self, run_context: Dict, stages: Dict[str, Dict]) -> Optional[Dict]:
         last_stage_name = sorted(stages.keys())[-1]
         last_stage_data = run_context.get(f"{last_stage_name}_data", {})
         
         if "learned_patterns" in last_stage_data:
             print("\n[STAGE: CURATION]")
-            self.playbook = self.curator(last_stage_data)
-        else:
-            print(f"\n[INFO] No 'learned_patterns' found in final stage ('{last_stage_name}').")
-            print("       Playbook not updated. This is normal for inference runs.")
-            
-        run_context["playbook_snapshot"] = self.playbook.copy()
+            return last_stage_data
+        print(f"\n[INFO] No 'learned_patterns' found in final stage ('{last_stage_name}').")
+        print("       Playbook not updated. This is normal for inference runs.")
+        return None
+
+    def _finish_engine(self, run_context: Dict, stages: Dict[str, Dict],
+                       used_playbook: Optional[Dict] = None) -> Generator[Dict, Dict, Dict]:
+        """
+        Credits the strategies of `used_playbook` (the playbook the run was
+        given, the live one by default) with the run's critique, curates
+        the playbook from the run and records it in the history.
+        Shared by the sync and async drivers: it yields the reflection to
+        curate and is sent back the curated playbook (from `curator` or
+        `acurator`). Returns the recorded run.
+        """
+        self._credit_strategies(run_context, used_playbook)
+        reflection = self._reflection_for(run_context, stages)
+        run_context["playbook_churn"] = 0
+        if reflection is not None:
+            before = copy.deepcopy(self.playbook)
+            self.playbook = yield reflection
+            self._playbook_updated(before)
+            run_context["playbook_churn"] = playbook_churn(before, self.playbook)
+        return self._record_run(run_context, stages)
+
+    def _curate(self, engine: Generator[Dict, Dict, Any]):
+        """Drives a curation engine (`_finish_engine`, `_merge_engine`) with `curator`."""
+        try:
+            reflection = next(engine)
+            while True:
+                reflection = engine.send(self.curator(reflection))
+        except StopIteration as done:
+            return done.value
+
+    async def _acurate(self, engine: Generator[Dict, Dict, Any]):
+        """Drives a curation engine with the `acurator` hook."""
+        try:
+            reflection = next(engine)
+            while True:
+                reflection = engine.send(await self.acurator(reflection))
+        except StopIteration as done:
+            return done.value
+
+    def _finish_run(self, run_context: Dict, stages: Dict[str, Dict],
+                    used_playbook: Optional[Dict] = None) -> Dict:
+        return self._curate(self._finish_engine(run_context, stages, used_playbook))
+
+    async def _afinish_run(self, run_context: Dict, stages: Dict[str, Dict],
+                           used_playbook: Optional[Dict] = None) -> Dict:
+        return await self._acurate(self._finish_engine(run_context, stages, used_playbook))
+
+    def _credit_strategies(self, run_context: Dict, used_playbook: Optional[Dict]):
+        self.curator_engine.credit(
+            self.playbook, self.playbook if used_playbook is None else used_playbook, run_context
+        )
+
+    def _playbook_updated(self, before: Dict):
+        # Curator statistics change after every run; only the strategies count
+        if strategy_sections(self.playbook) == strategy_sections(before):
+            return
+        self.playbook.bump()
+        # Cached prefixes embedding the old playbook will not be sent again
+        if self.context_cache is not None:
+            self.context_cache.invalidate_playbook()
+
+    def _record_run(self, run_context: Dict, stages: Dict[str, Dict]) -> Dict:
+        run_context["playbook_snapshot"] = copy.deepcopy(self.playbook)
+        run_context["playbook_snapshot_version"] = self.playbook.version
+        run_context[STATE_KEY] = copy.deepcopy(self.curator_engine.state)
 
         # --- NEW CODE ---
         # At the end of the pipeline, build the prompt for the *next* run
@@ -162,7 +582,8 @@ class AcePipeline:
         
         # 2. Format the *newly updated* playbook
         next_playbook_str = self._format_playbook(
-            section=stages[first_stage_name].get("playbook_section", "all")
+            section=stages[first_stage_name].get("playbook_section", "all"),
+            include_general=True
         )
 
         # 3. Combine them to create the prompt that will be used for the *next* run
@@ -179,6 +600,350 @@ class AcePipeline:
 
         return run_context
 
+    def process(
+        self, 
+        pipeline_id: str,
+        stages: Dict[str, Dict], 
+        inputs: Dict[str, Any], 
+        ground_truth: Dict = None
+    ) -> Dict:
+        run_context, completed = self._run_stages(pipeline_id, stages, inputs, ground_truth)
+        if not completed:
+            return run_context
+        return self._finish_run(run_context, stages)
+
+    async def aprocess(
+        self, 
+        pipeline_id: str,
+        stages: Dict[str, Dict], 
+        inputs: Dict[str, Any], 
+        ground_truth: Dict = None
+    ) -> Dict:
+        run_context, completed = await self._arun_stages(pipeline_id, stages, inputs, ground_truth)
+        if not completed:
+            return run_context
+        return await self._afinish_run(run_context, stages)
+
+    def _check_stages(self, stages: Dict[str, Dict], jobs: List[Dict]):
+        errors = validate_stages(stages, jobs)
+        if errors:
+            raise ValueError("Invalid stage config:\n  " + "\n  ".join(errors))
+
+    def process_jobs(
+        self,
+        jobs: List[Dict],
+        stages: Dict[str, Dict],
+        workers: int = 1,
+        on_generation: Optional[Callable[[List[Dict]], None]] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+        monitor: Optional[ConvergenceMonitor] = None
+    ) -> List[Dict]:
+        """
+        Processes `jobs` in generations of `workers` jobs. Every job of a
+        generation runs concurrently against the same frozen playbook
+        snapshot; once the whole generation is done (the barrier), results
+        are curated and appended to the history in job order, so the
+        history and final playbook do not depend on completion order.
+        With a `scheduler` (see ace_scheduler) each generation's size is
+        chosen from the playbook churn of the previous ones instead.
+        With a `monitor` (see ace_convergence), once the playbook has
+        converged the remaining jobs run the first stage only, `workers`
+        at a time.
+        `on_generation` is called with the generation's results after
+        each barrier (e.g. to checkpoint the history).
+        Raises ValueError before any call if the stage templates do not
+        fit the jobs (see ace_templates.validate_stages).
+        """
+        self._check_stages(stages, jobs)
+        workers = max(1, workers)
+        all_results = []
+
+        start = 0
+        while start < len(jobs):
+            generation, job_stages, snapshot, converged = self._next_generation(
+                jobs, start, stages, workers, scheduler, monitor
+            )
+
+            def run_job(job):
+                return self._run_stages(
+                    pipeline_id=job["id"],
+                    stages=job_stages,
+                    inputs=job.get("inputs", {}),
+                    ground_truth=job.get("ground_truth", {}),
+                    playbook=snapshot
+                )
+
+            if len(generation) == 1:
+                outcomes = [run_job(generation[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=len(generation)) as pool:
+                    outcomes = list(pool.map(run_job, generation))
+
+            generation_results = self._merge_generation(outcomes, job_stages, snapshot, converged)
+            self._observe_generation(generation_results, scheduler, monitor, converged)
+
+            all_results.extend(generation_results)
+            if on_generation:
+                on_generation(generation_results)
+            start += len(generation)
+
+        return all_results
+
+    def _merge_engine(self, outcomes: List[Tuple[Dict, bool]], stages: Dict[str, Dict],
+                      snapshot: Dict, inference_only: bool = False) -> Generator[Dict, Dict, List[Dict]]:
+        # Barrier: merge in job order, not completion order
+        generation_results = []
+        for run_context, completed in outcomes:
+            if inference_only:
+                run_context["inference_only"] = True
+            if completed:
+                run_context = yield from self._finish_engine(run_context, stages, used_playbook=snapshot)
+            generation_results.append(run_context)
+        return generation_results
+
+    def _merge_generation(self, outcomes: List[Tuple[Dict, bool]], stages: Dict[str, Dict],
+                          snapshot: Dict, inference_only: bool = False) -> List[Dict]:
+        return self._curate(self._merge_engine(outcomes, stages, snapshot, inference_only))
+
+    async def _amerge_generation(self, outcomes: List[Tuple[Dict, bool]], stages: Dict[str, Dict],
+                                 snapshot: Dict, inference_only: bool = False) -> List[Dict]:
+        return await self._acurate(self._merge_engine(outcomes, stages, snapshot, inference_only))
+
+    def _next_generation(self, jobs: List[Dict], start: int, stages: Dict[str, Dict], workers: int,
+                         scheduler: Optional[GenerationScheduler], monitor: Optional[ConvergenceMonitor]
+                         ) -> Tuple[List[Dict], Dict[str, Dict], Playbook, bool]:
+        """Returns the next generation's jobs, stages and frozen playbook, and whether the playbook has converged."""
+        converged = monitor is not None and monitor.converged
+        job_stages = inference_stages(stages) if converged else stages
+        size = scheduler.next_size() if scheduler and not converged else workers
+        generation = jobs[start:start + size]
+        snapshot = copy.deepcopy(self.playbook)
+        if size > 1 or scheduler:
+            print(f"\n[GENERATION] Jobs {start + 1}-{start + len(generation)} of {len(jobs)} "
+                  f"({len(generation)} workers, frozen playbook v{snapshot.version})")
+        return generation, job_stages, snapshot, converged
+
+    @staticmethod
+    def _observe_generation(generation_results: List[Dict], scheduler: Optional[GenerationScheduler],
+                            monitor: Optional[ConvergenceMonitor], converged: bool):
+        if converged:
+            monitor.skipped += len(generation_results)
+            return
+        if scheduler:
+            scheduler.observe([r["playbook_churn"] for r in generation_results if "playbook_churn" in r])
+        if monitor:
+            for run_context in generation_results:
+                monitor.observe(run_context)
+
+    def infer_jobs(
+        self,
+        jobs: List[Dict],
+        stages: Dict[str, Dict],
+        workers: int = 1,
+        playbook: Optional[Dict] = None
+    ) -> Iterator[Tuple[Dict, Dict, bool]]:
+        """
+        Inference only: runs the first stage of every job against a frozen
+        copy of `playbook` (the live one by default), `workers` jobs at a
+        time, and yields (job, run_context, completed) as jobs finish.
+        Nothing is curated or added to the history, and jobs need no
+        ground truth.
+        """
+        stages = inference_stages(stages)
+        self._check_stages(stages, jobs)
+        frozen = as_playbook(copy.deepcopy(self.playbook if playbook is None else playbook))
+        workers = max(1, workers)
+
+        def run_job(job):
+            run_context, completed = self._run_stages(
+                pipeline_id=job["id"],
+                stages=stages,
+                inputs=job.get("inputs", {}),
+                ground_truth=None,
+                playbook=frozen
+            )
+            return job, run_context, completed
+
+        # Keep a bounded number of jobs queued so huge job lists stream
+        remaining = iter(jobs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(run_job, job) for job in itertools.islice(remaining, 2 * workers)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for job in itertools.islice(remaining, 1):
+                        pending.add(pool.submit(run_job, job))
+                    yield future.result()
+
+    def process_jobs_batch(
+        self,
+        jobs: List[Dict],
+        stages: Dict[str, Dict],
+        client: BatchClient,
+        batch_dir: str = "ace_batches",
+        generation_size: Optional[int] = None,
+        poll_interval: float = 30.0,
+        timeout: Optional[float] = None,
+        on_generation: Optional[Callable[[List[Dict]], None]] = None
+    ) -> List[Dict]:
+        """
+        Like `process_jobs`, but every stage wave of a generation is sent
+        as one provider batch job (see ace_batch): the stage engines of all
+        jobs in the generation run in lockstep against the same frozen
+        playbook, and each wave's results are fed back before the next
+        wave is submitted. A generation is every job unless
+        `generation_size` is given. Request files are kept in `batch_dir`.
+        Streaming and the context cache do not apply to batch calls.
+        """
+        self._check_stages(stages, jobs)
+        size = max(1, generation_size or len(jobs))
+        all_results = []
+
+        for start in range(0, len(jobs), size):
+            generation = jobs[start:start + size]
+            snapshot = copy.deepcopy(self.playbook)
+            print(f"\n[GENERATION] Jobs {start + 1}-{start + len(generation)} of {len(jobs)} "
+                  f"(batch mode, frozen playbook)")
+            engines = [
+                self._stage_engine(
+                    pipeline_id=job["id"],
+                    stages=stages,
+                    inputs=job.get("inputs", {}),
+                    ground_truth=job.get("ground_truth", {}),
+                    playbook=snapshot
+                )
+                for job in generation
+            ]
+            outcomes = self._run_engines_batched(engines, client, batch_dir, poll_interval, timeout)
+
+            generation_results = self._merge_generation(outcomes, stages, snapshot)
+            all_results.extend(generation_results)
+            if on_generation:
+                on_generation(generation_results)
+
+        return all_results
+
+    def _run_engines_batched(self, engines: List[Generator], client: BatchClient, batch_dir: str,
+                             poll_interval: float, timeout: Optional[float]) -> List[Tuple[Dict, bool]]:
+        outcomes: List[Optional[Tuple[Dict, bool]]] = [None] * len(engines)
+        pending = {}
+        for i, engine in enumerate(engines):
+            try:
+                pending[i] = next(engine)
+            except StopIteration as done:
+                outcomes[i] = done.value
+
+        while pending:
+            flat = [(i, request) for i, requests in pending.items() for request in requests]
+            responses = iter(self._call_batch([request for _, request in flat], client, batch_dir,
+                                              poll_interval, timeout))
+            waiting = {}
+            for i, requests in pending.items():
+                try:
+                    waiting[i] = engines[i].send([next(responses) for _ in requests])
+                except StopIteration as done:
+                    outcomes[i] = done.value
+            pending = waiting
+        return outcomes
+
+    def _call_batch(self, requests: List[Dict], client: BatchClient, batch_dir: str,
+                    poll_interval: float, timeout: Optional[float]) -> List[Optional[str]]:
+        """
+        Answers the requests of one lockstep wave with a single batch job.
+        Cached responses are served without a call; a call that fails in
+        the batch comes back as None, as in `_call_wave`.
+        """
+        responses: List[Optional[str]] = [None] * len(requests)
+        calls = {}
+        for i, request in enumerate(requests):
+            cache_key, cached = self._cached_response(
+                request["system_prompt"], request["user_prompt"], request["temperature"], request["stage_name"]
+            )
+            if cached is not None:
+                request["stats"]["cache_hit"] = True
+                responses[i] = cached
+            else:
+                calls[f"{i:06d}.{request['stage_name']}"] = (i, request, cache_key)
+        if not calls:
+            return responses
+
+        path = os.path.join(batch_dir, f"wave-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.jsonl")
+        write_requests(path, {key: request for key, (_, request, _) in calls.items()})
+        print(f"\n[BATCH] Submitting {len(calls)} calls to the {client.name} batch API "
+              f"({len(requests) - len(calls)} answered from the cache) ...")
+        start_time = time.time()
+        job_id = client.submit(self.model_name, path)
+        state = wait_for(client, job_id, poll_interval, timeout)
+        turnaround = time.time() - start_time
+        results = client.results(job_id) if state == SUCCEEDED else {}
+        if state != SUCCEEDED:
+            print(f"  ⚠ [BATCH] {job_id} ended in {state}; its stages fail.")
+
+        failed = 0
+        for key, (i, request, cache_key) in calls.items():
+            stats = request["stats"]
+            result = results.get(key)
+            if not isinstance(result, LLMResponse):
+                if result is not None:
+                    print(f"  ⚠ [BATCH] {key}: {result}")
+                stats["error"] = True
+                failed += 1
+                continue
+            stats.update(self._usage_stats(request["system_prompt"], request["user_prompt"], result,
+                                           turnaround, batch=True))
+            stats["batch"] = True
+            self._store_response(cache_key, result.text, request["stage_name"])
+            responses[i] = result.text
+        print(f"  ... [BATCH] {len(calls) - failed}/{len(calls)} calls answered ({turnaround:.0f}s)")
+        return responses
+
+    async def aprocess_jobs(
+        self,
+        jobs: List[Dict],
+        stages: Dict[str, Dict],
+        concurrency: int = 1,
+        on_generation: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+        monitor: Optional[ConvergenceMonitor] = None
+    ) -> List[Dict]:
+        """
+        Async counterpart of `process_jobs`: each generation of
+        `concurrency` jobs (or as many as `scheduler` picks) runs as
+        concurrent coroutines on the running event loop, with the same
+        frozen-playbook / ordered-barrier and convergence rules.
+        `on_generation`, if given, is awaited after each barrier.
+        """
+        self._check_stages(stages, jobs)
+        concurrency = max(1, concurrency)
+        all_results = []
+
+        start = 0
+        while start < len(jobs):
+            generation, job_stages, snapshot, converged = self._next_generation(
+                jobs, start, stages, concurrency, scheduler, monitor
+            )
+
+            outcomes = await asyncio.gather(*[
+                self._arun_stages(
+                    pipeline_id=job["id"],
+                    stages=job_stages,
+                    inputs=job.get("inputs", {}),
+                    ground_truth=job.get("ground_truth", {}),
+                    playbook=snapshot
+                )
+                for job in generation
+            ])
+
+            generation_results = await self._amerge_generation(outcomes, job_stages, snapshot, converged)
+            self._observe_generation(generation_results, scheduler, monitor, converged)
+
+            all_results.extend(generation_results)
+            if on_generation:
+                await on_generation(generation_results)
+            start += len(generation)
+
+        return all_results
+
     def show_playbook_evolution(self):
         print(f"\n{'='*60}")
         print("PLAYBOOK EVOLUTION (Refined Prompt Instructions)")
@@ -191,12 +956,15 @@ class AcePipeline:
         for i, history_item in enumerate(self.history, 1):
             pb = history_item["playbook_snapshot"]
             print(f"\nAfter Run: {history_item['pipeline_id']}:")
-            print(f"  Strategies: {len(pb.get('process_strategies', []))}")
+            print(f"  Strategies: {sum(len(s) for s in strategy_sections(pb).values())}")
 
         print(f"\n{'='*60}\nFINAL PLAYBOOK (These are your new prompt instructions)\n{'='*60}")
         print(self._format_playbook(section="all"))
 
     def save_history(self, filepath: str):
+        if is_jsonl_path(filepath):
+            self._append_history(filepath)
+            return
         print(f"\n[IO] Saving history with {len(self.history)} runs to {filepath}...")
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
@@ -207,25 +975,80 @@ class AcePipeline:
         except TypeError as e:
             print(f"  ⚠ Error serializing history (non-serializable data): {e}")
 
-    def load_history(self, filepath: str):
+    def _append_history(self, filepath: str):
+        # Only the runs added since the last save are written: O(run), not O(history)
+        saved = self._history_saved.get(filepath, 0)
+        new_runs = self.history[saved:]
+        print(f"\n[IO] Appending {len(new_runs)} new runs to {filepath} ({len(self.history)} total)...")
+        try:
+            store = self._history_stores.get(filepath)
+            if store is None:
+                store = self._history_stores[filepath] = JsonlHistoryStore(
+                    filepath, compact=self.compact_history
+                )
+            store.append(new_runs)
+            self._history_saved[filepath] = len(self.history)
+            print(f"  ✓ History saved successfully.")
+        except IOError as e:
+            print(f"  ⚠ Error saving history: {e}")
+        except TypeError as e:
+            print(f"  ⚠ Error serializing history (non-serializable data): {e}")
+
+    def close_history(self):
+        """Flushes (fsyncs) any batched JSONL history appends."""
+        for store in self._history_stores.values():
+            store.close()
+
+    def _restore_state(self, run: Dict):
+        """Restores the playbook, its version and the curator statistics saved with a history run."""
+        playbook = run["playbook_snapshot"]
+        if run.get("playbook_snapshot_version") is not None:
+            # Versions carry on across sessions instead of restarting at 1
+            playbook = as_playbook(dict(playbook), version=run["playbook_snapshot_version"])
+        self.playbook = playbook
+        if run.get(STATE_KEY):
+            self.curator_engine.state = copy.deepcopy(run[STATE_KEY])
+
+    def load_history(self, filepath: str, lazy: bool = False):
+        """
+        Restores the playbook from a history file. With `lazy` (JSONL
+        histories only) the playbook comes from the small sidecar snapshot
+        and past runs stay on disk, read on demand through LazyHistory.
+        """
         print(f"\n[IO] Loading history from {filepath}...")
         if not os.path.exists(filepath):
             print(f"  ✓ No history file found at {filepath}. Starting fresh.")
             return
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self.history = json.load(f)
+            if lazy and is_jsonl_path(filepath):
+                runs, latest_state = read_restore_state(filepath)
+                self.history = LazyHistory(filepath, stored_runs=runs)
+                self._history_saved[filepath] = len(self.history)
+                if not self.history:
+                    print("  ✓ History file was empty. Starting fresh.")
+                elif latest_state.get("playbook_snapshot"):
+                    self._restore_state(latest_state)
+                    print(f"  ✓ History indexed {len(self.history)} runs (lazy).")
+                    print("  ✓ Playbook restored from snapshot.")
+                else:
+                    print("  ⚠ History indexed, but no playbook snapshot found in last run.")
+                return
+            if is_jsonl_path(filepath):
+                self.history = load_history_records(filepath)
+                self._history_saved[filepath] = len(self.history)
+            else:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    self.history = json.load(f)
             if not self.history:
                 print("  ✓ History file was empty. Starting fresh.")
                 return
-            latest_playbook = self.history[-1].get("playbook_snapshot")
-            if latest_playbook:
-                self.playbook = latest_playbook
+            if self.history[-1].get("playbook_snapshot"):
+                self._restore_state(self.history[-1])
                 print(f"  ✓ History loaded {len(self.history)} runs.")
                 print("  ✓ Playbook restored from last run.")
             else:
                 print("  ⚠ History loaded, but no playbook snapshot found in last run.")
-        except (IOError, json.JSONDecodeError) as e:
+        except (IOError, ValueError) as e:
             print(f"  ⚠ Error loading history: {e}. Starting fresh.")
             self.history = []
 
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+run_benchmarks.py
+
+Benchmarks for the ACE pipeline hot paths, driven by the offline
+StubBackend so they measure the pipeline's own overhead, not the LLM.
+
+Job lists are synthesized from data/tang*_poem.txt (tang_poet.json stages)
+and saki/*.txt (saki6.json stages). Every case runs in its own subprocess so
+the reported peak RSS belongs to that case alone.
+
+    python3 benchmarks/run_benchmarks.py                      # full sweep
+    python3 benchmarks/run_benchmarks.py --quick              # 10 and 100 only
+    python3 benchmarks/run_benchmarks.py --cases pipeline --sizes 1000
+    python3 benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json
+
+Cases:
+    pipeline         AcePipeline.process_jobs end to end, N jobs; reports
+                     per-stage-call overhead (wall minus backend and
+                     history time), history checkpoint time and peak RSS
+    curator          AcePipeline.curator against a playbook of N strategies
+    format_playbook  AcePipeline._format_playbook for a playbook of N strategies
+    history_io       save_history / load_history for a history of N runs
+                     (JSON rewrite, JSONL append, compact JSONL, lazy load)
+    ace_print        ace_print.print_all_playbook_snapshots over N runs
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json.
+"""
+
+import argparse
+import contextlib
+import copy
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+QUICK_SIZES = [10, 100]
+# Playbook sizes are capped: a 10000-strategy playbook is not a realistic prompt
+PLAYBOOK_SIZES = [10, 100, 1000]
+CASES = ["pipeline", "curator", "format_playbook", "history_io", "ace_print"]
+
+
+# --------------------------------------------------------------
+# Synthetic workloads
+# --------------------------------------------------------------
+def load_stages(corpus: str) -> Dict[str, Dict]:
+    config = "tang_poet.json" if corpus == "tang" else "saki6.json"
+    with open(os.path.join(REPO_ROOT, config), "r", encoding="utf-8") as f:
+        return json.load(f)["STAGES"]
+
+
+def _read_poem(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    header, _, body = text.partition("---")
+    title = header.split("\n", 1)[0].replace("Title:", "").strip()
+    return {"title_cn": title, "original_chinese": body.strip()}
+
+
+def synthetic_jobs(corpus: str, count: int) -> List[Dict]:
+    """Cycles through the corpus files to build `count` jobs."""
+    if corpus == "tang":
+        sources = [_read_poem(path) for path in sorted(glob.glob(os.path.join(REPO_ROOT, "data", "tang*_poem.txt")))]
+        return [
+            {
+                "id": f"tang_{i:05d}",
+                "inputs": sources[i % len(sources)],
+                "ground_truth": {"reference": sources[(i + 1) % len(sources)]["original_chinese"]},
+            }
+            for i in range(count)
+        ]
+
+    stories = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "saki", "*.txt"))):
+        if path.endswith("saki_prompt.txt"):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            stories.append(f.read())
+    return [
+        {"id": f"saki_{i:05d}", "inputs": {}, "ground_truth": {"story": stories[i % len(stories)]}}
+        for i in range(count)
+    ]
+
+
+def _quiet_pipeline(backend=None):
+    from ace_backends import StubBackend
+    from ace_util import AcePipeline
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return AcePipeline(backend=backend or StubBackend())
+
+
+def synthetic_history(corpus: str, count: int) -> List[Dict]:
+    """Runs a few real (stubbed) jobs and repeats them to `count` runs."""
+    ace = _quiet_pipeline()
+    stages = load_stages(corpus)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ace.process_jobs(synthetic_jobs(corpus, min(count, 20)), stages)
+    seeds = list(ace.history)
+    history = []
+    for i in range(count):
+        run = copy.deepcopy(seeds[i % len(seeds)])
+        run["pipeline_id"] = f"{corpus}_{i:05d}"
+        history.append(run)
+    return history
+
+
+def _timeit(fn, min_time: float = 0.2, max_reps: int = 10000) -> Dict[str, float]:
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_reps and (time.perf_counter() - start < min_time or len(times) < 3):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"mean_s": sum(times) / len(times), "min_s": min(times), "reps": len(times)}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# --------------------------------------------------------------
+# Cases (run inside the child process)
+# --------------------------------------------------------------
+def bench_pipeline(size: int, corpus: str, workers: int) -> Dict:
+    from ace_backends import StubBackend
+
+    class TimedStub(StubBackend):
+        backend_time = 0.0
+
+        def generate(self, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return super().generate(*args, **kwargs)
+            finally:
+                TimedStub.backend_time += time.perf_counter() - t0
+
+    ace = _quiet_pipeline(TimedStub())
+    ace.compact_history = True
+    stages = load_stages(corpus)
+    jobs = synthetic_jobs(corpus, size)
+    history_time = 0.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history_file = os.path.join(tmp, "bench_history.jsonl")
+
+        def checkpoint(_results):
+            nonlocal history_time
+            t0 = time.perf_counter()
+            ace.save_history(history_file)
+            history_time += time.perf_counter() - t0
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            ace.process_jobs(jobs, stages, workers=workers, on_generation=checkpoint)
+            wall = time.perf_counter() - t0
+            ace.close_history()
+        history_bytes = sum(os.path.getsize(path) for path in glob.glob(history_file + "*"))
+
+    calls = ace.backend.calls
+    overhead = wall - TimedStub.backend_time - history_time
+    return {
+        "wall_s": wall,
+        "jobs_per_s": size / wall if wall else 0.0,
+        "llm_calls": calls,
+        "backend_s": TimedStub.backend_time,
+        "history_save_s": history_time,
+        "overhead_s": overhead,
+        "overhead_per_stage_call_ms": 1000 * overhead / calls if calls else 0.0,
+        "history_bytes": history_bytes,
+    }
+
+
+def _playbook_of(size: int) -> Dict:
+    return {
+        "process_strategies": [f"Strategy {i}: keep imagery concrete and verbs active ({i})." for i in range(size)],
+        "critique_strategies": [],
+    }
+
+
+def bench_curator(size: int) -> Dict:
+    ace = _quiet_pipeline()
+    base = _playbook_of(size)
+    reflection = {"learned_patterns": ["A brand new strategy.", base["process_strategies"][0]]}
+
+    def run():
+        ace.playbook = copy.deepcopy(base)
+        ace.curator(reflection)
+
+    copy_cost = _timeit(lambda: copy.deepcopy(base))
+    with contextlib.redirect_stdout(io.StringIO()):
+        timing = _timeit(run)
+    timing["mean_s"] = max(0.0, timing["mean_s"] - copy_cost["mean_s"])
+    return timing
+
+
+def bench_format_playbook(size: int) -> Dict:
+    ace = _quiet_pipeline()
+    ace.playbook = _playbook_of(size)
+    with contextlib.redirect_stdout(io.StringIO()):
+        timing = _timeit(lambda: ace._format_playbook(section="translation", include_general=True))
+    timing["chars"] = len(ace._format_playbook(section="translation", include_general=True))
+    return timing
+
+
+def bench_history_io(size: int, corpus: str) -> Dict:
+    history = synthetic_history(corpus, size)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        for label, filename, compact in (
+            ("json", "h.json", False),
+            ("jsonl", "h.jsonl", False),
+            ("jsonl_compact", "c.jsonl", True),
+        ):
+            path = os.path.join(tmp, filename)
+            ace = _quiet_pipeline()
+            ace.compact_history = compact
+            ace.history = history[:-1]
+
+            # Checkpoint of the whole history so far, then of one more run
+            t0 = time.perf_counter()
+            ace.save_history(path)
+            results[f"{label}_save_all_s"] = time.perf_counter() - t0
+            ace.history.append(history[-1])
+            t0 = time.perf_counter()
+            ace.save_history(path)
+            results[f"{label}_checkpoint_one_s"] = time.perf_counter() - t0
+            ace.close_history()
+            results[f"{label}_bytes"] = sum(os.path.getsize(p) for p in glob.glob(path + "*"))
+
+            t0 = time.perf_counter()
+            _quiet_pipeline().load_history(path)
+            results[f"{label}_load_s"] = time.perf_counter() - t0
+            if label != "json":
+                t0 = time.perf_counter()
+                _quiet_pipeline().load_history(path, lazy=True)
+                results[f"{label}_lazy_load_s"] = time.perf_counter() - t0
+    return results
+
+
+def bench_ace_print(size: int, corpus: str) -> Dict:
+    import ace_print
+    from ace_history import JsonlHistoryStore
+
+    history = synthetic_history(corpus, size)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        json_path = os.path.join(tmp, "h.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(history, f, ensure_ascii=False)
+        jsonl_path = os.path.join(tmp, "h.jsonl")
+        JsonlHistoryStore(jsonl_path, compact=True).append(history)
+
+        for label, path in (("json", json_path), ("jsonl_compact", jsonl_path)):
+            t0 = time.perf_counter()
+            ace_print.print_all_playbook_snapshots(path)
+            results[f"{label}_all_snapshots_s"] = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            ace_print.print_prompt(path)
+            results[f"{label}_prompt_s"] = time.perf_counter() - t0
+    return results
+
+
+def run_child(spec: Dict) -> Dict:
+    case = spec["case"]
+    if case == "pipeline":
+        metrics = bench_pipeline(spec["size"], spec["corpus"], spec["workers"])
+    elif case == "curator":
+        metrics = bench_curator(spec["size"])
+    elif case == "format_playbook":
+        metrics = bench_format_playbook(spec["size"])
+    elif case == "history_io":
+        metrics = bench_history_io(spec["size"], spec["corpus"])
+    elif case == "ace_print":
+        metrics = bench_ace_print(spec["size"], spec["corpus"])
+    else:
+        raise ValueError(f"Unknown case: {case}")
+    metrics["peak_rss_mb"] = _peak_rss_mb()
+    return metrics
+
+
+# --------------------------------------------------------------
+# Sweep driver (parent process)
+# --------------------------------------------------------------
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _spawn(spec: Dict) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _headline(case: str, metrics: Dict) -> str:
+    if "error" in metrics:
+        return f"ERROR {metrics['error']}"
+    if case == "pipeline":
+        return (f"{metrics['wall_s']:.2f}s wall, {metrics['overhead_per_stage_call_ms']:.2f} ms overhead/stage call, "
+                f"history {metrics['history_save_s']:.2f}s, {metrics['peak_rss_mb']:.0f} MB peak")
+    if case in ("curator", "format_playbook"):
+        return f"{metrics['mean_s'] * 1e6:.1f} µs/call, {metrics['peak_rss_mb']:.0f} MB peak"
+    timings = {k: v for k, v in metrics.items() if k.endswith("_s")}
+    return ", ".join(f"{k[:-2]} {v * 1000:.1f}ms" for k, v in timings.items()) + f", {metrics['peak_rss_mb']:.0f} MB peak"
+
+
+def compare(old_path: str, new_results: List[Dict], threshold: float):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    old_by_key = {(r["case"], json.dumps(r["params"], sort_keys=True)): r["metrics"] for r in old["results"]}
+    print(f"\nComparison with {old_path} (commit {old['meta'].get('commit')}):")
+    regressions = 0
+    for result in new_results:
+        previous = old_by_key.get((result["case"], json.dumps(result["params"], sort_keys=True)))
+        if not previous:
+            continue
+        for metric, value in result["metrics"].items():
+            if not (metric.endswith("_s") or metric.endswith("_ms") or metric == "peak_rss_mb"):
+                continue
+            before = previous.get(metric)
+            if not before or not isinstance(value, (int, float)):
+                continue
+            ratio = value / before
+            if ratio > threshold:
+                regressions += 1
+                print(f"  ⚠ {result['case']} {result['params']} {metric}: {before:.4g} -> {value:.4g} ({ratio:.2f}x)")
+    print(f"  {regressions} regressions above {threshold:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ACE pipeline hot paths with the stub backend.")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Comma-separated cases (default: all of {', '.join(CASES)})")
+    parser.add_argument("--sizes", help="Comma-separated job / history sizes (default: 10,100,1000,10000)")
+    parser.add_argument("--quick", action="store_true", help="Only sweep sizes 10 and 100")
+    parser.add_argument("--corpus", choices=["tang", "saki"], default="tang", help="Synthetic job source (default: tang)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers for the pipeline case (default: 1)")
+    parser.add_argument("--out", help="Results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression (default: 1.2)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    for case in cases:
+        if case not in CASES:
+            parser.error(f"unknown case '{case}'")
+
+    results = []
+    for case in cases:
+        case_sizes = [s for s in sizes if s <= max(PLAYBOOK_SIZES)] if case in ("curator", "format_playbook") else sizes
+        for size in case_sizes:
+            params = {"size": size}
+            if case in ("pipeline", "history_io", "ace_print"):
+                params["corpus"] = args.corpus
+            if case == "pipeline":
+                params["workers"] = args.workers
+            print(f"[{case}] {params} ...", flush=True)
+            metrics = _spawn(dict(params, case=case))
+            print(f"  {_headline(case, metrics)}")
+            results.append({"case": case, "params": params, "metrics": metrics})
+
+    commit = _git_commit()
+    out_path = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\n✓ Results written to {out_path}")
+
+    if args.compare:
+        compare(args.compare, results, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ Usage:
 """
 
 import argparse
+import importlib.util
 import os
 import sys
 from pathlib import Path
@@ -16,15 +17,20 @@ from pathlib import Path
 # ----------------------------------------------------------------------
 # Google Generative AI SDK
 # ----------------------------------------------------------------------
+# ace_models imports the SDK; check for it first to fail with a clear message
 try:
-    import google.generativeai as genai
-except ImportError:
+    sdk_spec = importlib.util.find_spec("google.generativeai")
+except ModuleNotFoundError:
+    sdk_spec = None
+if sdk_spec is None:
     print(
         "Error: google-generativeai SDK not installed. Run `pip install google-generativeai`.",
         file=sys.stderr,
     )
     sys.exit(1)
 
+import ace_models
+
 # ----------------------------------------------------------------------
 # Configuration
 # ----------------------------------------------------------------------
@@ -54,8 +60,8 @@ def simple_prompt() -> str:
 # ----------------------------------------------------------------------
 def generate_story(prompt: str) -> str:
     """Send the prompt to the Gemma model and return the generated story."""
-    genai.configure(api_key=os.getenv("GAI_API_KEY"))
-    model = genai.GenerativeModel(GEMMA_MODEL)
+    ace_models.configure(os.getenv("GAI_API_KEY"))
+    model = ace_models.get_model(GEMMA_MODEL)
     try:
         response = model.generate_content([prompt])
         return response.text.strip()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_cache import ResponseCache  # noqa: E402
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.sqlite")
+        self.cache = ResponseCache(self.path, max_bytes=100)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_get_returns_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", "response")
+        self.assertEqual(self.cache.get("a"), "response")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        for key in "abc":
+            self.cache.put(key, "x" * 40)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), "x" * 40)
+        self.cache.put("d", "x" * 40)
+        # b was read after c was written, so c goes first
+        self.assertIsNone(self.cache.get("c"))
+        self.assertEqual(self.cache.get("b"), "x" * 40)
+        self.assertEqual(self.cache.evictions, 2)
+
+    def test_running_total_tracks_replacements(self):
+        self.cache.put("a", "x" * 60)
+        self.cache.put("a", "x" * 10)
+        self.cache.put("b", "x" * 80)
+        self.assertEqual(self.cache.evictions, 0)
+        self.assertEqual(self.cache.stats()["bytes"], 90)
+        self.assertEqual(self.cache._bytes, 90)
+
+    def test_total_survives_reopening(self):
+        self.cache.put("a", "x" * 60)
+        self.cache.close()
+        self.cache = ResponseCache(self.path, max_bytes=100)
+        self.cache.put("b", "x" * 60)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["bytes"], 60)
+
+    def test_keys_depend_on_backend(self):
+        gemini = ResponseCache.make_key("m", "system", "user", 0.7)
+        stub = ResponseCache.make_key("m", "system", "user", 0.7, backend="stub")
+        self.assertNotEqual(gemini, stub)
+        self.assertEqual(gemini, ResponseCache.make_key("m", "system", "user", 0.7, backend="gemini"))
+
+
+if __name__ == "__main__":
+    unittest.main()
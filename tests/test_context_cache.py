@@ -0,0 +1,141 @@
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_backends import StubBackend  # noqa: E402
+from ace_context_cache import MAX_ERRORS, ContextCacheManager  # noqa: E402
+
+SYSTEM = "You are a translator."
+PLAYBOOK = "PLAYBOOK:\n- Keep imagery concrete.\n"
+
+
+def prompt(n):
+    return f"{PLAYBOOK}GROUND TRUTH:\nshared notes\nPOEM:\npoem {n}\n"
+
+
+class CountingStub(StubBackend):
+
+    def __init__(self, upload_delay=0.0, fail_uploads=False):
+        super().__init__()
+        self.upload_delay = upload_delay
+        self.fail_uploads = fail_uploads
+        self.uploads = 0
+        self.deletes = 0
+
+    def create_context_cache(self, model_name, system_prompt, prefix, ttl):
+        with self._lock:
+            self.uploads += 1
+        time.sleep(self.upload_delay)
+        if self.fail_uploads:
+            raise RuntimeError("caching is not supported for this model")
+        return super().create_context_cache(model_name, system_prompt, prefix, ttl)
+
+    def delete_context_cache(self, handle):
+        with self._lock:
+            self.deletes += 1
+        super().delete_context_cache(handle)
+
+
+def split(manager, n, stage_name="1_translate", system_prompt=SYSTEM):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return manager.split(stage_name, system_prompt, prompt(n), PLAYBOOK)
+
+
+class ContextCacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = CountingStub()
+        self.manager = ContextCacheManager(self.backend, "gemini-2.5-flash", min_tokens=1)
+
+    def test_stable_prefix_is_cached_from_the_second_call(self):
+        self.assertEqual(split(self.manager, 1), (None, prompt(1)))
+        handle, suffix = split(self.manager, 2)
+        self.assertIsNotNone(handle)
+        self.assertEqual(suffix, "poem 2\n")
+        handle3, suffix3 = split(self.manager, 3)
+        self.assertIs(handle3, handle)
+        self.assertEqual(suffix3, "poem 3\n")
+        self.assertEqual((self.backend.uploads, self.manager.created, self.manager.hits), (1, 1, 2))
+
+    def test_cached_call_answers_like_the_full_prompt(self):
+        split(self.manager, 1)
+        handle, suffix = split(self.manager, 2)
+        cached = self.backend.generate_cached("m", handle, suffix, 0.1)
+        self.assertEqual(cached.text, self.backend.generate("m", SYSTEM, prompt(2), 0.1).text)
+
+    def test_small_prefixes_are_not_cached(self):
+        manager = ContextCacheManager(self.backend, "gemini-2.5-flash")
+        split(manager, 1)
+        self.assertEqual(split(manager, 2), (None, prompt(2)))
+        self.assertEqual(self.backend.uploads, 0)
+
+    def test_concurrent_callers_upload_once(self):
+        self.backend.upload_delay = 0.1
+        split(self.manager, 1)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda n: split(self.manager, n), range(2, 7)))
+        self.assertEqual(self.backend.uploads, 1)
+        self.assertEqual(len({handle for handle, _ in results}), 1)
+        self.assertEqual([suffix for _, suffix in results], [f"poem {n}\n" for n in range(2, 7)])
+
+    def test_other_prefixes_are_not_held_up_by_an_upload(self):
+        self.backend.upload_delay = 0.2
+        stages = (("1_translate", SYSTEM), ("2_critique", "You are a critic."))
+        for stage_name, system_prompt in stages:
+            split(self.manager, 1, stage_name, system_prompt)
+        start = time.monotonic()
+        threads = [threading.Thread(target=split, args=(self.manager, 2, stage_name, system_prompt))
+                   for stage_name, system_prompt in stages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Two 0.2s uploads side by side, not one after the other
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertEqual(self.backend.uploads, 2)
+
+    def test_playbook_change_deletes_dependent_prefixes(self):
+        split(self.manager, 1)
+        split(self.manager, 2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.manager.invalidate_playbook()
+        self.assertEqual((self.manager.deleted, self.backend.deletes), (1, 1))
+        split(self.manager, 3)
+        self.assertEqual(self.backend.uploads, 2)
+
+    def test_expired_prefix_is_uploaded_again(self):
+        manager = ContextCacheManager(self.backend, "gemini-2.5-flash", ttl=0.05, min_tokens=1)
+        split(manager, 1)
+        split(manager, 2)
+        time.sleep(0.06)
+        handle, _ = split(manager, 3)
+        self.assertEqual(self.backend.uploads, 2)
+        self.backend.generate_cached("m", handle, "poem 3\n", 0.1)
+
+    def test_disabled_after_repeated_errors(self):
+        self.backend.fail_uploads = True
+        split(self.manager, 0)
+        for n in range(1, MAX_ERRORS + 2):
+            self.assertEqual(split(self.manager, n), (None, prompt(n)))
+        self.assertFalse(self.manager.enabled)
+        self.assertEqual(self.backend.uploads, MAX_ERRORS)
+
+    def test_close_deletes_everything(self):
+        split(self.manager, 1)
+        split(self.manager, 2)
+        split(self.manager, 1, "2_critique", "You are a critic.")
+        split(self.manager, 2, "2_critique", "You are a critic.")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.manager.close()
+        self.assertEqual(self.backend.deletes, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
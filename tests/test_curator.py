@@ -0,0 +1,97 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_curator import CuratorEngine, critique_score, route_patterns, section_key  # noqa: E402
+
+
+def curate(engine, playbook, patterns, section="process_strategies"):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return engine.curate(playbook, {"learned_patterns": patterns}, section)
+
+
+class CurateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = CuratorEngine()
+        self.playbook = {"process_strategies": ["Keep imagery concrete and verbs active in every line."]}
+
+    def test_near_duplicate_is_rejected(self):
+        curate(self.engine, self.playbook, ["Always keep imagery concrete and verbs active in every line."])
+        self.assertEqual(self.playbook["process_strategies"],
+                         ["Keep imagery concrete and verbs active in every line."])
+        stats = self.engine.state["strategies"]["Keep imagery concrete and verbs active in every line."]
+        self.assertEqual(stats["support"], 2)
+
+    def test_similar_strategy_is_merged_into_the_longer_wording(self):
+        longer = "Keep imagery concrete and verbs active in every single line."
+        curate(self.engine, self.playbook, [longer])
+        self.assertEqual(self.playbook["process_strategies"], [longer])
+        self.assertEqual(self.engine.state["strategies"][longer]["support"], 2)
+        self.assertEqual(set(self.engine.state["strategies"]), {longer})
+
+    def test_unrelated_strategy_is_added(self):
+        curate(self.engine, self.playbook, ["Preserve the original rhyme scheme where possible.", "", 3])
+        self.assertEqual(len(self.playbook["process_strategies"]), 2)
+
+    def test_lowest_utility_is_evicted(self):
+        engine = CuratorEngine(max_strategies=2)
+        playbook = {"process_strategies": []}
+        curate(engine, playbook, ["Use seasonal imagery.", "Translate idioms literally."])
+        # Only the first strategy precedes a critique improvement
+        engine.credit(playbook, playbook, {"2_critique_data": {"score": 5}})
+        engine.credit(playbook, {"process_strategies": ["Use seasonal imagery."]}, {"2_critique_data": {"score": 9}})
+        engine.credit(playbook, {"process_strategies": ["Translate idioms literally."]},
+                      {"2_critique_data": {"score": 2}})
+        curate(engine, playbook, ["Mirror the line count of the original poem."])
+        self.assertEqual(playbook["process_strategies"],
+                         ["Use seasonal imagery.", "Mirror the line count of the original poem."])
+        self.assertNotIn("Translate idioms literally.", engine.state["strategies"])
+
+    def test_new_strategies_are_not_evicted_first(self):
+        engine = CuratorEngine(max_strategies=1)
+        playbook = {"process_strategies": ["Use seasonal imagery."]}
+        curate(engine, playbook, ["Mirror the line count of the original poem."])
+        self.assertEqual(playbook["process_strategies"], ["Mirror the line count of the original poem."])
+
+
+class CreditTest(unittest.TestCase):
+
+    def test_baseline_tracks_scores(self):
+        engine = CuratorEngine(baseline_decay=0.5)
+        playbook = {"process_strategies": ["Use seasonal imagery."]}
+        self.assertEqual(engine.credit(playbook, playbook, {"2_critique_data": {"score": 4}}), 0.0)
+        self.assertEqual(engine.credit(playbook, playbook, {"2_critique_data": {"score": 8}}), 4.0)
+        self.assertEqual(engine.state["baseline"], 6.0)
+        self.assertEqual(engine.state["strategies"]["Use seasonal imagery."]["uses"], 2)
+        self.assertIsNone(engine.credit(playbook, playbook, {"1_translate_data": {}}))
+
+    def test_critique_score(self):
+        self.assertEqual(critique_score({"2_critique_data": {"score": 7}}), 7.0)
+        self.assertEqual(critique_score({"2_critique_data": {"strengths": ["a"], "weaknesses": ["b", "c", "d"]}}), -0.5)
+        self.assertIsNone(critique_score({"2_critique_data": {"score": True}}))
+
+
+class RoutingTest(unittest.TestCase):
+
+    def test_section_key(self):
+        self.assertEqual(section_key("Creative Writing"), "creative_writing_strategies")
+        self.assertEqual(section_key("critique_strategies"), "critique_strategies")
+        for general in (None, "", "all", "process"):
+            self.assertEqual(section_key(general), "process_strategies")
+
+    def test_route_patterns(self):
+        self.assertEqual(route_patterns({"learned_patterns": ["a", {"section": "critique", "pattern": "b"}, " "]}),
+                         {"process_strategies": ["a"], "critique_strategies": ["b"]})
+        self.assertEqual(route_patterns({"learned_patterns": ["a"], "target_section": "translation"}),
+                         {"translation_strategies": ["a"]})
+        self.assertEqual(route_patterns({"learned_patterns": {"critique": ["b", "c"], "general": "d"}}),
+                         {"critique_strategies": ["b", "c"], "process_strategies": ["d"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_history import (  # noqa: E402
+    JsonlHistoryStore, LazyHistory, blobs_path, load_history_records, read_blobs, read_latest_state,
+)
+
+
+def make_run(n):
+    return {"pipeline_id": f"run{n}", "playbook_snapshot": {"process_strategies": [f"strategy {n}"]}}
+
+
+class TruncatedTailTest(unittest.TestCase):
+    """A history whose last append was interrupted mid-line."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "history.jsonl")
+        store = JsonlHistoryStore(self.path)
+        store.append([make_run(0), make_run(1)])
+        store.close()
+        with open(self.path, "ab") as f:
+            f.write(b'{"pipeline_id": "run2", "playbook_snap')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_state_comes_from_last_complete_run(self):
+        runs, playbook = read_latest_state(self.path)
+        self.assertEqual(runs, 2)
+        self.assertEqual(playbook, {"process_strategies": ["strategy 1"]})
+        history = LazyHistory(self.path)
+        self.assertEqual([run["pipeline_id"] for run in history], ["run0", "run1"])
+        self.assertEqual(history[-1]["pipeline_id"], "run1")
+
+    def test_append_drops_partial_line(self):
+        store = JsonlHistoryStore(self.path)
+        store.append([make_run(3)])
+        store.close()
+        ids = ["run0", "run1", "run3"]
+        self.assertEqual([run["pipeline_id"] for run in load_history_records(self.path)], ids)
+        self.assertEqual([run["pipeline_id"] for run in LazyHistory(self.path)], ids)
+        self.assertEqual(read_latest_state(self.path), (3, {"process_strategies": ["strategy 3"]}))
+
+
+def make_full_run(n, prompt="You are a storyteller."):
+    data = {"story": f"story {n}", "notes": ["é", n]}
+    return {
+        "pipeline_id": f"run{n}",
+        "input": f"input {n} " * 50,
+        "1_create_system_prompt": prompt,
+        "1_create_json": json.dumps(data, indent=4, ensure_ascii=False),
+        "1_create_data": data,
+        "2_reflect_json": '```json\n{"learned_patterns": []}\n```',
+        "2_reflect_data": {"learned_patterns": []},
+        "playbook_snapshot": {"process_strategies": [f"strategy {n}"]},
+    }
+
+
+class CompactHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "history.jsonl")
+        self.runs = [make_full_run(n) for n in range(4)]
+        store = JsonlHistoryStore(self.path, compact=True)
+        store.append(self.runs[:2])
+        store.append(self.runs[2:])
+        store.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_is_exact(self):
+        self.assertEqual(load_history_records(self.path), self.runs)
+        self.assertEqual(list(LazyHistory(self.path)), self.runs)
+
+    def test_only_repeated_values_are_interned(self):
+        self.assertEqual(list(read_blobs(self.path).values()), ["You are a storyteller."])
+        with open(self.path, "r", encoding="utf-8") as f:
+            first = json.loads(f.readline())
+        # The raw text matching the data is rebuilt; the fenced one is kept
+        self.assertEqual(first["_derived"], {"1_create_json": 4})
+        self.assertEqual(first["1_create_system_prompt"], "You are a storyteller.")
+
+    def test_lazy_history_reads_blobs_on_demand(self):
+        history = LazyHistory(self.path)
+        self.assertEqual(history[3], self.runs[3])
+        self.assertLessEqual(len(history._blobs._cache), 1)
+
+    def test_partial_blob_line_is_dropped_before_appending(self):
+        with open(blobs_path(self.path), "ab") as f:
+            f.write(b'{"hash": "abc", "val')
+        more = [make_full_run(n, prompt="A new prompt.") for n in (4, 5)]
+        store = JsonlHistoryStore(self.path, compact=True)
+        store.append(more)
+        store.close()
+        self.assertEqual(load_history_records(self.path), self.runs + more)
+
+
+if __name__ == "__main__":
+    unittest.main()
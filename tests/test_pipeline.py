@@ -0,0 +1,256 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ace_backends import StubBackend  # noqa: E402
+from ace_batch import LocalBatchServer  # noqa: E402
+from ace_context_cache import ContextCacheManager  # noqa: E402
+from ace_convergence import ConvergenceMonitor  # noqa: E402
+from ace_ratelimit import RetryPolicy  # noqa: E402
+from ace_scheduler import GenerationScheduler  # noqa: E402
+from ace_util import AcePipeline  # noqa: E402
+
+with open(os.path.join(ROOT, "tang_poet.json"), "r", encoding="utf-8") as f:
+    CONFIG = json.load(f)
+STAGES = CONFIG["STAGES"]
+
+
+def make_jobs(count):
+    jobs = []
+    for n in range(count):
+        job = json.loads(json.dumps(CONFIG["JOBS"][n % len(CONFIG["JOBS"])]))
+        job["id"] = f"{job['id']}-{n}"
+        job["inputs"]["title_cn"] = f"{job['inputs']['title_cn']} {n}"
+        jobs.append(job)
+    return jobs
+
+
+def make_pipeline(backend=None, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return AcePipeline(backend=backend or StubBackend(), retry_policy=RetryPolicy(base_delay=0.0), **kwargs)
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def content(runs):
+    """What a run learned and produced, without its timings."""
+    keep = ("pipeline_id", "playbook_snapshot", "playbook_snapshot_version", "curator_state", "inference_only")
+    return [{key: value for key, value in run.items() if key in keep or key.endswith("_data")} for run in runs]
+
+
+class FlakyStub(StubBackend):
+    """Fails the first `failures` calls of every prompt with a retryable error."""
+
+    def __init__(self, failures=1, error=ConnectionError, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.error = error
+        self.attempts = {}
+
+    def _fail(self, user_prompt):
+        with self._lock:
+            attempt = self.attempts[user_prompt] = self.attempts.get(user_prompt, 0) + 1
+        if attempt <= self.failures:
+            raise self.error(f"attempt {attempt} dropped")
+
+    def generate(self, model_name, system_prompt, user_prompt, temperature):
+        self._fail(user_prompt)
+        return super().generate(model_name, system_prompt, user_prompt, temperature)
+
+    async def agenerate(self, model_name, system_prompt, user_prompt, temperature):
+        self._fail(user_prompt)
+        return await super().agenerate(model_name, system_prompt, user_prompt, temperature)
+
+
+class RejectingCacheStub(StubBackend):
+    """Accepts cached contents but rejects every call that uses one."""
+
+    def generate_cached(self, model_name, handle, user_suffix, temperature):
+        raise LookupError(f"{handle} not found")
+
+
+class GenerationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = make_jobs(6)
+
+    def test_merge_does_not_depend_on_completion_order(self):
+        # Jitter makes later jobs of a generation finish first
+        jittery = make_pipeline(StubBackend(latency=0.0, jitter=0.02))
+        steady = make_pipeline()
+        jittery_runs = quiet(jittery.process_jobs, self.jobs, STAGES, workers=3)
+        steady_runs = quiet(steady.process_jobs, self.jobs, STAGES, workers=3)
+        self.assertEqual([run["pipeline_id"] for run in jittery_runs], [job["id"] for job in self.jobs])
+        self.assertEqual(content(jittery_runs), content(steady_runs))
+        self.assertEqual(jittery.playbook, steady.playbook)
+        self.assertEqual(jittery.playbook_version, steady.playbook_version)
+
+    def test_generation_shares_a_frozen_playbook(self):
+        ace = make_pipeline()
+        runs = quiet(ace.process_jobs, self.jobs[:3], STAGES, workers=3)
+        prompts = {run["1_translate_system_prompt"] for run in runs}
+        self.assertEqual(len(prompts), 1)
+        self.assertTrue(ace.playbook["process_strategies"])
+
+    def test_sync_and_async_give_identical_playbooks(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                sync = make_pipeline()
+                sync_runs = quiet(sync.process_jobs, self.jobs, STAGES, workers=workers)
+                asynchronous = make_pipeline()
+                async_runs = quiet(asyncio.run, asynchronous.aprocess_jobs(self.jobs, STAGES, concurrency=workers))
+                self.assertEqual(content(async_runs), content(sync_runs))
+                self.assertEqual(asynchronous.playbook, sync.playbook)
+                self.assertEqual(asynchronous.playbook_version, sync.playbook_version)
+                self.assertEqual(asynchronous.curator_engine.state, sync.curator_engine.state)
+
+    def test_adaptive_generations_cover_every_job(self):
+        ace = make_pipeline()
+        scheduler = GenerationScheduler(max_size=4)
+        runs = quiet(ace.process_jobs, self.jobs, STAGES, workers=4, scheduler=scheduler)
+        self.assertEqual([run["pipeline_id"] for run in runs], [job["id"] for job in self.jobs])
+        self.assertEqual(sum(scheduler.sizes), len(self.jobs))
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = make_jobs(3)
+        stable = make_pipeline()
+        self.expected = content(quiet(stable.process_jobs, self.jobs, STAGES))
+        self.expected_playbook = stable.playbook
+
+    def test_flaky_backend_is_retried(self):
+        ace = make_pipeline(FlakyStub(failures=2))
+        runs = quiet(ace.process_jobs, self.jobs, STAGES)
+        self.assertEqual(content(runs), self.expected)
+        self.assertEqual(ace.playbook, self.expected_playbook)
+        for run in runs:
+            self.assertEqual({stats.get("retries") for stats in run["stage_metrics"].values()}, {2})
+
+    def test_async_flaky_backend_is_retried(self):
+        ace = make_pipeline(FlakyStub(failures=2))
+        runs = quiet(asyncio.run, ace.aprocess_jobs(self.jobs, STAGES))
+        self.assertEqual(content(runs), self.expected)
+
+    def test_call_fails_after_max_attempts(self):
+        ace = make_pipeline(FlakyStub(failures=5))
+        ace.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+        runs = quiet(ace.process_jobs, self.jobs[:1], STAGES)
+        self.assertNotIn("playbook_snapshot", runs[0])
+        self.assertTrue(runs[0]["stage_metrics"]["1_translate"]["error"])
+        # The first stage failed for good, so nothing else was called
+        self.assertEqual(list(ace.backend.attempts.values()), [3])
+        self.assertEqual(ace.playbook_version, make_pipeline().playbook_version)
+
+    def test_non_retryable_error_is_not_retried(self):
+        ace = make_pipeline(FlakyStub(failures=1, error=ValueError))
+        runs = quiet(ace.process_jobs, self.jobs[:1], STAGES)
+        self.assertNotIn("playbook_snapshot", runs[0])
+        self.assertEqual(list(ace.backend.attempts.values()), [1])
+
+    def test_rejected_cached_prefix_falls_back_to_full_prompt(self):
+        ace = make_pipeline(RejectingCacheStub())
+        ace.context_cache = ContextCacheManager(ace.backend, ace.model_name, min_tokens=1)
+        runs = quiet(ace.process_jobs, self.jobs, STAGES)
+        self.assertEqual(content(runs), self.expected)
+        self.assertGreater(ace.context_cache.created, 0)
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_waves_run_in_lockstep(self):
+        jobs = make_jobs(4)
+        ace = make_pipeline()
+        client = LocalBatchServer(ace.backend, self.directory)
+        submitted = []
+        submit = client.submit
+        client.submit = lambda model_name, path: submitted.append(path) or submit(model_name, path)
+        runs = quiet(ace.process_jobs_batch, jobs, STAGES, client, batch_dir=self.directory, poll_interval=0.0)
+
+        # One batch per stage wave, each holding that stage for every job
+        self.assertEqual(len(submitted), len(STAGES))
+        for path in submitted:
+            with open(path, "r", encoding="utf-8") as f:
+                self.assertEqual(sum(1 for _ in f), len(jobs))
+
+        # Same frozen-playbook generation as interactive calls with every job at once
+        interactive = make_pipeline()
+        expected = quiet(interactive.process_jobs, jobs, STAGES, workers=len(jobs))
+        self.assertEqual(content(runs), content(expected))
+        self.assertEqual(ace.playbook, interactive.playbook)
+
+
+class EarlyStopTest(unittest.TestCase):
+
+    def test_converged_playbook_runs_first_stage_only(self):
+        jobs = make_jobs(8)
+        ace = make_pipeline()
+        monitor = ConvergenceMonitor(window=2, max_churn=10)
+        runs = quiet(ace.process_jobs, jobs, STAGES, monitor=monitor)
+        self.assertEqual(monitor.converged_after, 2)
+        self.assertEqual(monitor.skipped, 6)
+        for run in runs[2:]:
+            self.assertTrue(run["inference_only"])
+            self.assertIn("1_translate_data", run)
+            self.assertNotIn("2_critique_data", run)
+
+    def test_monitor_waits_for_churn_to_drop(self):
+        monitor = ConvergenceMonitor(window=4, max_churn=0.5)
+        for churn in (2, 1, 0, 0, 0, 0):
+            quiet(monitor.observe, {"playbook_churn": churn})
+        # Churn over the last 4 jobs: 3/4, then 1/4
+        self.assertEqual(monitor.converged_after, 5)
+
+    def test_improving_scores_block_convergence(self):
+        monitor = ConvergenceMonitor(window=4, max_churn=1)
+        for score in (1, 2, 3, 4):
+            quiet(monitor.observe, {"playbook_churn": 0, "2_critique_data": {"score": score}})
+        self.assertFalse(monitor.converged)
+        for score in (4, 4, 4, 4):
+            quiet(monitor.observe, {"playbook_churn": 0, "2_critique_data": {"score": score}})
+        self.assertTrue(monitor.converged)
+
+    def test_failed_jobs_are_ignored(self):
+        monitor = ConvergenceMonitor(window=2)
+        for _ in range(4):
+            monitor.observe({"1_translate_data": {}})
+        self.assertEqual(monitor.observed, 0)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_sizes_follow_churn(self):
+        scheduler = GenerationScheduler(max_size=8, smoothing=1.0)
+        self.assertEqual(scheduler.next_size(), 1)
+        scheduler.observe([0])
+        self.assertEqual(scheduler.next_size(), 2)
+        scheduler.observe([0, 0])
+        self.assertEqual(scheduler.next_size(), 3)
+        scheduler.observe([2, 1, 3])
+        self.assertEqual(scheduler.next_size(), 1)
+        for _ in range(10):
+            scheduler.observe([0])
+        self.assertEqual(scheduler.next_size(), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ace_backends import StubBackend  # noqa: E402
+from ace_ratelimit import RetryPolicy  # noqa: E402
+from ace_server import AceService, Coalescer, InferBatcher, make_server  # noqa: E402
+from ace_util import AcePipeline  # noqa: E402
+
+with open(os.path.join(ROOT, "tang_poet.json"), "r", encoding="utf-8") as f:
+    CONFIG = json.load(f)
+STAGES = CONFIG["STAGES"]
+INPUTS = CONFIG["JOBS"][0]["inputs"]
+
+
+def make_pipeline():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return AcePipeline(backend=StubBackend(), retry_policy=RetryPolicy(base_delay=0.0))
+
+
+def infer_job(n):
+    return {"id": f"job-{n}", "inputs": dict(INPUTS, title_cn=f"{INPUTS['title_cn']} {n}")}
+
+
+class CoalescerTest(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_execution(self):
+        coalescer = Coalescer()
+        calls = []
+        started = threading.Event()
+
+        def execute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return {"answer": 42}
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            first = pool.submit(coalescer.run, "key", execute)
+            started.wait()
+            others = [pool.submit(coalescer.run, "key", execute) for _ in range(3)]
+            results = [first.result()] + [future.result() for future in others]
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(coalescer.coalesced, 3)
+        self.assertEqual(results, [{"answer": 42}] * 4)
+
+    def test_errors_reach_every_caller_and_are_not_kept(self):
+        coalescer = Coalescer()
+
+        def fail():
+            raise RuntimeError("backend down")
+
+        with self.assertRaises(RuntimeError):
+            coalescer.run("key", fail)
+        # Finished executions are not reused
+        self.assertEqual(coalescer.run("key", lambda: "ok"), "ok")
+        self.assertEqual(coalescer.coalesced, 0)
+
+
+class InferBatcherTest(unittest.TestCase):
+
+    def test_concurrent_jobs_share_a_batch(self):
+        batcher = InferBatcher(make_pipeline(), STAGES, workers=4, window=0.2)
+        jobs = [infer_job(n) for n in range(4)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(batcher.submit, jobs))
+        self.assertEqual((batcher.batches, batcher.batched_jobs), (1, 4))
+        self.assertEqual([result["id"] for result in results], [job["id"] for job in jobs])
+        for result in results:
+            self.assertEqual(result["status"], "ok")
+            self.assertIn("gemini_translation", result["output"])
+
+    def test_max_batch_splits_batches(self):
+        batcher = InferBatcher(make_pipeline(), STAGES, workers=4, window=0.2, max_batch=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(batcher.submit, [infer_job(n) for n in range(4)]))
+        self.assertEqual((batcher.batches, batcher.batched_jobs), (2, 4))
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = AceService(make_pipeline(), STAGES, history_file=None, workers=2)
+        self.server = make_server(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.connection = http.client.HTTPConnection(*self.server.server_address, timeout=10)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.connection.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            return response.status, json.loads(response.read())
+
+    def test_infer_and_health(self):
+        status, result = self.request("POST", "/infer", {"id": "q1", "inputs": INPUTS})
+        self.assertEqual(status, 200)
+        self.assertEqual((result["id"], result["status"]), ("q1", "ok"))
+        status, health = self.request("GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual((health["requests"], health["infer_batches"]), (1, 1))
+
+    def test_bad_requests(self):
+        status, result = self.request("POST", "/infer", {"inputs": "not an object"})
+        self.assertEqual(status, 400)
+        self.assertIn("inputs", result["error"])
+        status, _ = self.request("POST", "/nowhere", {})
+        self.assertEqual(status, 404)
+        self.assertEqual(self.service.requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
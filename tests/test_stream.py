@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_backends import LLMResponse  # noqa: E402
+from ace_stream import JsonEnvelope, StreamSink, stream_path  # noqa: E402
+
+
+def feed(*chunks):
+    envelope = JsonEnvelope()
+    for chunk in chunks:
+        envelope.feed(chunk)
+    return envelope
+
+
+class JsonEnvelopeTest(unittest.TestCase):
+
+    def test_complete_document_across_chunks(self):
+        # A bracket inside a string, and an escaped quote split across chunks
+        chunks = (' {"a": [1, {"b": "}]"', '}], "c": "\\', '""}\n')
+        self.assertEqual(json.loads("".join(chunks)), {"a": [1, {"b": "}]"}], "c": '"'})
+        envelope = feed(*chunks)
+        self.assertTrue(envelope.complete)
+
+    def test_incomplete_document(self):
+        envelope = feed('{"a": [1, 2')
+        self.assertTrue(envelope.started)
+        self.assertFalse(envelope.complete)
+
+    def test_invalid_documents_fail_early(self):
+        for chunks in (("Here is the JSON: {",), ('{"a": 1]',), ('{"a": 1}', ' {"b": 2}'), ("]",)):
+            with self.subTest(chunks=chunks):
+                with self.assertRaises(ValueError):
+                    feed(*chunks)
+
+
+class StreamSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = stream_path(self.directory, "job1.1_create_story")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_complete_stream_is_renamed(self):
+        chunks = []
+        sink = StreamSink("1_create_story", path=self.path,
+                          callback=lambda stage, chunk, chars: chunks.append((stage, chunk, chars)))
+        for text in ('{"story": ', '"Once"}'):
+            sink.feed(LLMResponse(text))
+        self.assertEqual(sink.finish().text, '{"story": "Once"}')
+        self.assertEqual(self.read("job1.1_create_story.json"), '{"story": "Once"}')
+        self.assertEqual(chunks, [("1_create_story", '{"story": ', 10), ("1_create_story", '"Once"}', 17)])
+
+    def test_retries_keep_every_dropped_attempt(self):
+        for text in ('{"story": "first', '{"story": "second'):
+            sink = StreamSink("1_create_story", path=self.path)
+            sink.feed(LLMResponse(text))
+            with self.assertRaises(ConnectionError):
+                sink.finish()
+        sink = StreamSink("1_create_story", path=self.path)
+        sink.feed(LLMResponse('{"story": "third"}'))
+        sink.finish()
+        self.assertEqual(self.read("job1.1_create_story.partial.1.json"), '{"story": "first')
+        self.assertEqual(self.read("job1.1_create_story.partial.2.json"), '{"story": "second')
+        self.assertEqual(self.read("job1.1_create_story.json"), '{"story": "third"}')
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "job1.1_create_story.partial.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ace_templates import compile_template, stage_dependencies, stage_waves, validate_stages  # noqa: E402
+
+
+def stage(template, **extra):
+    return dict({"system_prompt": "system", "user_prompt_template": template}, **extra)
+
+
+STAGES = {
+    "1_create": stage("{playbook}\nWrite about {topic}.\nJSON FORMAT:\n{{\"text\": \"...\"}}"),
+    "2_critique": stage("Critique {1_create_json} against {ground_truth_json}."),
+    "2_score": stage("Score {1_create_data[text]}."),
+    "3_reflect": stage("Reflect on {2_critique_json} and {2_score_json}."),
+}
+JOBS = [{"id": "a", "inputs": {"topic": "rain"}}, {"id": "b", "inputs": {"topic": "snow"}}]
+
+
+class CompiledTemplateTest(unittest.TestCase):
+
+    def test_render_matches_format_map(self):
+        context = {"name": "Li Bai", "n": 3, "data": {"score": 7}, "items": ["x", "y"], "ratio": 0.5}
+        for template in (
+            "plain text",
+            "{name} wrote {n} poems",
+            "{{\"literal\": \"{name}\"}}",
+            "{data[score]} / {items[1]} / {ratio:.2f} / {name!r} / {n:>4}",
+        ):
+            with self.subTest(template=template):
+                self.assertEqual(compile_template(template).render(context), template.format_map(context))
+
+    def test_required_keys(self):
+        compiled = compile_template("{a} {b[c]} {d.e} {f:{width}}")
+        self.assertEqual(compiled.required_keys, {"a", "b", "d", "f", "width"})
+
+    def test_missing_key_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            compile_template("{missing}").render({})
+
+    def test_malformed_template(self):
+        compiled = compile_template("{\"json\": 1}")
+        self.assertIsNone(compiled.error)
+        self.assertIsNotNone(compile_template("unclosed {").error)
+        with self.assertRaises(ValueError):
+            compile_template("unclosed {").render({})
+
+
+class StageWavesTest(unittest.TestCase):
+
+    def test_dependencies_come_from_templates(self):
+        self.assertEqual(stage_dependencies(STAGES), {
+            "1_create": [],
+            "2_critique": ["1_create"],
+            "2_score": ["1_create"],
+            "3_reflect": ["2_critique", "2_score"],
+        })
+
+    def test_independent_stages_share_a_wave(self):
+        self.assertEqual(stage_waves(STAGES), [["1_create"], ["2_critique", "2_score"], ["3_reflect"]])
+
+    def test_explicit_depends_on(self):
+        stages = dict(STAGES, **{"2_score": stage("Score it.", depends_on=["2_critique"])})
+        self.assertEqual(stage_waves(stages), [["1_create"], ["2_critique"], ["2_score"], ["3_reflect"]])
+
+    def test_cycle_is_rejected(self):
+        stages = {"a": stage("{b_json}"), "b": stage("{a_json}")}
+        with self.assertRaises(ValueError):
+            stage_waves(stages)
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            stage_dependencies({"a": stage("x", depends_on=["nope"])})
+
+
+class ValidateStagesTest(unittest.TestCase):
+
+    def test_valid_config(self):
+        self.assertEqual(validate_stages(STAGES, JOBS), [])
+
+    def test_problems_are_reported(self):
+        stages = {
+            "1_create": stage("{topic} {tpoic} {1_create_json} {0}"),
+            "2_json": stage("JSON FORMAT:\n{\"text\": \"...\"}"),
+            "3_broken": stage("unclosed {"),
+            "4_no_system": {"user_prompt_template": "{topic}"},
+        }
+        errors = validate_stages(stages, JOBS + [{"id": "c", "inputs": {}}])
+        self.assertIn("Stage '1_create': unknown key '{tpoic}'", errors)
+        self.assertIn("Stage '1_create': uses its own output '{1_create_json}'", errors)
+        self.assertIn("Stage '1_create': positional field '{0}' (fields must be named)", errors)
+        self.assertIn("Stage '1_create': input 'topic' missing from job(s) c", errors)
+        self.assertTrue(any("braces doubled" in error for error in errors if error.startswith("Stage '2_json'")))
+        self.assertTrue(any(error.startswith("Stage '3_broken': malformed template") for error in errors))
+        self.assertIn("Stage '4_no_system': no system_prompt", errors)
+
+    def test_inputs_are_not_checked_without_jobs(self):
+        self.assertEqual(validate_stages({"1_create": stage("{anything}")}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()